@@ -0,0 +1,317 @@
+# benchmarks/bench_pipeline.py
+"""
+Reproducible performance benchmarks for the AgriTriFusion pipeline.
+
+    python -m benchmarks.bench_pipeline --out bench_results.json
+    python -m benchmarks.bench_pipeline --compare benchmarks/baseline.json
+
+Every case runs in its own subprocess, so cold start (imports + model
+loading + first call) and peak RSS are measured per stage, not for the
+whole run. Metric names end in _ms / _mb (lower is better) or _per_s
+(higher is better); --compare fails (exit code 1) when any metric is
+worse than the baseline by more than --tolerance (latencies also need
+to be at least NOISE_FLOOR_MS slower; p95 values are reported only).
+Throughputs are best-of-N runs to damp noise from other processes.
+benchmarks/baseline.json was recorded on a 1-thread CPU sandbox;
+re-record it on the deploy hardware.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_IMAGE = os.path.join(ROOT, "assets", "sample_tomato.jpg")
+
+# (name, width, height) of the synthetic test images
+RESOLUTIONS = [("vga", 640, 480), ("hd", 1920, 1080), ("12mp", 4000, 3000)]
+
+CASES = ["stage_detection", "harvest_features", "fertilizer", "yield"]
+
+
+# --------------------------------------------------
+# Helpers
+# --------------------------------------------------
+
+def synthetic_image(width, height, seed=0):
+    """
+    Deterministic RGB uint8 image: colour gradient + noise, so JPEG /
+    colour conversions do real work.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    channels = np.broadcast_arrays(200 * x + 40 * y, 120 * y + 30, 80 * (1 - x) + 20)
+    base = np.stack(channels, axis=-1)
+    noise = rng.normal(0, 12, (height, width, 3)).astype(np.float32)
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def _timings(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+    }
+
+
+def _best_rate(fn, items, runs):
+    """
+    items / second of the fastest of `runs` calls of fn().
+    """
+    best = float("inf")
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return round(items / best, 2)
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# --------------------------------------------------
+# Cases (each runs in a fresh interpreter)
+# --------------------------------------------------
+
+def bench_stage_detection(repeat):
+    start = time.perf_counter()
+    import torch
+    from modules.stage_detection import abhi_predict
+    from utils.preprocess import decode_image
+
+    random_weights = not os.path.isfile(abhi_predict.MODEL_PATH)
+    if random_weights:
+        # Same architecture and cost, the trained checkpoint is not in the repo
+        torch.manual_seed(0)
+        abhi_predict.use_model(abhi_predict.MultiOutputModel().eval())
+    sample = decode_image(SAMPLE_IMAGE)
+    abhi_predict.predict_image(sample)
+    results = {"cold_start_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    for name, w, h in RESOLUTIONS:
+        image = synthetic_image(w, h)
+        for key, value in _timings(lambda: abhi_predict.predict_image(image), repeat).items():
+            results[f"single_{name}_{key}"] = value
+
+    images = [synthetic_image(640, 480, seed=i) for i in range(32)]
+    for batch_size in (1, 8, 32):
+        results[f"batch{batch_size}_images_per_s"] = _best_rate(
+            lambda: list(abhi_predict.predict_images(images, batch_size=batch_size)),
+            len(images), 3,
+        )
+
+    return results, {"random_weights": random_weights, "torch_threads": torch.get_num_threads()}
+
+
+def bench_harvest_features(repeat):
+    start = time.perf_counter()
+    from modules.harvest_prediction.harvest_predictor import HarvestPredictor, extract_visual_features
+
+    extract_visual_features(SAMPLE_IMAGE)
+    results = {"cold_start_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    for name, w, h in RESOLUTIONS:
+        image = synthetic_image(w, h)
+        for key, value in _timings(lambda: extract_visual_features(image), repeat).items():
+            results[f"single_{name}_{key}"] = value
+        for key, value in _timings(lambda: extract_visual_features(image, max_side=1024), repeat).items():
+            results[f"single_{name}_max1024_{key}"] = value
+
+    predictor = HarvestPredictor()
+    features = [extract_visual_features(synthetic_image(320, 240, seed=i)) for i in range(256)]
+    crops, stages = ["tomato"] * len(features), ["semiripe"] * len(features)
+    results["predict_batch_per_s"] = _best_rate(
+        lambda: predictor.predict_from_features(features, crops, stages), len(features), repeat
+    )
+
+    return results, {}
+
+
+def bench_fertilizer(repeat):
+    start = time.perf_counter()
+    import numpy as np
+    import pandas as pd
+    from modules.fertilizer_reco.fert_reco import recommend_fertilizer, recommend_fertilizer_batch
+
+    recommend_fertilizer("tomato", "semiripe", 4.0, 2.0, 3.0)
+    results = {"cold_start_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    results.update({
+        f"single_{k}": v for k, v in
+        _timings(lambda: recommend_fertilizer("tomato", "semiripe", 4.0, 2.0, 3.0), repeat).items()
+    })
+
+    rng = np.random.default_rng(0)
+    n = 2000
+    frame = pd.DataFrame({
+        "crop": rng.choice(["tomato", "banana", "mango", "papaya"], n),
+        "stage": rng.choice(["unripe", "semiripe", "ripe"], n),
+        "N_mgkg": rng.uniform(0, 60, n),
+        "P_mgkg": rng.uniform(0, 60, n),
+        "K_mgkg": rng.uniform(0, 60, n),
+    })
+    results["batch_rows_per_s"] = _best_rate(lambda: recommend_fertilizer_batch(frame), n, 3)
+
+    return results, {}
+
+
+def bench_yield(repeat):
+    start = time.perf_counter()
+    from modules.yield_prediction.yield_estimator import estimate_yield
+
+    estimate_yield("tomato", 2.5, 4000, 6.5, "medium")
+    results = {"cold_start_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    n = 10000
+
+    def scalar_calls():
+        for i in range(n):
+            estimate_yield("tomato", 2.5, 4000 + i, 6.5, "medium")
+
+    results["scalar_calls_per_s"] = _best_rate(scalar_calls, n, 5)
+
+    import numpy as np
+    import pandas as pd
+    from modules.yield_prediction.yield_estimator import estimate_field_yield_frame, yield_scenario_grid
+
+    rng = np.random.default_rng(0)
+    n = 1_000_000
+    fields = pd.DataFrame({
+        "crop": pd.Categorical(rng.choice(["tomato", "banana", "mango", "papaya"], n)),
+        "area_acres": rng.uniform(0.5, 20, n),
+        "num_plants": rng.integers(100, 50000, n),
+        "soil_type": pd.Categorical(rng.choice(["Loamy", "Red", "Sandy"], n)),
+        "soil_ph": rng.uniform(4.5, 8.5, n),
+        "irrigation": pd.Categorical(rng.choice(["Drip", "Flood", "Rain-fed"], n)),
+    })
+    results["field_rows_per_s"] = _best_rate(lambda: estimate_field_yield_frame(fields), n, 3)
+
+    ph = list(np.arange(4.5, 8.6, 0.1))
+    density = list(range(1000, 20000, 100))
+    temps = list(range(10, 45))
+    grid_size = len(ph) * len(density) * len(temps) * 4
+    results["grid_scenarios_per_s"] = _best_rate(
+        lambda: yield_scenario_grid(
+            "tomato", 2.0, density, "Loamy", ph,
+            ["Drip", "Sprinkler", "Flood", "Rain-fed"], avg_temp=temps, as_frame=False,
+        ),
+        grid_size, 3,
+    )
+
+    return results, {}
+
+
+CASE_FUNCTIONS = {
+    "stage_detection": bench_stage_detection,
+    "harvest_features": bench_harvest_features,
+    "fertilizer": bench_fertilizer,
+    "yield": bench_yield,
+}
+
+
+def _run_case_in_child(case, repeat):
+    results, info = CASE_FUNCTIONS[case](repeat)
+    results["peak_rss_mb"] = _peak_rss_mb()
+    print(json.dumps({"metrics": results, "info": info}))
+
+
+# --------------------------------------------------
+# Runner / comparison
+# --------------------------------------------------
+
+def run_all(cases, repeat):
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "repeat": repeat,
+        "cases": {},
+    }
+    env = dict(os.environ, PYTHONWARNINGS="ignore")
+    for case in cases:
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_pipeline", "--case", case, "--repeat", str(repeat)],
+            cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"benchmark case {case} failed:\n{proc.stderr}")
+        report["cases"][case] = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{case}: done", file=sys.stderr)
+    return report
+
+
+# Timing differences below this are scheduler noise, not regressions
+NOISE_FLOOR_MS = 1.0
+# Tail latencies over a few repeats are too noisy to gate on, only reported
+UNGATED_SUFFIXES = ("_p95_ms",)
+
+
+def compare(current, baseline, tolerance):
+    """
+    Returns a list of regression messages (empty when all metrics are
+    within tolerance of the baseline).
+    """
+    regressions = []
+    for case, data in baseline.get("cases", {}).items():
+        now = current.get("cases", {}).get(case, {}).get("metrics", {})
+        for metric, old in data.get("metrics", {}).items():
+            new = now.get(metric)
+            if new is None or not old or metric.endswith(UNGATED_SUFFIXES):
+                continue
+            if metric.endswith("_per_s"):
+                change = (old - new) / old
+            else:
+                if metric.endswith("_ms") and new - old < NOISE_FLOOR_MS:
+                    continue
+                change = (new - old) / old
+            if change > tolerance:
+                regressions.append(f"{case}.{metric}: {old} -> {new} ({change:+.0%} worse)")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AgriTriFusion performance benchmarks")
+    parser.add_argument("--case", choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline results file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+
+    if args.case:
+        _run_case_in_child(args.case, args.repeat)
+        sys.exit(0)
+
+    report = run_all(args.cases, args.repeat)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%}")
@@ -1,8 +1,13 @@
 import os
+import json
 import joblib
 import numpy as np
 import pandas as pd
 
+from modules.fertilizer_reco.tree_eval import CompiledScorer
+from utils.cache import ResultCache
+from utils.logger import instrument
+
 # --------------------------------------------------
 # Paths
 # --------------------------------------------------
@@ -11,13 +16,54 @@ MODEL_DIR = os.path.join(BASE_DIR, "saved_models")
 
 _preprocessor = None
 _priority_models = None
+_compiled = None
+
+# Score with the flat array copy of the preprocessor + XGBoost models
+# (modules/fertilizer_reco/tree_eval.py, same outputs bit for bit).
+# False goes through sklearn / XGBoost as before.
+USE_COMPILED_MODELS = True
+
+# --------------------------------------------------
+# Default values (as agreed) for features not asked from the user
+# --------------------------------------------------
+DEFAULT_FEATURES = {
+    "temperature": 28.0,
+    "humidity": 65.0,
+    "soil_moisture": 40.0,
+    "irrigation_type": "drip",
+    "crop_age_days": 45,
+    "plant_spacing_cm": 45,
+    "yield_target_ton_acre": 20,
+    "soil_PH": 6.5,
+}
+
+DEFICIENCY_THRESHOLD = 0.35
+
+# kg/acre per unit of priority score
+PRIMARY_DOSE_FACTOR = 100
+SECONDARY_DOSE_FACTOR = 80
+
+# Same order as the priority models / priority_scores keys
+NUTRIENTS = ["Nitrogen (N)", "Phosphorus (P)", "Potassium (K)"]
+PRIORITY_MODEL_KEYS = ["N_priority", "P_priority", "K_priority"]
+
+FERTILIZER_MAP = {
+    "Nitrogen (N)": ("Urea (46% N)", "Nitrogenous"),
+    "Phosphorus (P)": ("DAP (Di-Ammonium Phosphate)", "Phosphatic"),
+    "Potassium (K)": ("MOP (Muriate of Potash)", "Potassic"),
+}
 
 
 # --------------------------------------------------
 # Load ML models (only once)
 # --------------------------------------------------
 def _load_models():
-    global _preprocessor, _priority_models
+    global _preprocessor, _priority_models, _compiled
+
+    # A compiled scorer installed with use_compiled_scorer (e.g. attached
+    # from shared memory) does not need the joblib files at all
+    if USE_COMPILED_MODELS and _compiled is not None:
+        return
 
     if _preprocessor is None:
         _preprocessor = joblib.load(
@@ -29,10 +75,30 @@ def _load_models():
             os.path.join(MODEL_DIR, "nutrient_priority_models.joblib")
         )
 
+    if _compiled is None and USE_COMPILED_MODELS:
+        _compiled = CompiledScorer.from_fitted(
+            _preprocessor, [_priority_models[key] for key in PRIORITY_MODEL_KEYS]
+        )
+
+
+def _dose(score, factor):
+    # shared by the single-row and batch paths so both round identically
+    return round(score * factor, 2)
+
+
+def use_compiled_scorer(scorer):
+    """
+    Installs a tree_eval.CompiledScorer built elsewhere (see
+    utils.shared_models), so this process never loads the joblib models.
+    """
+    global _compiled
+    _compiled = scorer
+
 
 # --------------------------------------------------
 # Main fertilizer recommendation function
 # --------------------------------------------------
+@instrument("fertilizer_scoring")
 def recommend_fertilizer(
     crop: str,
     stage: str,
@@ -51,33 +117,25 @@ def recommend_fertilizer(
     # -----------------------------
     # Default values (as agreed)
     # -----------------------------
-    input_data = pd.DataFrame([{
+    row = {
         "crop": crop,
         "stage": stage,
-        "temperature": 28.0,
-        "humidity": 65.0,
-        "soil_moisture": 40.0,
-        "irrigation_type": "drip",
-        "crop_age_days": 45,
-        "plant_spacing_cm": 45,
-        "yield_target_ton_acre": 20,
-        "soil_PH": 6.5,
+        **DEFAULT_FEATURES,
         "N_mgkg": N_mgkg,
         "P_mgkg": P_mgkg,
         "K_mgkg": K_mgkg,
-    }])
-
-    # -----------------------------
-    # Preprocess input
-    # -----------------------------
-    X = _preprocessor.transform(input_data)
+    }
 
     # -----------------------------
-    # Predict nutrient priorities
+    # Preprocess + predict nutrient priorities
     # -----------------------------
-    N_score = float(_priority_models["N_priority"].predict(X)[0])
-    P_score = float(_priority_models["P_priority"].predict(X)[0])
-    K_score = float(_priority_models["K_priority"].predict(X)[0])
+    if USE_COMPILED_MODELS:
+        N_score, P_score, K_score = _compiled.score_row(row).tolist()
+    else:
+        X = _preprocessor.transform(pd.DataFrame([row]))
+        N_score = float(_priority_models["N_priority"].predict(X)[0])
+        P_score = float(_priority_models["P_priority"].predict(X)[0])
+        K_score = float(_priority_models["K_priority"].predict(X)[0])
 
     priority_scores = {
         "Nitrogen (N)": N_score,
@@ -88,8 +146,6 @@ def recommend_fertilizer(
     # -----------------------------
     # Deficiency logic (IMPORTANT)
     # -----------------------------
-    DEFICIENCY_THRESHOLD = 0.35
-
     deficient = [
         nutrient for nutrient, score in priority_scores.items()
         if score > DEFICIENCY_THRESHOLD
@@ -101,17 +157,6 @@ def recommend_fertilizer(
         reverse=True
     )
 
-    # -----------------------------
-    # Fertilizer mapping
-    # -----------------------------
-    def fertilizer_map(nutrient):
-        if nutrient == "Nitrogen (N)":
-            return "Urea (46% N)", "Nitrogenous"
-        if nutrient == "Phosphorus (P)":
-            return "DAP (Di-Ammonium Phosphate)", "Phosphatic"
-        if nutrient == "Potassium (K)":
-            return "MOP (Muriate of Potash)", "Potassic"
-
     response = {
         "crop": crop,
         "stage": stage,
@@ -127,13 +172,13 @@ def recommend_fertilizer(
     # PRIMARY fertilizer (always)
     # -----------------------------
     primary_nutrient = deficient_sorted[0]
-    fert_name, fert_type = fertilizer_map(primary_nutrient)
+    fert_name, fert_type = FERTILIZER_MAP[primary_nutrient]
 
     response["primary"] = {
         "nutrient": primary_nutrient,
         "fertilizer_type": fert_type,
         "fertilizer_name": fert_name,
-        "dose_kg_acre": round(priority_scores[primary_nutrient] * 100, 2),
+        "dose_kg_acre": _dose(priority_scores[primary_nutrient], PRIMARY_DOSE_FACTOR),
         "message": f"Apply {fert_name} to correct major nutrient deficiency."
     }
 
@@ -142,14 +187,144 @@ def recommend_fertilizer(
     # -----------------------------
     if len(deficient_sorted) > 1:
         secondary_nutrient = deficient_sorted[1]
-        fert_name, fert_type = fertilizer_map(secondary_nutrient)
+        fert_name, fert_type = FERTILIZER_MAP[secondary_nutrient]
 
         response["secondary"] = {
             "nutrient": secondary_nutrient,
             "fertilizer_type": fert_type,
             "fertilizer_name": fert_name,
-            "dose_kg_acre": round(priority_scores[secondary_nutrient] * 80, 2),
+            "dose_kg_acre": _dose(priority_scores[secondary_nutrient], SECONDARY_DOSE_FACTOR),
             "message": f"Apply {fert_name} if required."
         }
 
     return response
+
+
+# --------------------------------------------------
+# Memoized recommendation (quantized NPK keys)
+# --------------------------------------------------
+class FertilizerMemo:
+    """
+    Optional memoization layer over recommend_fertilizer.
+    N / P / K are quantized to `step` (the UI uses 0.1) and the key also
+    holds a snapshot of DEFAULT_FEATURES and DEFICIENCY_THRESHOLD, so
+    changing the agreed defaults never serves old answers.
+    Entries live in a utils.cache.ResultCache (LRU bounded by max_entries,
+    every call returns a fresh copy).
+    """
+
+    def __init__(self, max_entries=4096, step=0.1):
+        if step <= 0:
+            raise ValueError("step must be > 0")
+        self.step = step
+        self.cache = ResultCache(max_entries=max_entries)
+
+    def recommend(self, crop, stage, N_mgkg, P_mgkg, K_mgkg):
+        n_q, p_q, k_q = (self._quantize(v) for v in (N_mgkg, P_mgkg, K_mgkg))
+        defaults = json.dumps([sorted(DEFAULT_FEATURES.items()), DEFICIENCY_THRESHOLD])
+        key = ResultCache.make_key("fertilizer", f"{crop}|{stage}", defaults, n_q, p_q, k_q)
+        # a failing call raises here and stores nothing
+        response = self.cache.get_or_compute(key, lambda: self._compute(crop, stage, n_q, p_q, k_q))
+        response["soil_nutrients"] = {
+            "N_mgkg": N_mgkg,
+            "P_mgkg": P_mgkg,
+            "K_mgkg": K_mgkg,
+        }
+        return response
+
+    def stats(self):
+        return self.cache.stats()
+
+    def clear(self):
+        self.cache.clear()
+
+    def _quantize(self, value):
+        return int(round(float(value) / self.step))
+
+    def _compute(self, crop, stage, n_q, p_q, k_q):
+        return recommend_fertilizer(
+            crop=crop,
+            stage=stage,
+            N_mgkg=round(n_q * self.step, 10),
+            P_mgkg=round(p_q * self.step, 10),
+            K_mgkg=round(k_q * self.step, 10),
+        )
+
+# --------------------------------------------------
+# Batch fertilizer recommendation (soil survey runs)
+# --------------------------------------------------
+@instrument("fertilizer_scoring_batch")
+def recommend_fertilizer_batch(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Vectorized recommend_fertilizer over many rows.
+    df needs crop, stage, N_mgkg, P_mgkg and K_mgkg columns; any other
+    model feature that is missing is filled with DEFAULT_FEATURES.
+    Runs one preprocessor transform and one predict per nutrient model
+    (or one compiled scoring pass), then the deficiency / ranking / dose
+    logic in NumPy.
+
+    Returns a DataFrame (same index as df) with the priority scores and
+    primary_* / secondary_* columns. Rows without a deficiency have no
+    primary (None / NaN); rows with a single deficiency have no secondary.
+    """
+
+    _load_models()
+
+    required = ["crop", "stage", "N_mgkg", "P_mgkg", "K_mgkg"]
+    missing = [col for col in required if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+
+    input_data = df.copy()
+    for col, value in DEFAULT_FEATURES.items():
+        if col not in input_data.columns:
+            input_data[col] = value
+
+    # -----------------------------
+    # One transform + one predict per model
+    # -----------------------------
+    if USE_COMPILED_MODELS:
+        scores = _compiled.score_frame(input_data)
+    else:
+        X = _preprocessor.transform(input_data)
+        scores = np.column_stack([
+            np.asarray(_priority_models[key].predict(X), dtype=np.float64)
+            for key in PRIORITY_MODEL_KEYS
+        ])
+
+    # -----------------------------
+    # Deficiency + ranking (stable, highest score first)
+    # -----------------------------
+    deficient = scores > DEFICIENCY_THRESHOLD
+    n_deficient = deficient.sum(axis=1)
+    ranked_scores = np.where(deficient, scores, -np.inf)
+    order = np.argsort(-ranked_scores, axis=1, kind="stable")
+
+    rows = np.arange(len(scores))
+    nutrients = np.array(NUTRIENTS, dtype=object)
+    names = np.array([FERTILIZER_MAP[n][0] for n in NUTRIENTS], dtype=object)
+    types = np.array([FERTILIZER_MAP[n][1] for n in NUTRIENTS], dtype=object)
+
+    result = pd.DataFrame(index=df.index)
+    result["crop"] = df["crop"].to_numpy()
+    result["stage"] = df["stage"].to_numpy()
+    for col in ["N_mgkg", "P_mgkg", "K_mgkg"]:
+        result[col] = df[col].to_numpy()
+    for i, col in enumerate(["N_score", "P_score", "K_score"]):
+        result[col] = scores[:, i]
+    result["n_deficient"] = n_deficient
+
+    # PRIMARY (dose x100) and SECONDARY (dose x80)
+    for prefix, rank, dose_factor in [("primary", 0, PRIMARY_DOSE_FACTOR), ("secondary", 1, SECONDARY_DOSE_FACTOR)]:
+        idx = order[:, rank]
+        present = n_deficient > rank
+        result[f"{prefix}_nutrient"] = np.where(present, nutrients[idx], None)
+        result[f"{prefix}_fertilizer_type"] = np.where(present, types[idx], None)
+        result[f"{prefix}_fertilizer_name"] = np.where(present, names[idx], None)
+        # same Python round() as recommend_fertilizer (np.round differs on halves)
+        result[f"{prefix}_dose_kg_acre"] = [
+            _dose(score, dose_factor) if p else np.nan
+            for score, p in zip(scores[rows, idx].tolist(), present)
+        ]
+
+    return result
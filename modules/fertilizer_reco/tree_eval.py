@@ -0,0 +1,292 @@
+# modules/fertilizer_reco/tree_eval.py
+
+import json
+
+import numpy as np
+
+# --------------------------------------------------
+# Flat, array-backed copies of the fitted fertilizer models.
+# All trees of all priority models live in one set of node arrays, so a
+# prediction is max_depth rounds of NumPy gathers, no sklearn / pandas /
+# XGBoost call in between.
+# --------------------------------------------------
+
+
+class CompiledPreprocessor:
+    """
+    Array version of the fitted ColumnTransformer: one-hot columns for the
+    categorical features (unknown values -> all zeros, as with
+    handle_unknown="ignore") followed by the passthrough numeric columns.
+    """
+
+    def __init__(self, categorical, numeric, n_features):
+        # categorical: [(column, {category: output index}), ...]
+        # numeric: [(column, output index), ...]
+        self.categorical = categorical
+        self.numeric = numeric
+        self.n_features = n_features
+
+    @classmethod
+    def from_column_transformer(cls, ct):
+        categorical, numeric = [], []
+        offset = 0
+        for name, transformer, columns in ct.transformers_:
+            if name == "remainder" or transformer == "drop":
+                continue
+            if hasattr(transformer, "categories_"):
+                if getattr(transformer, "drop_idx_", None) is not None:
+                    raise ValueError("OneHotEncoder with drop= is not supported")
+                for column, categories in zip(columns, transformer.categories_):
+                    categorical.append((column, {c: offset + i for i, c in enumerate(categories)}))
+                    offset += len(categories)
+            elif transformer == "passthrough" or type(transformer).__name__ == "FunctionTransformer" \
+                    and transformer.func is None:
+                for column in columns:
+                    numeric.append((column, offset))
+                    offset += 1
+            else:
+                raise ValueError(f"Unsupported transformer in {name}: {transformer!r}")
+        return cls(categorical, numeric, offset)
+
+    def transform_row(self, row):
+        """
+        row: mapping column -> value. Returns a (1, n_features) float32 array.
+        """
+        x = np.zeros((1, self.n_features), dtype=np.float32)
+        for column, codes in self.categorical:
+            index = codes.get(row[column])
+            if index is not None:
+                x[0, index] = 1.0
+        for column, index in self.numeric:
+            x[0, index] = row[column]
+        return x
+
+    def transform_frame(self, df):
+        X = np.zeros((len(df), self.n_features), dtype=np.float32)
+        rows = np.arange(len(df))
+        for column, codes in self.categorical:
+            index = df[column].map(codes).to_numpy(dtype=np.float64, na_value=np.nan)
+            known = ~np.isnan(index)
+            X[rows[known], index[known].astype(np.intp)] = 1.0
+        for column, index in self.numeric:
+            X[:, index] = df[column].to_numpy(dtype=np.float32)
+        return X
+
+
+class CompiledEnsemble:
+    """
+    Gradient boosted regression trees (one or more models) as flat node
+    arrays. Nodes are laid out so the right child is always left + 1 and
+    leaves have a NaN threshold and point to themselves, so one step for
+    every (tree, row) is
+
+        node = left[node] + (x[feature[node]] >= threshold[node])
+
+    repeated max_depth times. Each model starts with a one-leaf tree
+    holding its base_score, and the leaf values are summed in float32 in
+    tree order like XGBoost does, so predictions match it bit for bit.
+    Output column m is model m's prediction.
+    """
+
+    def __init__(self, feature, threshold, left, default_left, value, tree_roots, model_starts, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.default_left = default_left
+        self.value = value
+        self.tree_roots = tree_roots
+        # trees of model m are tree_roots[model_starts[m]:model_starts[m + 1]]
+        self.model_starts = model_starts
+        self.max_depth = max_depth
+        self.n_models = len(model_starts) - 1
+
+    @classmethod
+    def from_xgboost(cls, models):
+        """
+        models: fitted XGBRegressor objects (or Boosters), single-output
+        gbtree with numeric splits.
+        """
+        parts, roots, model_starts = [], [], []
+        offset, max_depth = 0, 0
+
+        def add(arrays):
+            nonlocal offset
+            parts.append(arrays)
+            roots.append(offset)
+            offset += len(arrays[0])
+
+        for model in models:
+            booster = model.get_booster() if hasattr(model, "get_booster") else model
+            learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+            gb = learner["gradient_booster"]
+            if gb["name"] != "gbtree":
+                raise ValueError(f"Unsupported booster: {gb['name']}")
+
+            trees = gb["model"]["trees"]
+            best = getattr(model, "best_iteration", None) if hasattr(model, "get_booster") else None
+            if best is not None:
+                trees = trees[:gb["model"]["iteration_indptr"][best + 1]]
+
+            model_starts.append(len(roots))
+            # stored as "0.356" or "[3.56E-1]" depending on the XGBoost version
+            base_score = float(learner["learner_model_param"]["base_score"].strip("[]"))
+            add(_leaf(base_score, offset))
+            for tree in trees:
+                if any(tree["split_type"]):
+                    raise ValueError("Categorical splits are not supported")
+                arrays, depth = _flatten_tree(tree, offset)
+                add(arrays)
+                max_depth = max(max_depth, depth)
+        model_starts.append(len(roots))
+
+        feature, threshold, left, default_left, value = (np.concatenate(a) for a in zip(*parts))
+        return cls(
+            feature, threshold, left, default_left, value,
+            tree_roots=np.asarray(roots, dtype=np.intp),
+            model_starts=model_starts,
+            max_depth=max_depth,
+        )
+
+    def _walk(self, nodes, gather):
+        # gather(feature_index_array) -> input values, same shape as nodes
+        feature, threshold, left = self.feature, self.threshold, self.left
+        for _ in range(self.max_depth):
+            x = gather(feature[nodes])
+            go_right = x >= threshold[nodes]
+            missing = np.isnan(x)
+            if missing.any():
+                go_right = np.where(missing, ~self.default_left[nodes], go_right)
+            nodes = left[nodes] + go_right
+        return nodes
+
+    def _walk_dense(self, nodes, gather):
+        # same as _walk for inputs without NaN
+        feature, threshold, left = self.feature, self.threshold, self.left
+        for _ in range(self.max_depth):
+            nodes = left[nodes] + (gather(feature[nodes]) >= threshold[nodes])
+        return nodes
+
+    def _sum(self, leaf_values):
+        # (trees, ...) -> (n_models, ...); cumsum is a sequential float32 sum
+        starts = self.model_starts
+        return np.stack([
+            np.cumsum(leaf_values[starts[m]:starts[m + 1]], axis=0, dtype=np.float32)[-1]
+            for m in range(self.n_models)
+        ]).astype(np.float64)
+
+    def predict(self, X, chunk_rows=256):
+        """
+        X: (rows, features) -> (rows, n_models) float64 predictions.
+        Rows are walked chunk_rows at a time to keep the (trees x rows)
+        working arrays in cache.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        walk = self._walk if np.isnan(X).any() else self._walk_dense
+        out = np.empty((X.shape[0], self.n_models), dtype=np.float64)
+        for start in range(0, X.shape[0], chunk_rows):
+            chunk = X[start:start + chunk_rows]
+            flat = chunk.ravel()
+            # feature index -> flat index of (row, feature) in this chunk
+            row_offsets = np.arange(chunk.shape[0]) * chunk.shape[1]
+            nodes = np.repeat(self.tree_roots[:, None], chunk.shape[0], axis=1)
+            nodes = walk(nodes, lambda f: flat[f + row_offsets])
+            out[start:start + chunk_rows] = self._sum(self.value[nodes]).T
+        return out
+
+    def predict_row(self, x):
+        """
+        Single row (features,) or (1, features) -> (n_models,); a 1-D walk
+        over all trees at once.
+        """
+        x = np.asarray(x, dtype=np.float32).reshape(-1)
+        walk = self._walk if np.isnan(x).any() else self._walk_dense
+        return self._sum(self.value[walk(self.tree_roots, x.take)])
+
+
+def _leaf(value, offset):
+    return (
+        np.zeros(1, dtype=np.intp),
+        np.full(1, np.nan, dtype=np.float32),
+        np.full(1, offset, dtype=np.intp),
+        np.ones(1, dtype=bool),
+        np.full(1, value, dtype=np.float32),
+    )
+
+
+def _flatten_tree(tree, offset):
+    """
+    XGBoost JSON tree -> (feature, threshold, left, default_left, value)
+    arrays in breadth-first order with sibling pairs adjacent, plus the
+    tree depth. Node ids are global (shifted by offset).
+    """
+    lc, rc = tree["left_children"], tree["right_children"]
+    cond = tree["split_conditions"]
+
+    order, depth_of = [0], {0: 0}
+    new_id = {0: 0}
+    for node in order:  # grows while iterating (BFS)
+        if lc[node] != -1:
+            for child in (lc[node], rc[node]):
+                new_id[child] = len(order)
+                depth_of[child] = depth_of[node] + 1
+                order.append(child)
+
+    n = len(order)
+    feature = np.zeros(n, dtype=np.intp)
+    threshold = np.full(n, np.nan, dtype=np.float32)
+    left = np.empty(n, dtype=np.intp)
+    default_left = np.zeros(n, dtype=bool)
+    value = np.zeros(n, dtype=np.float32)
+
+    for old in order:
+        i = new_id[old]
+        if lc[old] == -1:
+            left[i] = offset + i  # leaf: x >= NaN is False -> stays here
+            default_left[i] = True
+            value[i] = cond[old]  # leaf value
+        else:
+            feature[i] = tree["split_indices"][old]
+            threshold[i] = cond[old]
+            left[i] = offset + new_id[lc[old]]
+            default_left[i] = bool(tree["default_left"][old])
+
+    return (feature, threshold, left, default_left, value), max(depth_of.values())
+
+
+class CompiledScorer:
+    """
+    Preprocessor + priority models in one object:
+    score_row(row_dict) -> (n_models,), score_frame(df) -> (rows, n_models).
+
+    The NumPy tree walk costs ~50 us per row on top of a fixed ~0.1 ms,
+    while XGBoost's own C++ predictor has ~0.25 ms of call overhead per
+    model but is much cheaper per row. Frames with more than
+    native_batch_rows rows are therefore scored by the boosters directly
+    (inplace_predict on the compiled feature matrix, same outputs).
+    """
+
+    native_batch_rows = 24
+
+    def __init__(self, preprocessor, ensemble, boosters=None):
+        self.preprocessor = preprocessor
+        self.ensemble = ensemble
+        self.boosters = boosters
+
+    @classmethod
+    def from_fitted(cls, column_transformer, models):
+        return cls(
+            CompiledPreprocessor.from_column_transformer(column_transformer),
+            CompiledEnsemble.from_xgboost(models),
+            [m.get_booster() if hasattr(m, "get_booster") else m for m in models],
+        )
+
+    def score_row(self, row):
+        return self.ensemble.predict_row(self.preprocessor.transform_row(row))
+
+    def score_frame(self, df):
+        X = self.preprocessor.transform_frame(df)
+        if self.boosters and len(X) > self.native_batch_rows:
+            return np.column_stack([b.inplace_predict(X) for b in self.boosters]).astype(np.float64)
+        return self.ensemble.predict(X)
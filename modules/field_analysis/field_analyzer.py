@@ -0,0 +1,219 @@
+# modules/field_analysis/field_analyzer.py
+
+import argparse
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import torch
+
+from modules.stage_detection.abhi_predict import predict_image
+from modules.harvest_prediction.harvest_predictor import (
+    HarvestPredictor,
+    extract_visual_features,
+    sub_stage_confidence,
+)
+from modules.field_analysis.field_store import FieldAggregate, FieldStore
+from utils.preprocess import decode_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# --------------------------------------------------
+# Per-worker state (one predictor per process)
+# --------------------------------------------------
+
+_predictor = None
+
+
+def _init_worker(rf_model_path, torch_threads):
+    global _predictor
+    # N processes x 1 thread beats 1 process x N threads for small CNN batches
+    torch.set_num_threads(torch_threads)
+    _predictor = HarvestPredictor(rf_model_path)
+
+
+def collect_images(source):
+    """
+    source: a directory (all jpg / png files in it, sorted) or a list of paths.
+    """
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    return [os.fspath(path) for path in source]
+
+
+def analyze_one(image_path):
+    """
+    Stage detection + harvest prediction for one image, decoded once.
+    Runs inside a worker process; returns a per_image_details entry.
+    """
+    global _predictor
+    if _predictor is None:
+        _predictor = HarvestPredictor()
+
+    pixels = decode_image(image_path)
+    stage_result = predict_image(pixels)
+    crop, stage = stage_result["crop"], stage_result["stage"]
+    features = extract_visual_features(pixels)
+    harvest = _predictor.predict_from_features([features], [crop], [stage])[0]
+
+    return {
+        "filename": os.path.basename(image_path),
+        "crop": crop,
+        "ripening_stage": stage,
+        "ripening_confidence": round(stage_result["stage_confidence"] / 100, 4),
+        "crop_confidence": round(stage_result["crop_confidence"] / 100, 4),
+        "substage": harvest["sub_stage"],
+        "substage_confidence": sub_stage_confidence(features, crop, stage),
+        "days_to_harvest": harvest["harvest_window_days"]["expected"],
+        "harvest_date": harvest["harvest_window_dates"]["expected"],
+    }
+
+
+# --------------------------------------------------
+# Parallel driver
+# --------------------------------------------------
+
+def iter_field_results(images, workers=None, rf_model_path=None, max_in_flight=None):
+    """
+    Yields (image_num, detail_or_error) as images finish, not in input order.
+    workers=1 runs in this process. With more workers at most max_in_flight
+    images (default 2 x workers) are queued at once, so memory stays bounded
+    however many images the field has.
+    A failed image yields {"filename": ..., "error": ...} instead of stopping
+    the run.
+    """
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        _init_worker(rf_model_path, torch.get_num_threads())
+        for num, path in enumerate(images, start=1):
+            yield num, _safe_analyze(path)
+        return
+
+    max_in_flight = max_in_flight or 2 * workers
+    pending = {}
+    queue = iter(enumerate(images, start=1))
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(rf_model_path, 1),
+    ) as pool:
+        for num, path in queue:
+            pending[pool.submit(_safe_analyze, path)] = num
+            if len(pending) >= max_in_flight:
+                break
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+                next_item = next(queue, None)
+                if next_item is not None:
+                    num, path = next_item
+                    pending[pool.submit(_safe_analyze, path)] = num
+
+
+def _safe_analyze(image_path):
+    try:
+        return analyze_one(image_path)
+    except Exception as e:
+        return {"filename": os.path.basename(image_path), "error": str(e)}
+
+
+# --------------------------------------------------
+# Aggregate report (field_analysis_results.json format)
+# --------------------------------------------------
+
+def build_field_report(details, area_hectares, num_seeds, quality_score=0.8, failed=None):
+    """
+    details: per_image_details entries (with image_num).
+    Yield is BASE_YIELD of the dominant crop x area x quality_score.
+    """
+    details = sorted(details, key=lambda d: d["image_num"])
+    report = FieldAggregate.from_details(details).report(area_hectares, num_seeds, quality_score)
+    report["per_image_details"] = details
+    if failed:
+        report["failed_images"] = failed
+    return report
+
+
+def analyze_field(
+    source,
+    area_hectares,
+    num_seeds,
+    output_path=None,
+    workers=None,
+    rf_model_path=None,
+    on_result=None,
+    store=None,
+    field_id=None,
+):
+    """
+    Runs the whole field and returns the aggregate report, also written to
+    output_path when one is given. on_result(detail) is called for
+    every image as soon as it finishes.
+    store: optional field_store.FieldStore; every image is appended to it
+    under field_id as it finishes, so store.summary(field_id) is live.
+    """
+    if store is not None:
+        if field_id is None:
+            raise ValueError("field_id is required with a store")
+        store.set_field(field_id, area_hectares, num_seeds)
+    details, failed = [], []
+    images = collect_images(source)
+
+    for num, detail in iter_field_results(images, workers=workers, rf_model_path=rf_model_path):
+        detail = {"image_num": num, **detail}
+        (failed if "error" in detail else details).append(detail)
+        if store is not None:
+            store.add(field_id, detail)
+        if on_result is not None:
+            on_result(detail)
+
+    report = build_field_report(details, area_hectares, num_seeds, failed=failed)
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze all images of a field")
+    parser.add_argument("images", nargs="+", help="image directory or image files")
+    parser.add_argument("--area", type=float, required=True, help="planting area (hectares)")
+    parser.add_argument("--seeds", type=int, required=True, help="number of seeds / plants")
+    parser.add_argument("--out", default=None, help="write the report JSON here")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--rf-model", default=None)
+    parser.add_argument("--store", default=None, help="append results to this field store log")
+    parser.add_argument("--field", default=None, help="field id in the store")
+    args = parser.parse_args()
+
+    source = args.images[0] if len(args.images) == 1 and os.path.isdir(args.images[0]) else args.images
+
+    def show(detail):
+        if "error" in detail:
+            print(f"[{detail['image_num']}] {detail['filename']}: ERROR {detail['error']}")
+        else:
+            print(f"[{detail['image_num']}] {detail['filename']}: {detail['crop']} "
+                  f"{detail['ripening_stage']}/{detail['substage']}, {detail['days_to_harvest']} days")
+
+    store = None
+    if args.store:
+        store = FieldStore(args.store)
+
+    result = analyze_field(
+        source, args.area, args.seeds, args.out, args.workers, args.rf_model, show,
+        store=store, field_id=args.field or os.path.basename(os.path.abspath(args.images[0])),
+    )
+    if store is not None:
+        store.close()
+    print(f"Analyzed {result['images_analyzed']} images" + (f" -> {args.out}" if args.out else ""))
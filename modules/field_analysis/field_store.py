@@ -0,0 +1,297 @@
+# modules/field_analysis/field_store.py
+
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+
+from modules.yield_prediction.yield_estimator import BASE_YIELD
+
+# --------------------------------------------------
+# Mergeable running aggregate of one field
+# --------------------------------------------------
+
+class FieldAggregate:
+    """
+    Everything build_field_report needs, kept as counts / sums / min / max,
+    so adding an image is O(1) and two partial aggregates (e.g. from two
+    workers) merge into the aggregate of all their images.
+    """
+
+    def __init__(self):
+        self.images = 0
+        self.failed = 0
+        self.stage_counts = Counter()
+        self.crop_counts = Counter()
+        self.substage_counts = Counter()
+        self.confidence_sum = 0.0
+        self.days_sum = 0.0
+        self.earliest_date = None
+        self.latest_date = None
+
+    def add(self, detail):
+        """
+        detail: a per_image_details entry (or {"error": ...} for a failed image).
+        """
+        if "error" in detail:
+            self.failed += 1
+            return self
+        self.images += 1
+        stage = detail["ripening_stage"]
+        self.stage_counts[stage] += 1
+        self.crop_counts[detail["crop"]] += 1
+        self.substage_counts[(stage, detail["substage"])] += 1
+        self.confidence_sum += detail["ripening_confidence"]
+        self.days_sum += detail["days_to_harvest"]
+        # YYYY-MM-DD strings order like the dates
+        date = detail["harvest_date"]
+        if self.earliest_date is None or date < self.earliest_date:
+            self.earliest_date = date
+        if self.latest_date is None or date > self.latest_date:
+            self.latest_date = date
+        return self
+
+    def merge(self, other):
+        self.images += other.images
+        self.failed += other.failed
+        self.stage_counts.update(other.stage_counts)
+        self.crop_counts.update(other.crop_counts)
+        self.substage_counts.update(other.substage_counts)
+        self.confidence_sum += other.confidence_sum
+        self.days_sum += other.days_sum
+        dates = [d for d in (self.earliest_date, other.earliest_date) if d is not None]
+        self.earliest_date = min(dates) if dates else None
+        dates = [d for d in (self.latest_date, other.latest_date) if d is not None]
+        self.latest_date = max(dates) if dates else None
+        return self
+
+    @classmethod
+    def from_details(cls, details):
+        aggregate = cls()
+        for detail in details:
+            aggregate.add(detail)
+        return aggregate
+
+    def to_dict(self):
+        return {
+            "images": self.images,
+            "failed": self.failed,
+            "stage_counts": dict(self.stage_counts),
+            "crop_counts": dict(self.crop_counts),
+            "substage_counts": [[stage, sub, n] for (stage, sub), n in sorted(self.substage_counts.items())],
+            "confidence_sum": self.confidence_sum,
+            "days_sum": self.days_sum,
+            "earliest_date": self.earliest_date,
+            "latest_date": self.latest_date,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls()
+        aggregate.images = data["images"]
+        aggregate.failed = data["failed"]
+        aggregate.stage_counts = Counter(data["stage_counts"])
+        aggregate.crop_counts = Counter(data["crop_counts"])
+        aggregate.substage_counts = Counter({(stage, sub): n for stage, sub, n in data["substage_counts"]})
+        aggregate.confidence_sum = data["confidence_sum"]
+        aggregate.days_sum = data["days_sum"]
+        aggregate.earliest_date = data["earliest_date"]
+        aggregate.latest_date = data["latest_date"]
+        return aggregate
+
+    def report(self, area_hectares, num_seeds, quality_score=0.8):
+        """
+        field_analysis_results.json fields, without per_image_details.
+        Yield is BASE_YIELD of the dominant crop x area x quality_score.
+        """
+        n = self.images
+        dominant_crop = self.crop_counts.most_common(1)[0][0] if n else None
+
+        if n:
+            window = (datetime.strptime(self.latest_date, "%Y-%m-%d")
+                      - datetime.strptime(self.earliest_date, "%Y-%m-%d")).days
+        else:
+            window = 0
+
+        def pct(stage):
+            return round(100 * self.stage_counts[stage] / n, 1) if n else 0.0
+
+        per_hectare = BASE_YIELD.get(dominant_crop, 0) * quality_score
+        total_tons = per_hectare * area_hectares
+
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "images_analyzed": n,
+            "planting_area_hectares": area_hectares,
+            "num_seeds": num_seeds,
+            "harvest_timeline": {
+                "earliest_harvest_date": self.earliest_date,
+                "latest_harvest_date": self.latest_date,
+                "harvest_window_days": window,
+                "average_days_to_harvest": round(self.days_sum / n, 2) if n else 0.0,
+            },
+            "ripeness_analysis": {
+                "dominant_crop": dominant_crop,
+                "unripe_percentage": pct("unripe"),
+                "semiripe_percentage": pct("semiripe"),
+                "ripe_percentage": pct("ripe"),
+                "average_confidence": round(self.confidence_sum / n, 4) if n else 0.0,
+            },
+            "substage_distribution": {str(k): v for k, v in sorted(self.substage_counts.items())},
+            "yield_prediction": {
+                "total_yield_tons": round(total_tons, 2),
+                "total_yield_kg": round(total_tons * 1000),
+                "yield_per_hectare_tons": round(per_hectare, 2),
+                "quality_score": quality_score,
+            },
+        }
+
+
+# --------------------------------------------------
+# Append-only store of many fields
+# --------------------------------------------------
+
+class FieldStore:
+    """
+    Live per-field summaries backed by an append-only JSON-lines log.
+
+    store = FieldStore("fields.log")
+    store.set_field("north", area_hectares=2.5, num_seeds=4000)
+    store.add("north", detail)          # one line appended, O(1)
+    store.summary("north")              # report without per_image_details
+
+    Log records:
+      {"type": "field", "field", "area_hectares", "num_seeds", "quality_score"}
+      {"type": "image", "field", "detail"}     one analyzed (or failed) image
+      {"type": "merge", "field", "aggregate"}  FieldAggregate.to_dict()
+    Opening the store replays the log. A torn last line (crash while
+    appending) is ignored. compact() rewrites the log as one "field" +
+    one "merge" record per field.
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self._aggregates = {}
+        self._fields = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            self._replay()
+        self._file = open(path, "a", encoding="utf-8")
+
+    # ---------------- log ----------------
+
+    def _replay(self):
+        with open(self.path, "rb") as f:
+            lines = f.readlines()
+        for num, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if num < len(lines):
+                    raise ValueError(f"{self.path}:{num}: corrupt record") from None
+                # torn write at the end: drop it so new records start on a fresh line
+                with open(self.path, "r+b") as f:
+                    f.truncate(sum(len(line) for line in lines[:-1]))
+                break
+            self._apply(record)
+        else:
+            if lines and not lines[-1].endswith(b"\n"):
+                with open(self.path, "ab") as f:
+                    f.write(b"\n")
+
+    def _apply(self, record):
+        kind, field = record["type"], record["field"]
+        if kind == "field":
+            self._fields[field] = {k: record[k] for k in ("area_hectares", "num_seeds", "quality_score")}
+            self._aggregates.setdefault(field, FieldAggregate())
+        elif kind == "image":
+            self._aggregates.setdefault(field, FieldAggregate()).add(record["detail"])
+        elif kind == "merge":
+            aggregate = FieldAggregate.from_dict(record["aggregate"])
+            self._aggregates.setdefault(field, FieldAggregate()).merge(aggregate)
+        else:
+            raise ValueError(f"unknown record type: {kind}")
+
+    def _append(self, records):
+        with self._lock:
+            for record in records:
+                self._apply(record)
+            self._file.write("".join(json.dumps(r) + "\n" for r in records))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    # ---------------- updates ----------------
+
+    def set_field(self, field, area_hectares, num_seeds, quality_score=0.8):
+        self._append([{
+            "type": "field", "field": field, "area_hectares": area_hectares,
+            "num_seeds": num_seeds, "quality_score": quality_score,
+        }])
+
+    def add(self, field, detail):
+        self.add_many(field, [detail])
+
+    def add_many(self, field, details):
+        self._append([{"type": "image", "field": field, "detail": detail} for detail in details])
+
+    def merge(self, field, aggregate):
+        """
+        Folds in a partial FieldAggregate (e.g. built by a worker process)
+        as one log record.
+        """
+        self._append([{"type": "merge", "field": field, "aggregate": aggregate.to_dict()}])
+
+    def compact(self):
+        """
+        Rewrites the log with one snapshot per field (atomic replace).
+        """
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for field, aggregate in self._aggregates.items():
+                    if field in self._fields:
+                        f.write(json.dumps({"type": "field", "field": field, **self._fields[field]}) + "\n")
+                    f.write(json.dumps({"type": "merge", "field": field, "aggregate": aggregate.to_dict()}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    # ---------------- queries ----------------
+
+    def fields(self):
+        return sorted(self._aggregates)
+
+    def aggregate(self, field):
+        return self._aggregates[field]
+
+    def summary(self, field, area_hectares=None, num_seeds=None, quality_score=None):
+        """
+        Current report of one field. Arguments override the values given
+        to set_field.
+        """
+        aggregate = self._aggregates[field]
+        settings = self._fields.get(field, {})
+        area_hectares = settings.get("area_hectares", 0.0) if area_hectares is None else area_hectares
+        num_seeds = settings.get("num_seeds") if num_seeds is None else num_seeds
+        quality_score = settings.get("quality_score", 0.8) if quality_score is None else quality_score
+
+        report = aggregate.report(area_hectares, num_seeds, quality_score)
+        report["images_failed"] = aggregate.failed
+        return report
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
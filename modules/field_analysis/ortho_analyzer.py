@@ -0,0 +1,388 @@
+# modules/field_analysis/ortho_analyzer.py
+
+import argparse
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+import torch
+
+from modules.stage_detection import abhi_predict
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor, extract_visual_features
+
+SUB_STAGES = ("early", "mid", "late")
+
+# --------------------------------------------------
+# Windowed readers (only the requested window is decoded)
+# --------------------------------------------------
+
+def _to_rgb(window):
+    if window.ndim == 2:
+        return np.repeat(window[:, :, None], 3, axis=2)
+    return np.ascontiguousarray(window[:, :, :3])
+
+
+class _ArrayReader:
+    """
+    (H, W[, C]) uint8 array, typically an np.load(..., mmap_mode="r") map
+    of a .npy orthomosaic, so only touched windows are paged in.
+    """
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape[:2]
+
+    def read(self, y, x, h, w):
+        return _to_rgb(self.array[y:y + h, x:x + w])
+
+    def close(self):
+        pass
+
+
+class _RasterioReader:
+    """
+    GeoTIFF / tiled TIFF through rasterio windowed reads (bands 1-3).
+    """
+
+    def __init__(self, path):
+        import rasterio
+
+        self._windows = rasterio.windows
+        self.ds = rasterio.open(path)
+        self.shape = (self.ds.height, self.ds.width)
+
+    def read(self, y, x, h, w):
+        bands = [1, 2, 3] if self.ds.count >= 3 else [1, 1, 1]
+        window = self.ds.read(bands, window=self._windows.Window(x, y, w, h))
+        return np.ascontiguousarray(np.moveaxis(window, 0, -1).astype(np.uint8, copy=False))
+
+    def close(self):
+        self.ds.close()
+
+
+class _PILReader:
+    """
+    Fallback for formats without random access (JPEG / PNG): the image is
+    decoded once in full, so memory is not bounded by the tile batch.
+    Convert large mosaics to .npy (or install rasterio for TIFFs) first.
+    """
+
+    def __init__(self, path):
+        from PIL import Image
+
+        # orthomosaics are far above PIL's decompression bomb limit
+        limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+        try:
+            with Image.open(path) as image:
+                self.array = np.asarray(image.convert("RGB"))
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+        self.shape = self.array.shape[:2]
+
+    def read(self, y, x, h, w):
+        return self.array[y:y + h, x:x + w]
+
+    def close(self):
+        pass
+
+
+def _has_rasterio():
+    try:
+        import rasterio  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def open_raster(source):
+    """
+    ndarray / .npy -> memory map, .tif / .tiff -> rasterio when installed,
+    anything else -> full PIL decode.
+    """
+    if isinstance(source, np.ndarray):
+        return _ArrayReader(source)
+    path = os.fspath(source)
+    if path.lower().endswith(".npy"):
+        return _ArrayReader(np.load(path, mmap_mode="r"))
+    if path.lower().endswith((".tif", ".tiff")) and _has_rasterio():
+        return _RasterioReader(path)
+    return _PILReader(path)
+
+
+def _streamable(source):
+    # worker processes reopen the file themselves; only worth it when
+    # a window read does not decode the whole image
+    if isinstance(source, np.ndarray):
+        return False
+    path = os.fspath(source).lower()
+    return path.endswith(".npy") or (path.endswith((".tif", ".tiff")) and _has_rasterio())
+
+
+# --------------------------------------------------
+# Per-worker state
+# --------------------------------------------------
+
+_predictor = None
+_readers = {}
+
+
+def _init_worker(rf_model_path, torch_threads):
+    global _predictor
+    torch.set_num_threads(torch_threads)
+    _predictor = HarvestPredictor(rf_model_path)
+
+
+def _reader_for(source):
+    reader = _readers.get(source)
+    if reader is None:
+        reader = _readers[source] = open_raster(source)
+    return reader
+
+
+def _analyze_tiles(reader, tiles, min_valid):
+    """
+    tiles: [(row, col, y, x, h, w), ...]. Returns
+    [(row, col, crop_idx, stage_idx, substage_idx, confidence, days), ...]
+    for the tiles with enough non-empty pixels.
+    """
+    global _predictor
+    if _predictor is None:
+        _predictor = HarvestPredictor()
+
+    kept, tensors, features = [], [], []
+    for row, col, y, x, h, w in tiles:
+        window = reader.read(y, x, h, w)
+        # nodata border of the mosaic (black pixels)
+        if np.count_nonzero(window.any(axis=2)) < min_valid * h * w:
+            continue
+        kept.append((row, col))
+        tensors.append(abhi_predict.preprocess(window))
+        features.append(extract_visual_features(window))
+
+    if not kept:
+        return []
+
+    stage_results = abhi_predict.predict_tensors(tensors)
+    crops = [r["crop"] for r in stage_results]
+    stages = [r["stage"] for r in stage_results]
+    harvest = _predictor.predict_from_features(features, crops, stages)
+
+    return [
+        (
+            row, col,
+            abhi_predict.crops.index(s["crop"]),
+            abhi_predict.stages.index(s["stage"]),
+            SUB_STAGES.index(h["sub_stage"]),
+            s["stage_confidence"],
+            h["harvest_window_days"]["expected"],
+        )
+        for (row, col), s, h in zip(kept, stage_results, harvest)
+    ]
+
+
+def _analyze_tiles_in_worker(source, tiles, min_valid):
+    return _analyze_tiles(_reader_for(source), tiles, min_valid)
+
+
+# --------------------------------------------------
+# Result grid
+# --------------------------------------------------
+
+class TileGrid:
+    """
+    Per-tile results as (rows, cols) arrays. Empty (nodata) tiles have
+    index -1 and NaN confidence / harvest days.
+    """
+
+    def __init__(self, rows, cols, tile_size, image_shape):
+        self.tile_size = tile_size
+        self.image_shape = image_shape
+        self.crop = np.full((rows, cols), -1, dtype=np.int8)
+        self.stage = np.full((rows, cols), -1, dtype=np.int8)
+        self.sub_stage = np.full((rows, cols), -1, dtype=np.int8)
+        self.confidence = np.full((rows, cols), np.nan, dtype=np.float32)
+        self.harvest_days = np.full((rows, cols), np.nan, dtype=np.float32)
+
+    @property
+    def shape(self):
+        return self.crop.shape
+
+    def _set(self, row, col, crop, stage, sub_stage, confidence, days):
+        self.crop[row, col] = crop
+        self.stage[row, col] = stage
+        self.sub_stage[row, col] = sub_stage
+        self.confidence[row, col] = confidence
+        self.harvest_days[row, col] = days
+
+    def records(self):
+        """
+        One dict per analyzed tile (row, col, pixel box and labels).
+        """
+        out = []
+        for row, col in zip(*np.nonzero(self.crop >= 0)):
+            out.append({
+                "row": int(row),
+                "col": int(col),
+                "x": int(col) * self.tile_size,
+                "y": int(row) * self.tile_size,
+                "crop": abhi_predict.crops[self.crop[row, col]],
+                "stage": abhi_predict.stages[self.stage[row, col]],
+                "sub_stage": SUB_STAGES[self.sub_stage[row, col]],
+                "stage_confidence": round(float(self.confidence[row, col]), 2),
+                "days_to_harvest": round(float(self.harvest_days[row, col]), 2),
+            })
+        return out
+
+    def summary(self):
+        valid = self.crop >= 0
+        n = int(valid.sum())
+
+        def pct(labels, values):
+            return {
+                label: round(100 * float((values[valid] == i).sum()) / n, 1) if n else 0.0
+                for i, label in enumerate(labels)
+            }
+
+        return {
+            "image_height": self.image_shape[0],
+            "image_width": self.image_shape[1],
+            "tile_size": self.tile_size,
+            "grid_rows": self.shape[0],
+            "grid_cols": self.shape[1],
+            "tiles_analyzed": n,
+            "tiles_empty": int(valid.size - n),
+            "crop_distribution": pct(abhi_predict.crops, self.crop),
+            "stage_distribution": pct(abhi_predict.stages, self.stage),
+            "substage_distribution": pct(SUB_STAGES, self.sub_stage),
+            "average_days_to_harvest": round(float(np.nanmean(self.harvest_days)), 2) if n else None,
+        }
+
+    def heatmap(self, layer="harvest_days", cell_px=8):
+        """
+        RGB uint8 image, one cell_px x cell_px block per tile.
+        layer: "harvest_days" (JET colormap, few days = red) or "stage"
+        (unripe green, semiripe yellow, ripe red). Empty tiles are black.
+        """
+        valid = self.crop >= 0
+        if layer == "harvest_days":
+            days = np.nan_to_num(self.harvest_days, nan=0.0)
+            top = float(days[valid].max()) if valid.any() else 0.0
+            scaled = np.zeros(days.shape, dtype=np.uint8)
+            if top > 0:
+                scaled = (255 * (1 - days / top)).clip(0, 255).astype(np.uint8)
+            colors = cv2.cvtColor(cv2.applyColorMap(scaled, cv2.COLORMAP_JET), cv2.COLOR_BGR2RGB)
+        elif layer == "stage":
+            palette = np.array([[40, 160, 40], [230, 200, 40], [200, 30, 30]], dtype=np.uint8)
+            colors = palette[np.clip(self.stage, 0, None)]
+        else:
+            raise ValueError("layer must be 'harvest_days' or 'stage'")
+
+        colors[~valid] = 0
+        return np.repeat(np.repeat(colors, cell_px, axis=0), cell_px, axis=1)
+
+
+# --------------------------------------------------
+# Driver
+# --------------------------------------------------
+
+def _tile_batches(shape, tile_size, batch_size):
+    height, width = shape
+    batch = []
+    for row, y in enumerate(range(0, height, tile_size)):
+        for col, x in enumerate(range(0, width, tile_size)):
+            batch.append((row, col, y, x, min(tile_size, height - y), min(tile_size, width - x)))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def analyze_orthomosaic(
+    source,
+    tile_size=512,
+    batch_size=16,
+    workers=None,
+    rf_model_path=None,
+    min_valid=0.5,
+    max_in_flight=None,
+):
+    """
+    Splits a large image into tile_size x tile_size windows and runs the
+    classifier + harvest predictor per tile. Returns a TileGrid.
+
+    source: .npy (memory-mapped), .tif / .tiff (windowed reads with
+    rasterio), an in-memory array or any PIL-readable file (decoded in
+    full, see _PILReader). Tiles are read and analyzed batch_size at a
+    time; with workers > 1 each worker process reads its own windows and
+    at most max_in_flight (default 2 x workers) batches are pending, so
+    memory stays bounded by workers x batch_size tiles.
+    min_valid: minimum fraction of non-black pixels for a tile to count.
+    """
+    reader = open_raster(source)
+    height, width = reader.shape
+    rows, cols = -(-height // tile_size), -(-width // tile_size)
+    grid = TileGrid(rows, cols, tile_size, (height, width))
+    batches = _tile_batches((height, width), tile_size, batch_size)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or not _streamable(source):
+        _init_worker(rf_model_path, torch.get_num_threads())
+        try:
+            for batch in batches:
+                for result in _analyze_tiles(reader, batch, min_valid):
+                    grid._set(*result)
+        finally:
+            reader.close()
+        return grid
+
+    reader.close()
+    source = os.fspath(source)
+    max_in_flight = max_in_flight or 2 * workers
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(rf_model_path, 1),
+    ) as pool:
+        pending = set()
+        for batch in batches:
+            pending.add(pool.submit(_analyze_tiles_in_worker, source, batch, min_valid))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for result in future.result():
+                        grid._set(*result)
+        for future in pending:
+            for result in future.result():
+                grid._set(*result)
+
+    return grid
+
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiled ripeness analysis of an orthomosaic")
+    parser.add_argument("image", help=".npy, .tif (rasterio) or any image file")
+    parser.add_argument("--tile-size", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--rf-model", default=None)
+    parser.add_argument("--out", default="ortho_analysis_results.json")
+    parser.add_argument("--heatmap", default="ortho_heatmap.png")
+    parser.add_argument("--layer", choices=["harvest_days", "stage"], default="harvest_days")
+    parser.add_argument("--cell-px", type=int, default=8)
+    args = parser.parse_args()
+
+    grid = analyze_orthomosaic(
+        args.image, args.tile_size, args.batch_size, args.workers, args.rf_model
+    )
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({**grid.summary(), "tiles": grid.records()}, f, indent=2)
+    heatmap = grid.heatmap(args.layer, args.cell_px)
+    cv2.imwrite(args.heatmap, cv2.cvtColor(heatmap, cv2.COLOR_RGB2BGR))
+    print(f"{grid.summary()['tiles_analyzed']} tiles -> {args.out}, heatmap -> {args.heatmap}")
@@ -0,0 +1,258 @@
+# modules/field_analysis/video_analyzer.py
+
+import argparse
+import json
+import math
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+
+import cv2
+
+from modules.stage_detection import abhi_predict
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor, extract_visual_features
+from modules.field_analysis.field_analyzer import collect_images
+from utils.preprocess import decode_image
+
+# --------------------------------------------------
+# Frame sources
+# --------------------------------------------------
+
+def iter_frames(source):
+    """
+    Yields (frame_index, timestamp_s, rgb_frame) one frame at a time.
+    source: a video file (anything OpenCV / FFMPEG can read), a directory
+    of images or a list of image paths (timestamp is None for images).
+    """
+    if isinstance(source, (str, os.PathLike)) and os.path.isfile(source) \
+            and not os.fspath(source).lower().endswith((".jpg", ".jpeg", ".png")):
+        cap = cv2.VideoCapture(os.fspath(source))
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video: {source}")
+        try:
+            index = 0
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                yield index, timestamp, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                index += 1
+        finally:
+            cap.release()
+        return
+
+    paths = [source] if isinstance(source, (str, os.PathLike)) and os.path.isfile(source) \
+        else collect_images(source)
+    for index, path in enumerate(paths):
+        yield index, None, decode_image(path)
+
+
+class FrameSampler:
+    """
+    Adaptive frame skipping. A frame is kept when its small grayscale
+    thumbnail differs from the last kept frame by more than `threshold`
+    (mean absolute difference, 0-255 scale), or when `max_skip` frames in
+    a row were dropped, so slow pans are still sampled now and then.
+    """
+
+    def __init__(self, threshold=6.0, max_skip=30, thumb_size=32):
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.thumb_size = thumb_size
+        self._last = None
+        self._skipped = 0
+
+    def _thumbnail(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+        return cv2.resize(gray, (self.thumb_size, self.thumb_size), interpolation=cv2.INTER_AREA)
+
+    def keep(self, frame):
+        thumb = self._thumbnail(frame)
+        if self._last is not None and self._skipped < self.max_skip:
+            diff = cv2.mean(cv2.absdiff(thumb, self._last))[0]
+            if diff < self.threshold:
+                self._skipped += 1
+                return False
+        self._last = thumb
+        self._skipped = 0
+        return True
+
+
+# --------------------------------------------------
+# Running aggregates (constant memory)
+# --------------------------------------------------
+
+class StreamAggregate:
+    """
+    Stage distribution, sub-stage histogram and harvest window over every
+    analyzed frame, updated per frame without keeping per-frame results.
+    """
+
+    def __init__(self):
+        self.frames_seen = 0
+        self.frames_analyzed = 0
+        self.crop_counts = Counter()
+        self.stage_counts = Counter()
+        self.substage_counts = Counter()
+        self._confidence_sum = 0.0
+        # Welford running mean / variance of the expected days to harvest
+        self._days_mean = 0.0
+        self._days_m2 = 0.0
+        self.earliest_days = math.inf
+        self.latest_days = -math.inf
+
+    def update(self, stage_result, harvest_result):
+        self.frames_analyzed += 1
+        stage = stage_result["stage"]
+        self.crop_counts[stage_result["crop"]] += 1
+        self.stage_counts[stage] += 1
+        self.substage_counts[(stage, harvest_result["sub_stage"])] += 1
+        self._confidence_sum += stage_result["stage_confidence"]
+
+        days = harvest_result["harvest_window_days"]
+        delta = days["expected"] - self._days_mean
+        self._days_mean += delta / self.frames_analyzed
+        self._days_m2 += delta * (days["expected"] - self._days_mean)
+        self.earliest_days = min(self.earliest_days, days["earliest"])
+        self.latest_days = max(self.latest_days, days["latest"])
+
+    def summary(self, today=None):
+        n = self.frames_analyzed
+        today = today or datetime.now()
+
+        def pct(count):
+            return round(100 * count / n, 1) if n else 0.0
+
+        def to_date(days):
+            return (today + timedelta(days=days)).strftime("%Y-%m-%d") if n else None
+
+        return {
+            "frames_seen": self.frames_seen,
+            "frames_analyzed": n,
+            "frames_skipped": self.frames_seen - n,
+            "dominant_crop": self.crop_counts.most_common(1)[0][0] if n else None,
+            "stage_distribution": {
+                stage: pct(self.stage_counts[stage]) for stage in abhi_predict.stages
+            },
+            "substage_distribution": {str(k): v for k, v in sorted(self.substage_counts.items())},
+            "average_stage_confidence": round(self._confidence_sum / n, 2) if n else 0.0,
+            "harvest_window": {
+                "earliest_days": round(self.earliest_days, 2) if n else None,
+                "expected_days": round(self._days_mean, 2) if n else None,
+                "expected_days_std": round(math.sqrt(self._days_m2 / n), 2) if n else None,
+                "latest_days": round(self.latest_days, 2) if n else None,
+                "earliest_date": to_date(self.earliest_days),
+                "expected_date": to_date(self._days_mean),
+                "latest_date": to_date(self.latest_days),
+            },
+        }
+
+
+# --------------------------------------------------
+# Streaming driver
+# --------------------------------------------------
+
+def iter_stream_results(
+    source,
+    batch_size=16,
+    sampler=None,
+    predictor=None,
+    aggregate=None,
+    feature_max_side=None,
+):
+    """
+    Yields one record per analyzed frame:
+    {"frame_index", "timestamp_s", "stage_detection", "harvest"}.
+    Only the kept frames of the current batch are held in memory; the
+    classifier and the harvest predictor each run once per batch.
+    sampler: FrameSampler (default settings) or False to analyze every frame.
+    aggregate: optional StreamAggregate updated as frames are analyzed.
+    feature_max_side: working resolution for the harvest features (see
+    extract_visual_features; None keeps full resolution).
+    """
+    if sampler is None:
+        sampler = FrameSampler()
+    predictor = predictor or HarvestPredictor()
+
+    def run(batch):
+        tensors = [tensor for _, _, tensor, _ in batch]
+        stage_results = abhi_predict.predict_tensors(tensors)
+        harvest = predictor.predict_from_features(
+            [features for _, _, _, features in batch],
+            [r["crop"] for r in stage_results],
+            [r["stage"] for r in stage_results],
+        )
+        for (index, timestamp, _, _), stage_result, harvest_result in zip(batch, stage_results, harvest):
+            if aggregate is not None:
+                aggregate.update(stage_result, harvest_result)
+            yield {
+                "frame_index": index,
+                "timestamp_s": None if timestamp is None else round(timestamp, 3),
+                "stage_detection": stage_result,
+                "harvest": harvest_result,
+            }
+
+    batch = []
+    for index, timestamp, frame in iter_frames(source):
+        if aggregate is not None:
+            aggregate.frames_seen += 1
+        if sampler and not sampler.keep(frame):
+            continue
+        # keep the 224x224 tensor and 5 feature scalars, not the frame
+        batch.append((
+            index, timestamp,
+            abhi_predict.preprocess(frame),
+            extract_visual_features(frame, max_side=feature_max_side),
+        ))
+        if len(batch) == batch_size:
+            yield from run(batch)
+            batch = []
+
+    if batch:
+        yield from run(batch)
+
+
+def analyze_stream(source, batch_size=16, sampler=None, predictor=None, feature_max_side=None, on_result=None):
+    """
+    Runs the whole video / sequence and returns StreamAggregate.summary().
+    on_result(record) is called for every analyzed frame.
+    """
+    aggregate = StreamAggregate()
+    for record in iter_stream_results(
+        source, batch_size, sampler, predictor, aggregate, feature_max_side
+    ):
+        if on_result is not None:
+            on_result(record)
+    return aggregate.summary()
+
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze a video or image sequence")
+    parser.add_argument("source", help="video file or image directory")
+    parser.add_argument("--out", default="video_analysis_results.json")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--threshold", type=float, default=6.0, help="min thumbnail change to keep a frame")
+    parser.add_argument("--max-skip", type=int, default=30)
+    parser.add_argument("--all-frames", action="store_true", help="disable frame skipping")
+    parser.add_argument("--feature-max-side", type=int, default=None)
+    parser.add_argument("--rf-model", default=None)
+    args = parser.parse_args()
+
+    sampler = False if args.all_frames else FrameSampler(args.threshold, args.max_skip)
+
+    def show(record):
+        s, h = record["stage_detection"], record["harvest"]
+        print(f"[frame {record['frame_index']}] {s['crop']} {s['stage']}/{h['sub_stage']}, "
+              f"{h['harvest_window_days']['expected']} days")
+
+    summary = analyze_stream(
+        args.source, args.batch_size, sampler, HarvestPredictor(args.rf_model),
+        args.feature_max_side, show,
+    )
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Analyzed {summary['frames_analyzed']} of {summary['frames_seen']} frames -> {args.out}")
@@ -1,11 +1,16 @@
 # modules/harvest_prediction/harvest_predictor.py
 
+import hashlib
+import io
+
 import cv2
 import numpy as np
 import joblib
 from datetime import datetime, timedelta
 from sklearn.preprocessing import LabelEncoder
 
+from utils.logger import instrument
+
 # --------------------------------------------------
 # Crop-specific base harvest durations (days)
 # --------------------------------------------------
@@ -37,20 +42,95 @@ BASE_HARVEST_DAYS = {
 # Feature Extraction
 # --------------------------------------------------
 
-def extract_visual_features(image_path):
-    img = cv2.imread(image_path)
+def _read_image(image):
+    """
+    Returns (pixels, channel_order). Paths are read with OpenCV (BGR),
+    bytes are decoded with OpenCV (BGR) and arrays are taken as already
+    decoded RGB uint8 images (H, W, 3), so they are not copied or converted.
+    """
+    if isinstance(image, np.ndarray):
+        return image, "RGB"
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        img = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("Invalid image bytes")
+        return img, "BGR"
+
+    img = cv2.imread(image)
     if img is None:
         raise ValueError("Invalid image path")
+    return img, "BGR"
+
+
+_COLOR_CODES = {
+    "BGR": (cv2.COLOR_BGR2HSV, cv2.COLOR_BGR2GRAY, cv2.COLOR_BGR2LAB),
+    "RGB": (cv2.COLOR_RGB2HSV, cv2.COLOR_RGB2GRAY, cv2.COLOR_RGB2LAB),
+}
+
 
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
+def _legacy_visual_features(img, order):
+    """
+    Original implementation (full-size HSV / gray / LAB copies and a
+    float64 Laplacian). Kept as the reference the fast path is checked
+    against.
+    """
+    to_hsv, to_gray, to_lab = _COLOR_CODES[order]
 
-    hue_mean = np.mean(hsv[:, :, 0])
-    sat_mean = np.mean(hsv[:, :, 1])
-    brightness_mean = np.mean(hsv[:, :, 2])
-    laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-    a_channel_mean = np.mean(lab[:, :, 1])
+    hsv = cv2.cvtColor(img, to_hsv)
+    gray = cv2.cvtColor(img, to_gray)
+    lab = cv2.cvtColor(img, to_lab)
+
+    return {
+        "hue": np.mean(hsv[:, :, 0]),
+        "saturation": np.mean(hsv[:, :, 1]),
+        "brightness": np.mean(hsv[:, :, 2]),
+        "laplacian": cv2.Laplacian(gray, cv2.CV_64F).var(),
+        "a_channel": np.mean(lab[:, :, 1]),
+    }
+
+
+def _downsample(img, max_side):
+    h, w = img.shape[:2]
+    scale = max_side / max(h, w)
+    if scale >= 1.0:
+        return img
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+@instrument("feature_extraction")
+def extract_visual_features(image_path, max_side=None):
+    """
+    image_path can be a file path, encoded image bytes or a decoded
+    RGB uint8 array (e.g. from utils.preprocess.decode_image).
+
+    Each colour space is converted once into a uint8 buffer and reduced
+    with cv2.mean / cv2.meanStdDev (double accumulators). The Laplacian
+    is computed as int16, which holds every 3x3 response of a uint8 image
+    exactly, so there is no full-size float64 intermediate. At full
+    resolution the values match the original implementation to float
+    rounding (~1e-9 relative).
+
+    max_side: optional working resolution. The image is first shrunk
+    (INTER_AREA) so its longest side is at most max_side. Measured on
+    assets/sample_tomato.jpg (12 MP) at max_side=1024: hue within 0.3,
+    saturation / brightness / a_channel within 0.02 of the full-size
+    values. The Laplacian variance is scale dependent (area averaging
+    removes fine texture, 85 -> 24 on that image), so the mango sub-stage
+    thresholds are only calibrated for max_side=None.
+    """
+    img, order = _read_image(image_path)
+    if max_side is not None:
+        img = _downsample(img, max_side)
+    to_hsv, to_gray, to_lab = _COLOR_CODES[order]
+
+    hue_mean, sat_mean, brightness_mean, _ = cv2.mean(cv2.cvtColor(img, to_hsv))
+    a_channel_mean = cv2.mean(cv2.cvtColor(img, to_lab))[1]
+
+    lap = cv2.Laplacian(cv2.cvtColor(img, to_gray), cv2.CV_16S)
+    _, lap_std = cv2.meanStdDev(lap)
+    laplacian_var = float(lap_std[0, 0]) ** 2
 
     return {
         "hue": hue_mean,
@@ -98,6 +178,97 @@ def classify_sub_stage(features, crop, stage):
 
     return "mid"
 
+
+# Feature and band thresholds classify_sub_stage decides on, per crop
+_SUB_STAGE_THRESHOLDS = {
+    "tomato": ("a_channel", 135, 150),
+    "papaya": ("a_channel", 135, 150),
+    "banana": ("hue", 40, 55),
+    "mango": ("laplacian", 80, 120),
+}
+
+
+def sub_stage_confidence(features, crop, stage):
+    """
+    How clear-cut classify_sub_stage's answer is, 0.5 - 1.0: 0.5 right on
+    a band threshold, 1.0 half a band width or more away from both.
+    Ripe fruit is always "late" (1.0).
+    """
+    if stage == "ripe":
+        return 1.0
+    if crop not in _SUB_STAGE_THRESHOLDS:
+        return 0.5
+    name, low, high = _SUB_STAGE_THRESHOLDS[crop]
+    margin = min(abs(features[name] - low), abs(features[name] - high))
+    return round(0.5 + 0.5 * min(1.0, margin / ((high - low) / 2)), 2)
+
+# --------------------------------------------------
+# Flat Random Forest (all trees walked at once)
+# --------------------------------------------------
+
+class _FlatForest:
+    """
+    The node arrays of every tree of a fitted sklearn forest regressor,
+    concatenated. predict_trees(X) walks all (tree, row) pairs together,
+    one NumPy step per tree level, instead of one tree.predict call per
+    tree. Leaves point to themselves, so extra steps are no-ops.
+    Same comparisons as sklearn (X cast to float32, x <= threshold goes
+    left), so the per-tree predictions are identical.
+    """
+
+    def __init__(self, forest):
+        feature, threshold, left, right, missing_left, value, roots = [], [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            if tree.n_outputs != 1:
+                raise ValueError("Only single-output forests are supported")
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            own = np.arange(offset, offset + n)
+            roots.append(offset)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(tree.threshold)
+            left.append(np.where(is_leaf, own, tree.children_left + offset))
+            right.append(np.where(is_leaf, own, tree.children_right + offset))
+            missing = getattr(tree, "missing_go_to_left", None)
+            missing_left.append(np.zeros(n, dtype=bool) if missing is None else missing.astype(bool))
+            value.append(tree.value[:, 0, 0])
+            max_depth = max(max_depth, tree.max_depth)
+            offset += n
+
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold)
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.missing_left = np.concatenate(missing_left)
+        self.value = np.concatenate(value)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = max_depth
+
+    def predict_trees(self, X, chunk_rows=4096):
+        """
+        X: (rows, features) -> (trees, rows) per-tree predictions.
+        """
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        out = np.empty((len(self.roots), X.shape[0]), dtype=np.float64)
+        for start in range(0, X.shape[0], chunk_rows):
+            chunk = X[start:start + chunk_rows]
+            flat = chunk.ravel()
+            row_offsets = np.arange(chunk.shape[0]) * chunk.shape[1]
+            nodes = np.repeat(self.roots[:, None], chunk.shape[0], axis=1)
+            for _ in range(self.max_depth):
+                x = flat[self.feature[nodes] + row_offsets]
+                go_left = x <= self.threshold[nodes]
+                missing = np.isnan(x)
+                if missing.any():
+                    go_left = np.where(missing, self.missing_left[nodes], go_left)
+                nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+            out[:, start:start + chunk_rows] = self.value[nodes]
+        return out
+
+
 # --------------------------------------------------
 # Harvest Predictor Class
 # --------------------------------------------------
@@ -105,9 +276,13 @@ def classify_sub_stage(features, crop, stage):
 class HarvestPredictor:
     """
     Random Forest based harvest predictor with window estimation
+
+    window_quantiles: optional (low, high) quantiles of the per-tree
+    predictions used as earliest / latest (e.g. (0.1, 0.9)).
+    Default None keeps the min / max of all trees.
     """
 
-    def __init__(self, rf_model_path=None):
+    def __init__(self, rf_model_path=None, window_quantiles=None):
         self.crop_encoder = LabelEncoder()
         self.stage_encoder = LabelEncoder()
         self.substage_encoder = LabelEncoder()
@@ -116,46 +291,111 @@ class HarvestPredictor:
         self.stage_encoder.fit(["unripe", "semiripe", "ripe"])
         self.substage_encoder.fit(["early", "mid", "late"])
 
+        # Label -> code lookups, so building X does not call transform per image
+        self._crop_codes = {c: i for i, c in enumerate(self.crop_encoder.classes_)}
+        self._stage_codes = {s: i for i, s in enumerate(self.stage_encoder.classes_)}
+        self._substage_codes = {s: i for i, s in enumerate(self.substage_encoder.classes_)}
+
+        if window_quantiles is not None:
+            low, high = window_quantiles
+            if not 0.0 <= low <= high <= 1.0:
+                raise ValueError("window_quantiles must satisfy 0 <= low <= high <= 1")
+        self.window_quantiles = window_quantiles
+
+        self.rf_model_path = rf_model_path
         if rf_model_path:
-            self.rf = joblib.load(rf_model_path)
+            with open(rf_model_path, "rb") as f:
+                data = f.read()
+            self.rf = joblib.load(io.BytesIO(data))
+            self._forest = _FlatForest(self.rf)
+            # what was loaded, not what is on disk now (result cache key)
+            self.model_version = f"rf:{hashlib.sha256(data).hexdigest()[:16]}"
         else:
             self.rf = None  # fallback to rule-based
+            self._forest = None
+            self.model_version = "rule-based"
 
     # --------------------------------------------------
 
     def predict(self, image_path, crop, stage):
-        features = extract_visual_features(image_path)
-        sub_stage = classify_sub_stage(features, crop, stage)
-
-        base_days = BASE_HARVEST_DAYS[crop][stage][sub_stage]
-
-        # ML feature vector
-        X = np.array([[
-            self.crop_encoder.transform([crop])[0],
-            self.stage_encoder.transform([stage])[0],
-            self.substage_encoder.transform([sub_stage])[0],
-            features["hue"],
-            features["saturation"],
-            features["brightness"],
-            features["laplacian"],
-        ]])
-
-        # --------------------------------------------------
-        # Random Forest Harvest Window
-        # --------------------------------------------------
-
-        if self.rf:
-            tree_preds = np.array([tree.predict(X)[0] for tree in self.rf.estimators_])
-            min_days = float(np.min(tree_preds))
-            avg_days = float(np.mean(tree_preds))
-            max_days = float(np.max(tree_preds))
+        return self.predict_many([image_path], [crop], [stage])[0]
+
+    def predict_many(self, images, crops, stages):
+        """
+        Batched predict: one result dict per image, in input order.
+        images / crops / stages are equal length sequences.
+        """
+        features = [extract_visual_features(image) for image in images]
+        return self.predict_from_features(features, crops, stages)
+
+    @instrument("harvest_prediction")
+    def predict_from_features(self, features, crops, stages):
+        """
+        Same as predict_many but starts from already extracted
+        extract_visual_features dicts.
+        """
+        if not len(features) == len(crops) == len(stages):
+            raise ValueError("features, crops and stages must have the same length")
+        if not features:
+            return []
+
+        sub_stages = [
+            classify_sub_stage(f, crop, stage)
+            for f, crop, stage in zip(features, crops, stages)
+        ]
+
+        if self.rf is not None:
+            X = self._feature_matrix(features, crops, stages, sub_stages)
+            min_days, avg_days, max_days = self._forest_window(X)
         else:
             # Rule-based fallback
-            min_days = base_days * 0.8
-            avg_days = base_days
-            max_days = base_days * 1.2
+            avg_days = np.array([
+                BASE_HARVEST_DAYS[crop][stage][sub_stage]
+                for crop, stage, sub_stage in zip(crops, stages, sub_stages)
+            ])
+            min_days = avg_days * 0.8
+            max_days = avg_days * 1.2
 
         today = datetime.now()
+        return [
+            self._format_result(crop, stage, sub_stage, float(lo), float(mid), float(hi), today)
+            for crop, stage, sub_stage, lo, mid, hi
+            in zip(crops, stages, sub_stages, min_days, avg_days, max_days)
+        ]
+
+    # --------------------------------------------------
+    # ML feature matrix (N x 7)
+    # --------------------------------------------------
+
+    def _feature_matrix(self, features, crops, stages, sub_stages):
+        X = np.empty((len(features), 7), dtype=np.float64)
+        X[:, 0] = [self._crop_codes[c] for c in crops]
+        X[:, 1] = [self._stage_codes[s] for s in stages]
+        X[:, 2] = [self._substage_codes[s] for s in sub_stages]
+        X[:, 3:] = [
+            [f["hue"], f["saturation"], f["brightness"], f["laplacian"]]
+            for f in features
+        ]
+        return X
+
+    # --------------------------------------------------
+    # Random Forest Harvest Window
+    # --------------------------------------------------
+
+    def _forest_window(self, X):
+        # trees x samples, all trees walked in one vectorized pass
+        tree_preds = self._forest.predict_trees(X)
+
+        avg_days = tree_preds.mean(axis=0)
+        if self.window_quantiles is None:
+            min_days = tree_preds.min(axis=0)
+            max_days = tree_preds.max(axis=0)
+        else:
+            min_days, max_days = np.quantile(tree_preds, self.window_quantiles, axis=0)
+        return min_days, avg_days, max_days
+
+    @staticmethod
+    def _format_result(crop, stage, sub_stage, min_days, avg_days, max_days, today):
         return {
             "crop": crop,
             "stage": stage,
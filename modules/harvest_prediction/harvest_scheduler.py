@@ -0,0 +1,193 @@
+# modules/harvest_prediction/harvest_scheduler.py
+
+import heapq
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+# --------------------------------------------------
+# Helpers
+# --------------------------------------------------
+
+def _to_ordinal(day):
+    if isinstance(day, datetime):
+        return day.date().toordinal()
+    if isinstance(day, date):
+        return day.toordinal()
+    return datetime.strptime(day, "%Y-%m-%d").date().toordinal()
+
+
+def _to_iso(ordinal):
+    return date.fromordinal(ordinal).isoformat()
+
+
+# --------------------------------------------------
+# Centered interval tree (static, rebuilt when plots change)
+# --------------------------------------------------
+
+class _IntervalTree:
+    """
+    Stabbing queries in O(log n + k). Built in O(n log n) from
+    (start, end, plot_id) tuples with inclusive day ordinals.
+    """
+
+    def __init__(self, intervals):
+        self.root = self._build(intervals)
+
+    def _build(self, intervals):
+        if not intervals:
+            return None
+        points = sorted(p for start, end, _ in intervals for p in (start, end))
+        center = points[len(points) // 2]
+
+        left, right, here = [], [], []
+        for iv in intervals:
+            if iv[1] < center:
+                left.append(iv)
+            elif iv[0] > center:
+                right.append(iv)
+            else:
+                here.append(iv)
+
+        return {
+            "center": center,
+            # intervals containing center, by start asc and by end desc
+            "by_start": sorted(here, key=lambda iv: iv[0]),
+            "by_end": sorted(here, key=lambda iv: iv[1], reverse=True),
+            "left": self._build(left),
+            "right": self._build(right),
+        }
+
+    def stab(self, point):
+        found = []
+        node = self.root
+        while node is not None:
+            if point < node["center"]:
+                for iv in node["by_start"]:
+                    if iv[0] > point:
+                        break
+                    found.append(iv[2])
+                node = node["left"]
+            elif point > node["center"]:
+                for iv in node["by_end"]:
+                    if iv[1] < point:
+                        break
+                    found.append(iv[2])
+                node = node["right"]
+            else:
+                found.extend(iv[2] for iv in node["by_start"])
+                break
+        return found
+
+
+# --------------------------------------------------
+# Scheduler
+# --------------------------------------------------
+
+class HarvestScheduler:
+    """
+    Aggregates per-plot harvest windows (earliest / latest dates, inclusive)
+    and answers:
+      - which plots are harvestable on day D   (interval tree, O(log n + k))
+      - how many plots are harvestable on D    (two bisects, O(log n))
+      - minimum crew-days covering every window, with an optional number
+        of plots one crew can harvest per day (greedy sweep, O(n log n))
+    Adding or replacing a plot only marks the indexes dirty; they are rebuilt
+    on the next query, so re-planning after new images is a single rebuild.
+    """
+
+    def __init__(self):
+        self._windows = {}
+        self._dirty = True
+        self._tree = None
+        self._starts = []
+        self._ends = []
+
+    def __len__(self):
+        return len(self._windows)
+
+    # ---------------- ingest ----------------
+
+    def add_window(self, plot_id, earliest, latest):
+        start, end = _to_ordinal(earliest), _to_ordinal(latest)
+        if end < start:
+            raise ValueError(f"Plot {plot_id}: latest is before earliest")
+        self._windows[plot_id] = (start, end)
+        self._dirty = True
+
+    def add_prediction(self, plot_id, harvest_result):
+        """
+        harvest_result: output of HarvestPredictor.predict for the plot.
+        """
+        dates = harvest_result["harvest_window_dates"]
+        self.add_window(plot_id, dates["earliest"], dates["latest"])
+
+    def remove(self, plot_id):
+        del self._windows[plot_id]
+        self._dirty = True
+
+    # ---------------- queries ----------------
+
+    def harvestable_on(self, day):
+        self._rebuild()
+        plots = self._tree.stab(_to_ordinal(day))
+        try:
+            return sorted(plots)
+        except TypeError:  # mixed id types
+            return sorted(plots, key=str)
+
+    def count_harvestable_on(self, day):
+        self._rebuild()
+        d = _to_ordinal(day)
+        # started on or before d, minus those already over before d
+        return bisect_right(self._starts, d) - bisect_left(self._ends, d)
+
+    def plan(self, crew_capacity=None):
+        """
+        Minimum number of crew-days so that every plot is harvested inside
+        its window. A crew-day harvests up to crew_capacity plots (None =
+        unlimited). Crews go out as late as possible (on the earliest
+        pending deadline) and take the most urgent available plots first,
+        which is optimal for this unit-job problem.
+        Returns [{"date": "YYYY-MM-DD", "plots": [...]}, ...] in date order.
+        """
+        if crew_capacity is not None and crew_capacity < 1:
+            raise ValueError("crew_capacity must be >= 1")
+
+        by_start = sorted(self._windows.items(), key=lambda kv: kv[1][0])
+        pending = []  # (end, tiebreak, plot_id)
+        crew_days = []
+        i = 0
+
+        while i < len(by_start) or pending:
+            if not pending:
+                end = by_start[i][1][1]
+                heapq.heappush(pending, (end, i, by_start[i][0]))
+                i += 1
+
+            # Pull in every plot that opens before the most urgent deadline
+            while i < len(by_start) and by_start[i][1][0] <= pending[0][0]:
+                end = by_start[i][1][1]
+                heapq.heappush(pending, (end, i, by_start[i][0]))
+                i += 1
+
+            day = pending[0][0]
+            while pending and pending[0][0] == day:
+                take = len(pending) if crew_capacity is None else crew_capacity
+                plots = [heapq.heappop(pending)[2] for _ in range(min(take, len(pending)))]
+                crew_days.append({"date": _to_iso(day), "plots": plots})
+
+        return crew_days
+
+    def min_crew_days(self, crew_capacity=None):
+        return len(self.plan(crew_capacity))
+
+    # ---------------- internals ----------------
+
+    def _rebuild(self):
+        if not self._dirty:
+            return
+        intervals = [(s, e, pid) for pid, (s, e) in self._windows.items()]
+        self._tree = _IntervalTree(intervals)
+        self._starts = sorted(s for s, _, _ in intervals)
+        self._ends = sorted(e for _, e, _ in intervals)
+        self._dirty = False
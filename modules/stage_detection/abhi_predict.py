@@ -3,7 +3,13 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torchvision import transforms, models
 from PIL import Image
+import numpy as np
+import hashlib
+import io
 import os
+import threading
+
+from utils.logger import timed
 
 # =========================
 # Labels (same as training)
@@ -15,7 +21,6 @@ stages = ["unripe", "semiripe", "ripe"]
 # Device
 # =========================
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print("Using device:", device)
 
 # =========================
 # Image Transform
@@ -32,15 +37,13 @@ transform = transforms.Compose([
 # =========================
 # Model Architecture
 # =========================
-base_model = models.resnet18(
-    weights=models.ResNet18_Weights.IMAGENET1K_V1
-)
-num_ftrs = base_model.fc.in_features
-
-
 class MultiOutputModel(nn.Module):
     def __init__(self):
         super().__init__()
+        # No pretrained weights: everything is overwritten by the checkpoint
+        base_model = models.resnet18(weights=None)
+        num_ftrs = base_model.fc.in_features
+
         self.shared = nn.Sequential(*list(base_model.children())[:-1])
         self.crop_head = nn.Linear(num_ftrs, len(crops))
         self.stage_head = nn.Linear(num_ftrs, len(stages))
@@ -54,46 +57,185 @@ class MultiOutputModel(nn.Module):
 
 
 # =========================
-# Load Model (FIXED PATH)
+# Load Model (lazily, only once)
 # =========================
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "ripeness_model.pth")
 
-model = MultiOutputModel().to(device)
-model.load_state_dict(torch.load(MODEL_PATH, map_location=device))
-model.eval()
+_model = None
+_model_lock = threading.Lock()
+# (model, tag) of the last model installed by get_model / use_model
+_tagged_model = (None, None)
+
+
+def get_model():
+    """
+    Returns the shared MultiOutputModel, building it and loading the
+    checkpoint on first use. Safe to call from several threads.
+    The model is tagged with a hash of the bytes it was loaded from, so
+    replacing the file later does not relabel the weights in memory.
+    """
+    global _model, _tagged_model
+
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                with open(MODEL_PATH, "rb") as f:
+                    data = f.read()
+                model = MultiOutputModel().to(device)
+                model.load_state_dict(torch.load(io.BytesIO(data), map_location=device))
+                model.eval()
+                _tagged_model = (model, f"checkpoint:{hashlib.sha256(data).hexdigest()[:16]}")
+                _model = model
+
+    return _model
+
+
+def use_model(model, tag=None):
+    """
+    Replaces the shared model (e.g. with an optimized CPU build from
+    cpu_inference.build_fast_model). It must return (crop_logits,
+    stage_logits) for a (B, 3, 224, 224) batch like MultiOutputModel.
+    tag: short string naming what the model is (e.g. "checkpoint+int8"),
+    used by result caches; without one, stage results are not cached.
+    """
+    global _model, _tagged_model
+    with _model_lock:
+        _tagged_model = (model, tag)
+        _model = model
+
+
+def model_tag():
+    """
+    Tag of the active model: "checkpoint:<sha256 prefix>" when get_model
+    loaded ripeness_model.pth, the tag given to use_model, or None when the
+    model is unknown (untagged, or replaced some other way).
+    """
+    model, tag = _tagged_model
+    return tag if model is not None and model is _model else None
+
+
+def warmup():
+    """
+    Loads the model and runs one dummy forward pass so the first real
+    request does not pay for it (e.g. call at app / worker start).
+    """
+    model = get_model()
+    with torch.inference_mode():
+        model(torch.zeros(1, 3, 224, 224, device=device))
+
+
+# =====================================================
+# Helpers shared by single and batched inference
+# =====================================================
+def _load_image(image):
+    """
+    Accepts an image path, raw bytes, a PIL image or an already decoded
+    uint8 array (H, W, 3) RGB, (H, W) grayscale or (H, W, 4) RGBA.
+    """
+    if isinstance(image, Image.Image):
+        return image.convert("RGB")
+
+    if isinstance(image, np.ndarray):
+        pil = Image.fromarray(image)
+        # RGB arrays skip convert's copy
+        return pil if pil.mode == "RGB" else pil.convert("RGB")
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(image)).convert("RGB")
+
+    if not os.path.isfile(image):
+        raise FileNotFoundError(f"Image not found: {image}")
+
+    return Image.open(image).convert("RGB")
+
+
+def _format_results(outputs_crop, outputs_stage):
+    """
+    Turns raw head outputs of shape (B, C) into one result dict per row.
+    """
+    crop_probs = F.softmax(outputs_crop, dim=1)
+    stage_probs = F.softmax(outputs_stage, dim=1)
+
+    crop_conf, crop_idx = crop_probs.max(dim=1)
+    stage_conf, stage_idx = stage_probs.max(dim=1)
+
+    results = []
+    for c_idx, c_conf, s_idx, s_conf in zip(
+        crop_idx.tolist(), crop_conf.tolist(),
+        stage_idx.tolist(), stage_conf.tolist(),
+    ):
+        results.append({
+            "crop": crops[c_idx],
+            "stage": stages[s_idx],
+            "crop_confidence": round(c_conf * 100, 2),
+            "stage_confidence": round(s_conf * 100, 2)
+        })
+    return results
 
-print("Model loaded successfully.")
 
 # =====================================================
 # PIPELINE-SAFE FUNCTION (THIS IS WHAT YOU WILL USE)
 # =====================================================
-def predict_image(image_path: str):
+def predict_image(image_path):
     """
     Pipeline-safe function.
-    Takes image path and returns crop + stage + confidence.
+    Takes image path (or bytes / PIL image / decoded RGB array)
+    and returns crop + stage + confidence.
     """
 
-    if not os.path.isfile(image_path):
-        raise FileNotFoundError(f"Image not found: {image_path}")
+    image_tensor = preprocess(image_path).unsqueeze(0).to(device)
+
+    with timed("model_forward"), torch.inference_mode():
+        outputs_crop, outputs_stage = get_model()(image_tensor)
 
-    image = Image.open(image_path).convert("RGB")
-    image_tensor = transform(image).unsqueeze(0).to(device)
+    return _format_results(outputs_crop, outputs_stage)[0]
 
-    with torch.no_grad():
-        outputs_crop, outputs_stage = model(image_tensor)
 
-        crop_probs = F.softmax(outputs_crop, dim=1)
-        stage_probs = F.softmax(outputs_stage, dim=1)
+def predict_images(paths_or_images, batch_size: int = 32):
+    """
+    Batched version of predict_image.
+    Takes an iterable of images (anything predict_image accepts), runs
+    the model on stacks of up to batch_size images and yields one result
+    dict per input, in input order (same shape as predict_image).
+    """
+
+    if batch_size < 1:
+        raise ValueError("batch_size must be >= 1")
+
+    batch = []
+    for item in paths_or_images:
+        batch.append(preprocess(item))
+        if len(batch) == batch_size:
+            yield from predict_tensors(batch)
+            batch = []
+
+    if batch:
+        yield from predict_tensors(batch)
+
+
+def preprocess(image):
+    """
+    Anything predict_image accepts -> normalized (3, 224, 224) tensor.
+    """
+    with timed("preprocess"):
+        return transform(_load_image(image))
+
+
+def predict_tensors(tensors):
+    """
+    Runs the model once on a list of preprocessed (3, 224, 224) tensors
+    (or an already stacked (B, 3, 224, 224) tensor, used as is) and
+    returns one result dict per tensor.
+    """
+    if torch.is_tensor(tensors):
+        batch_tensor = tensors.to(device, torch.float32)
+    else:
+        batch_tensor = torch.stack(tensors).to(device)
 
-        crop_idx = crop_probs.argmax(dim=1).item()
-        stage_idx = stage_probs.argmax(dim=1).item()
+    with timed("model_forward"), torch.inference_mode():
+        outputs_crop, outputs_stage = get_model()(batch_tensor)
 
-    return {
-        "crop": crops[crop_idx],
-        "stage": stages[stage_idx],
-        "crop_confidence": round(crop_probs[0][crop_idx].item() * 100, 2),
-        "stage_confidence": round(stage_probs[0][stage_idx].item() * 100, 2)
-    }
+    return _format_results(outputs_crop, outputs_stage)
 
 # =====================================================
 # CLI MODE (ONLY RUNS WHEN FILE IS EXECUTED DIRECTLY)
@@ -0,0 +1,256 @@
+# modules/stage_detection/cascade.py
+
+import argparse
+import threading
+
+import joblib
+import numpy as np
+from sklearn.dummy import DummyClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from modules.stage_detection import abhi_predict
+from modules.harvest_prediction.harvest_predictor import extract_visual_features
+from utils.preprocess import decode_image
+
+FEATURE_NAMES = ("hue", "saturation", "brightness", "laplacian", "a_channel")
+
+
+def _feature_row(features):
+    row = [features[name] for name in FEATURE_NAMES]
+    row[3] = np.log1p(row[3])  # Laplacian variance spans orders of magnitude
+    return row
+
+
+def _fit_head(X, labels):
+    if len(set(labels)) == 1:
+        # nothing to separate, always answer the only label seen
+        return DummyClassifier(strategy="prior").fit(X, labels)
+    return make_pipeline(StandardScaler(), LogisticRegression(max_iter=1000)).fit(X, labels)
+
+
+# =========================
+# Early-exit cascade
+# =========================
+class FeatureCascade:
+    """
+    Two-stage crop / stage classifier. A small logistic regression on the
+    extract_visual_features colour statistics (computed at max_side, so
+    cheap) answers an image when both its crop and its stage probability
+    reach `threshold`; every other image goes through the full ResNet18.
+
+    The small heads are fitted on the full model's own predictions
+    (fit / fit_features), so they learn where the network is easy to
+    imitate, no labelled data needed.
+
+    predict_image / predict_images return predict_image-style dicts plus
+    "early_exit": True / False, so cascade.predict_image can be passed as
+    analyze_image(classify=...).
+
+    audit_rate: fraction of early exits that are also run through the full
+    model to count agreement (0 = never, 1 = always).
+    """
+
+    def __init__(self, crop_head, stage_head, threshold=0.9, max_side=256, audit_rate=0.0):
+        if not 0.0 <= audit_rate <= 1.0:
+            raise ValueError("audit_rate must be between 0 and 1")
+        self.crop_head = crop_head
+        self.stage_head = stage_head
+        self.threshold = threshold
+        self.max_side = max_side
+        self.audit_rate = audit_rate
+        self._lock = threading.Lock()
+        self._heads_hash = joblib.hash((crop_head, stage_head))
+        self.reset_stats()
+
+    @property
+    def cache_tag(self):
+        # what the answers depend on besides the full model (utils.cache)
+        return f"heads={self._heads_hash[:12]},threshold={self.threshold},max_side={self.max_side}"
+
+    # ---------------- training ----------------
+
+    @classmethod
+    def fit_features(cls, features, full_results, **kwargs):
+        """
+        features: extract_visual_features dicts (at the max_side used later),
+        full_results: abhi_predict.predict_image results for the same images.
+        """
+        X = np.array([_feature_row(f) for f in features], dtype=np.float64)
+        if len(X) == 0:
+            raise ValueError("no images to fit on")
+        crop_head = _fit_head(X, [r["crop"] for r in full_results])
+        stage_head = _fit_head(X, [r["stage"] for r in full_results])
+        return cls(crop_head, stage_head, **kwargs)
+
+    @classmethod
+    def fit(cls, images, batch_size=32, max_side=256, **kwargs):
+        """
+        Runs the full model and the feature extractor on `images` (paths,
+        bytes or arrays) and fits the small heads to the model's answers.
+        """
+        features, results = [], []
+        batch = []
+
+        def run():
+            results.extend(abhi_predict.predict_tensors([t for t, _ in batch]))
+            features.extend(f for _, f in batch)
+
+        for image in images:
+            pixels = decode_image(image)
+            batch.append((abhi_predict.preprocess(pixels), extract_visual_features(pixels, max_side=max_side)))
+            if len(batch) == batch_size:
+                run()
+                batch = []
+        if batch:
+            run()
+        return cls.fit_features(features, results, max_side=max_side, **kwargs)
+
+    def save(self, path):
+        joblib.dump({
+            "crop_head": self.crop_head,
+            "stage_head": self.stage_head,
+            "threshold": self.threshold,
+            "max_side": self.max_side,
+        }, path)
+
+    @classmethod
+    def load(cls, path, **overrides):
+        """
+        overrides: threshold / max_side / audit_rate replacing the saved values.
+        """
+        saved = joblib.load(path)
+        kwargs = {"threshold": saved["threshold"], "max_side": saved["max_side"], **overrides}
+        return cls(saved["crop_head"], saved["stage_head"], **kwargs)
+
+    # ---------------- inference ----------------
+
+    def _cheap(self, feature_dicts):
+        """
+        -> list of (result dict, confident) from the small heads.
+        """
+        X = np.array([_feature_row(f) for f in feature_dicts], dtype=np.float64)
+        crop_probs = self.crop_head.predict_proba(X)
+        stage_probs = self.stage_head.predict_proba(X)
+        crop_idx, stage_idx = crop_probs.argmax(axis=1), stage_probs.argmax(axis=1)
+        crop_conf = crop_probs[np.arange(len(X)), crop_idx]
+        stage_conf = stage_probs[np.arange(len(X)), stage_idx]
+
+        out = []
+        for c, cc, s, sc in zip(crop_idx, crop_conf, stage_idx, stage_conf):
+            result = {
+                "crop": str(self.crop_head.classes_[c]),
+                "stage": str(self.stage_head.classes_[s]),
+                "crop_confidence": round(float(cc) * 100, 2),
+                "stage_confidence": round(float(sc) * 100, 2),
+                "early_exit": True,
+            }
+            out.append((result, min(cc, sc) >= self.threshold))
+        return out
+
+    def predict_images(self, images):
+        """
+        images: list of anything predict_image accepts. The full model runs
+        once, on the stack of images the small heads were not sure about
+        (plus the audited early exits).
+        """
+        pixels = [decode_image(image) for image in images]
+        cheap = self._cheap([extract_visual_features(p, max_side=self.max_side) for p in pixels])
+
+        results, full_idx, audit_idx = [None] * len(pixels), [], []
+        with self._lock:
+            for i, (result, confident) in enumerate(cheap):
+                self._counts["images"] += 1
+                if confident:
+                    self._counts["early_exits"] += 1
+                    results[i] = result
+                    if self._should_audit():
+                        audit_idx.append(i)
+                else:
+                    full_idx.append(i)
+
+        run = full_idx + audit_idx
+        if run:
+            full = abhi_predict.predict_tensors([abhi_predict.preprocess(pixels[i]) for i in run])
+            for i, result in zip(full_idx, full):
+                results[i] = {**result, "early_exit": False}
+            with self._lock:
+                for i, result in zip(audit_idx, full[len(full_idx):]):
+                    self._counts["audited"] += 1
+                    self._counts["crop_agree"] += result["crop"] == results[i]["crop"]
+                    self._counts["stage_agree"] += result["stage"] == results[i]["stage"]
+        return results
+
+    def predict_image(self, image):
+        return self.predict_images([image])[0]
+
+    # ---------------- counters ----------------
+
+    def _should_audit(self):
+        # deterministic sampling: every 1/audit_rate-th early exit
+        if self.audit_rate <= 0:
+            return False
+        self._audit_credit += self.audit_rate
+        if self._audit_credit >= 1.0:
+            self._audit_credit -= 1.0
+            return True
+        return False
+
+    def reset_stats(self):
+        with self._lock:
+            self._counts = {"images": 0, "early_exits": 0, "audited": 0, "crop_agree": 0, "stage_agree": 0}
+            self._audit_credit = 0.0
+
+    def stats(self):
+        """
+        Early-exit rate and, over the audited early exits, how often the
+        small heads agreed with the full model.
+        """
+        with self._lock:
+            c = dict(self._counts)
+        audited = c["audited"]
+        c["early_exit_rate"] = round(c["early_exits"] / c["images"], 4) if c["images"] else 0.0
+        c["crop_agreement"] = round(c["crop_agree"] / audited, 4) if audited else None
+        c["stage_agreement"] = round(c["stage_agree"] / audited, 4) if audited else None
+        c["threshold"] = self.threshold
+        return c
+
+
+# =====================================================
+# CLI: fit a cascade / report early-exit rate and agreement
+# =====================================================
+if __name__ == "__main__":
+    from modules.field_analysis.field_analyzer import collect_images
+
+    parser = argparse.ArgumentParser(description="Feature cascade in front of the stage model")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    f = sub.add_parser("fit", help="fit the small heads on the full model's predictions")
+    f.add_argument("images", help="image directory")
+    f.add_argument("--out", default="stage_cascade.joblib")
+    f.add_argument("--threshold", type=float, default=0.9)
+    f.add_argument("--max-side", type=int, default=256)
+
+    r = sub.add_parser("report", help="early-exit rate and agreement (every early exit audited)")
+    r.add_argument("cascade")
+    r.add_argument("images", help="image directory")
+    r.add_argument("--threshold", type=float, nargs="+", default=None)
+    r.add_argument("--batch-size", type=int, default=32)
+
+    args = parser.parse_args()
+
+    if args.command == "fit":
+        cascade = FeatureCascade.fit(collect_images(args.images), threshold=args.threshold, max_side=args.max_side)
+        cascade.save(args.out)
+        print(f"cascade saved to {args.out}")
+    else:
+        paths = collect_images(args.images)
+        for threshold in args.threshold or [None]:
+            overrides = {"audit_rate": 1.0}
+            if threshold is not None:
+                overrides["threshold"] = threshold
+            cascade = FeatureCascade.load(args.cascade, **overrides)
+            for start in range(0, len(paths), args.batch_size):
+                cascade.predict_images(paths[start:start + args.batch_size])
+            print(cascade.stats())
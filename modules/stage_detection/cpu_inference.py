@@ -0,0 +1,203 @@
+# modules/stage_detection/cpu_inference.py
+
+import argparse
+import copy
+import hashlib
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from PIL import Image
+
+from modules.stage_detection import abhi_predict
+from utils.cache import image_digest
+
+QUANTIZE_MODES = (None, "dynamic", "static")
+
+# =========================
+# Optimized CPU model builds
+# =========================
+class _ChannelsLastInput(nn.Module):
+    """
+    Converts the NCHW input to channels_last before the wrapped model,
+    so callers keep passing normal tensors.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x.contiguous(memory_format=torch.channels_last))
+
+
+def _batches(images, batch_size):
+    batch = []
+    for image in images:
+        batch.append(abhi_predict.transform(abhi_predict._load_image(image)))
+        if len(batch) == batch_size:
+            yield torch.stack(batch)
+            batch = []
+    if batch:
+        yield torch.stack(batch)
+
+
+def build_fast_model(
+    model,
+    quantize=None,
+    channels_last=True,
+    trace=True,
+    calibration_images=None,
+    batch_size=8,
+):
+    """
+    Returns an inference-only copy of a MultiOutputModel for CPU.
+
+    quantize:
+      None      - fp32
+      "dynamic" - int8 weights for the Linear heads only (conv layers are
+                  not supported by dynamic quantization, small gain)
+      "static"  - full int8 (FX graph mode, x86 backend) calibrated on
+                  calibration_images; this is where the big CPU win is
+    channels_last: NHWC memory format for the fp32 / dynamic builds
+    trace: torch.jit.trace + freeze the result into a static graph
+    """
+    if quantize not in QUANTIZE_MODES:
+        raise ValueError(f"quantize must be one of {QUANTIZE_MODES}")
+
+    model = copy.deepcopy(model).cpu().eval()
+    example = torch.zeros(1, 3, 224, 224)
+
+    if quantize == "static":
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        if not calibration_images:
+            raise ValueError("static quantization needs calibration_images")
+
+        prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), (example,))
+        with torch.inference_mode():
+            for batch in _batches(calibration_images, batch_size):
+                prepared(batch)
+        model = convert_fx(prepared)
+    else:
+        if quantize == "dynamic":
+            model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+        if channels_last:
+            model = _ChannelsLastInput(model.to(memory_format=torch.channels_last))
+
+    if trace:
+        with torch.no_grad():
+            model = torch.jit.freeze(torch.jit.trace(model, example).eval())
+
+    return model
+
+
+def _calibration_digest(images):
+    # content of the calibration set: int8 builds calibrated on other
+    # images must not share cached results
+    h = hashlib.sha256()
+    for image in images:
+        h.update(image_digest(np.asarray(image) if isinstance(image, Image.Image) else image).encode())
+    return h.hexdigest()[:16]
+
+
+def enable_fast_inference(threads=None, **build_kwargs):
+    """
+    Opt-in fast mode: builds the optimized model from the checkpoint and
+    makes predict_image / predict_images use it. threads sets the torch
+    intra-op thread count. Returns the fp32 model for comparisons.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+
+    reference = abhi_predict.get_model()
+    reference_tag = abhi_predict.model_tag()
+    tag = None
+    if build_kwargs.get("calibration_images") is not None:
+        # read once for both the digest and the calibration pass
+        build_kwargs["calibration_images"] = list(build_kwargs["calibration_images"])
+    if reference_tag is not None:
+        options = [f"{k}={build_kwargs[k]}" for k in sorted(build_kwargs) if k != "calibration_images"]
+        if build_kwargs.get("calibration_images") is not None:
+            options.append(f"calibration={_calibration_digest(build_kwargs['calibration_images'])}")
+        tag = f"{reference_tag}+fast({','.join(options)})"
+    abhi_predict.use_model(build_fast_model(reference, **build_kwargs), tag=tag)
+    return reference
+
+
+# =========================
+# Accuracy delta report
+# =========================
+def accuracy_report(reference, candidate, images, batch_size=8):
+    """
+    Runs both models on the same images and reports label agreement,
+    softmax probability deltas and latency per image.
+    """
+    crop_agree = stage_agree = n = 0
+    max_delta = total_delta = 0.0
+    ref_time = cand_time = 0.0
+
+    with torch.inference_mode():
+        for batch in _batches(images, batch_size):
+            start = time.perf_counter()
+            ref_crop, ref_stage = reference(batch)
+            ref_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            cand_crop, cand_stage = candidate(batch)
+            cand_time += time.perf_counter() - start
+
+            ref_probs = torch.cat([F.softmax(ref_crop, 1), F.softmax(ref_stage, 1)], 1)
+            cand_probs = torch.cat([F.softmax(cand_crop, 1), F.softmax(cand_stage, 1)], 1)
+            delta = (ref_probs - cand_probs).abs()
+
+            crop_agree += (ref_crop.argmax(1) == cand_crop.argmax(1)).sum().item()
+            stage_agree += (ref_stage.argmax(1) == cand_stage.argmax(1)).sum().item()
+            max_delta = max(max_delta, delta.max().item())
+            total_delta += delta.mean(dim=1).sum().item()
+            n += batch.shape[0]
+
+    if n == 0:
+        raise ValueError("no images to compare")
+
+    return {
+        "images": n,
+        "crop_agreement": round(crop_agree / n, 4),
+        "stage_agreement": round(stage_agree / n, 4),
+        "max_abs_prob_delta": round(max_delta, 4),
+        "mean_abs_prob_delta": round(total_delta / n, 4),
+        "fp32_ms_per_image": round(1000 * ref_time / n, 2),
+        "fast_ms_per_image": round(1000 * cand_time / n, 2),
+        "speedup": round(ref_time / cand_time, 2) if cand_time else None,
+    }
+
+
+# =====================================================
+# CLI: accuracy / latency report on sample images
+# =====================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare fast CPU inference against fp32")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--quantize", choices=["dynamic", "static"], default=None)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--no-trace", action="store_true")
+    parser.add_argument("--no-channels-last", action="store_true")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    fp32 = abhi_predict.get_model()
+    fast = build_fast_model(
+        fp32,
+        quantize=args.quantize,
+        channels_last=not args.no_channels_last,
+        trace=not args.no_trace,
+        calibration_images=args.images,
+    )
+
+    for key, value in accuracy_report(fp32, fast, args.images).items():
+        print(f"{key}: {value}")
@@ -1,5 +1,19 @@
 # modules/yield_prediction/yield_estimator.py
 
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# Average yield per hectare (tons)
+BASE_YIELD = {
+    "tomato": 65,
+    "banana": 40,
+    "mango": 15,
+    "papaya": 50
+}
+
+
 def estimate_yield(
     crop: str,
     area_hectares: float,
@@ -11,14 +25,6 @@ def estimate_yield(
     Independent Yield Estimation Module
     """
 
-    # Average yield per hectare (tons)
-    BASE_YIELD = {
-        "tomato": 65,
-        "banana": 40,
-        "mango": 15,
-        "papaya": 50
-    }
-
     if crop not in BASE_YIELD:
         raise ValueError("Unsupported crop")
 
@@ -54,3 +60,250 @@ def estimate_yield(
         "productivity_level": productivity_level,
         "soil_ph": soil_ph
     }
+
+
+# --------------------------------------------------
+# Field factor model (Streamlit "Yield Estimation" tab)
+# --------------------------------------------------
+
+BASE_YIELD_TONS_ACRE = {"tomato": 26.3, "banana": 16.2, "mango": 6.1, "papaya": 20.2}
+OPTIMAL_PLANTS_PER_ACRE = {"tomato": 10000, "banana": 700, "mango": 40, "papaya": 2000}
+SOIL_FACTORS = {"Loamy": 1.0, "Black": 0.98, "Red": 0.92, "Clay": 0.88, "Sandy": 0.80}
+IRRIGATION_FACTORS = {"Drip": 1.1, "Sprinkler": 1.0, "Flood": 0.9, "Rain-fed": 0.75}
+FERTILIZER_FACTORS = {"Low": 0.8, "Medium": 1.0, "High": 1.15}
+
+# (lookup, default for unknown values)
+_CATEGORY_FACTORS = {
+    "soil_type": (SOIL_FACTORS, 0.85),
+    "irrigation": (IRRIGATION_FACTORS, 0.9),
+    "fertilizer_level": (FERTILIZER_FACTORS, 1.0),
+}
+
+YIELD_RANGE = 0.15  # fixed +-15% band of the deterministic estimate
+
+
+def _lookup(values, table, default=None):
+    """
+    Maps a scalar or array of labels through table. Arrays are factorized
+    (one hash pass; categorical Series reuse their codes) and only the
+    distinct labels go through the dict. default=None means unknown labels
+    are errors.
+    """
+    if np.ndim(values) == 0:
+        if default is None and values not in table:
+            raise ValueError(f"Unsupported value: {values}")
+        return np.float64(table.get(values, default))
+
+    if isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+        codes, uniques = np.asarray(values.cat.codes), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(np.asarray(values).ravel())
+
+    unknown = [u for u in uniques if u not in table]
+    if (unknown or (codes < 0).any()) and default is None:
+        raise ValueError(f"Unsupported values: {unknown}")
+    # last slot catches missing labels (code -1)
+    factors = np.array([table.get(u, default) for u in uniques] + [default], dtype=np.float64)
+    return factors[codes].reshape(np.shape(values))
+
+
+def _band_factor(x, inner, outer):
+    """1.0 inside inner, 0.9 inside outer, 0.75 elsewhere (inclusive)."""
+    x = np.asarray(x, dtype=np.float64)
+    return np.where(
+        (x >= inner[0]) & (x <= inner[1]), 1.0,
+        np.where((x >= outer[0]) & (x <= outer[1]), 0.9, 0.75),
+    )
+
+
+def _field_tons(base, optimal, area_acres, num_plants, soil_f, soil_ph, irr_f, fert_f, avg_temp):
+    # All arguments broadcast against each other
+    ph_factor = _band_factor(soil_ph, (6.0, 7.0), (5.5, 7.5))
+    temp_factor = _band_factor(avg_temp, (20, 32), (15, 35))
+    density_factor = np.clip(np.asarray(num_plants) / (np.asarray(area_acres) * optimal), 0.7, 1.15)
+    return base * area_acres * ph_factor * soil_f * irr_f * fert_f * temp_factor * density_factor
+
+
+def _factors(crop, soil_type, irrigation, fertilizer_level):
+    return (
+        _lookup(crop, BASE_YIELD_TONS_ACRE),
+        _lookup(crop, OPTIMAL_PLANTS_PER_ACRE, 5000),
+        _lookup(soil_type, *_CATEGORY_FACTORS["soil_type"]),
+        _lookup(irrigation, *_CATEGORY_FACTORS["irrigation"]),
+        _lookup(fertilizer_level, *_CATEGORY_FACTORS["fertilizer_level"]),
+    )
+
+
+def estimate_field_yield(
+    crop,
+    area_acres,
+    num_plants,
+    soil_type,
+    soil_ph,
+    irrigation,
+    fertilizer_level="Medium",
+    avg_temp=28.0,
+):
+    """
+    Vectorized field yield (soil, irrigation, fertilizer, temperature and
+    plant density factors). Every argument is a scalar or an array-like of
+    the same (broadcastable) length. Returns a dict of float arrays:
+    estimated_tons, estimated_kg, tons_per_acre, min_tons, max_tons
+    (the fixed +-15% band); 0-d arrays for scalar input.
+    """
+    base, optimal, soil_f, irr_f, fert_f = _factors(crop, soil_type, irrigation, fertilizer_level)
+    area_acres = np.asarray(area_acres, dtype=np.float64)
+
+    tons = _field_tons(base, optimal, area_acres, num_plants, soil_f, soil_ph, irr_f, fert_f, avg_temp)
+    return {
+        "estimated_tons": tons,
+        "estimated_kg": tons * 1000,
+        "tons_per_acre": tons / area_acres,
+        "min_tons": tons * (1 - YIELD_RANGE),
+        "max_tons": tons * (1 + YIELD_RANGE),
+    }
+
+
+def estimate_field_yield_frame(fields: pd.DataFrame) -> pd.DataFrame:
+    """
+    estimate_field_yield over a DataFrame with one row per field (columns
+    named like the function arguments; fertilizer_level and avg_temp are
+    optional). Returns a copy with the result columns added.
+    """
+    result = fields.copy()
+    kwargs = {
+        col: fields[col]
+        for col in ("crop", "area_acres", "num_plants", "soil_type", "soil_ph",
+                    "irrigation", "fertilizer_level", "avg_temp")
+        if col in fields.columns
+    }
+    for key, values in estimate_field_yield(**kwargs).items():
+        result[key] = values
+    return result
+
+
+def yield_scenario_grid(
+    crop,
+    area_acres,
+    num_plants,
+    soil_type,
+    soil_ph,
+    irrigation,
+    fertilizer_level="Medium",
+    avg_temp=28.0,
+    as_frame=True,
+):
+    """
+    Evaluates every combination of the given values (each argument a
+    scalar or a list), e.g. all pH x irrigation x density scenarios.
+    Each axis is converted to factors once and the grid is a single
+    broadcast product, so millions of scenarios cost one array operation.
+
+    as_frame=True: long DataFrame, one row per scenario with its inputs and
+    estimated_tons. as_frame=False: (axes dict, N-d array of tons) with one
+    array dimension per argument, in signature order.
+    """
+    axes = {
+        "crop": crop,
+        "area_acres": area_acres,
+        "num_plants": num_plants,
+        "soil_type": soil_type,
+        "soil_ph": soil_ph,
+        "irrigation": irrigation,
+        "fertilizer_level": fertilizer_level,
+        "avg_temp": avg_temp,
+    }
+    axes = {k: list(np.atleast_1d(v)) for k, v in axes.items()}
+    ndim = len(axes)
+
+    def along(i, values):
+        shape = [1] * ndim
+        shape[i] = len(values)
+        return np.asarray(values).reshape(shape)
+
+    names = list(axes)
+    base = along(0, _lookup(np.array(axes["crop"]), BASE_YIELD_TONS_ACRE))
+    optimal = along(0, _lookup(np.array(axes["crop"]), OPTIMAL_PLANTS_PER_ACRE, 5000))
+    tons = _field_tons(
+        base,
+        optimal,
+        along(1, np.asarray(axes["area_acres"], dtype=np.float64)),
+        along(2, np.asarray(axes["num_plants"], dtype=np.float64)),
+        along(3, _lookup(np.array(axes["soil_type"]), *_CATEGORY_FACTORS["soil_type"])),
+        along(4, np.asarray(axes["soil_ph"], dtype=np.float64)),
+        along(5, _lookup(np.array(axes["irrigation"]), *_CATEGORY_FACTORS["irrigation"])),
+        along(6, _lookup(np.array(axes["fertilizer_level"]), *_CATEGORY_FACTORS["fertilizer_level"])),
+        along(7, np.asarray(axes["avg_temp"], dtype=np.float64)),
+    )
+    tons = np.broadcast_to(tons, tuple(len(v) for v in axes.values()))
+
+    if not as_frame:
+        return axes, tons
+
+    combos = pd.DataFrame(list(itertools.product(*axes.values())), columns=names)
+    combos["estimated_tons"] = tons.ravel()
+    return combos
+
+
+def monte_carlo_yield(
+    crop,
+    area_acres,
+    num_plants,
+    soil_type,
+    soil_ph,
+    irrigation,
+    fertilizer_level="Medium",
+    avg_temp=28.0,
+    n_samples=10000,
+    soil_ph_sd=0.3,
+    avg_temp_sd=2.0,
+    base_yield_cv=0.1,
+    percentiles=(5, 50, 95),
+    seed=None,
+    chunk_size=1_000_000,
+):
+    """
+    Uncertainty bands instead of the fixed +-15%: for every field, samples
+    soil pH and temperature (normal, given sd) and a lognormal
+    multiplicative base-yield error (coefficient of variation base_yield_cv),
+    then reports percentiles / mean of the simulated tons. Arguments are
+    scalars or per-field arrays; sampling is done in chunks of at most
+    chunk_size draws to bound memory (split along the samples too when
+    n_samples > chunk_size). Exact percentiles need every simulated value,
+    so the n_samples results of the fields in a chunk are kept.
+
+    Returns a dict: {"p5": array, "p50": array, "p95": array, "mean": array}
+    with one value per field.
+    """
+    base, optimal, soil_f, irr_f, fert_f = _factors(crop, soil_type, irrigation, fertilizer_level)
+    columns = np.broadcast_arrays(
+        base, optimal, np.asarray(area_acres, dtype=np.float64), np.asarray(num_plants, dtype=np.float64),
+        soil_f, np.asarray(soil_ph, dtype=np.float64), irr_f, fert_f, np.asarray(avg_temp, dtype=np.float64),
+    )
+    base, optimal, area, plants, soil_f, ph, irr_f, fert_f, temp = (np.atleast_1d(c)[:, None] for c in columns)
+    n_fields = base.shape[0]
+
+    rng = np.random.default_rng(seed)
+    sigma = np.sqrt(np.log1p(base_yield_cv ** 2))
+    rows_per_chunk = max(1, chunk_size // n_samples)
+    samples_per_chunk = min(n_samples, chunk_size)
+
+    out = {f"p{p:g}": np.empty(n_fields) for p in percentiles}
+    out["mean"] = np.empty(n_fields)
+    for start in range(0, n_fields, rows_per_chunk):
+        sl = slice(start, start + rows_per_chunk)
+        sampled = np.empty((base[sl].shape[0], n_samples))
+        for first in range(0, n_samples, samples_per_chunk):
+            cols = slice(first, first + samples_per_chunk)
+            shape = sampled[:, cols].shape
+            sampled[:, cols] = _field_tons(
+                base[sl] * rng.lognormal(-sigma ** 2 / 2, sigma, shape),
+                optimal[sl], area[sl], plants[sl], soil_f[sl],
+                ph[sl] + rng.normal(0.0, soil_ph_sd, shape),
+                irr_f[sl], fert_f[sl],
+                temp[sl] + rng.normal(0.0, avg_temp_sd, shape),
+            )
+        for p, values in zip(percentiles, np.percentile(sampled, percentiles, axis=1)):
+            out[f"p{p:g}"][sl] = values
+        out["mean"][sl] = sampled.mean(axis=1)
+    return out
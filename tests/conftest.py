@@ -0,0 +1,16 @@
+# tests/conftest.py
+import pytest
+import torch
+
+from modules.stage_detection import abhi_predict
+
+
+@pytest.fixture
+def random_model(monkeypatch):
+    # The trained checkpoint is not part of the repo, use random weights
+    torch.manual_seed(0)
+    model = abhi_predict.MultiOutputModel().eval()
+    monkeypatch.setattr(abhi_predict, "_model", model)
+    # so use_model calls in a test are undone with it
+    monkeypatch.setattr(abhi_predict, "_tagged_model", (None, None))
+    return model
@@ -0,0 +1,23 @@
+# tests/test_benchmarks.py
+from benchmarks.bench_pipeline import compare, synthetic_image
+
+
+def test_compare_flags_regressions_by_direction():
+    baseline = {"cases": {"fertilizer": {"metrics": {
+        "single_median_ms": 10.0, "batch_rows_per_s": 1000.0, "peak_rss_mb": 100.0,
+    }}}}
+    current = {"cases": {"fertilizer": {"metrics": {
+        "single_median_ms": 11.0, "batch_rows_per_s": 700.0, "peak_rss_mb": 130.0,
+    }}}}
+
+    regressions = compare(current, baseline, tolerance=0.15)
+    assert len(regressions) == 2
+    assert any("batch_rows_per_s" in r for r in regressions)
+    assert any("peak_rss_mb" in r for r in regressions)
+    assert compare(baseline, baseline, tolerance=0.0) == []
+
+
+def test_synthetic_images_are_deterministic():
+    a, b = synthetic_image(64, 48), synthetic_image(64, 48)
+    assert a.shape == (48, 64, 3) and a.dtype.name == "uint8"
+    assert (a == b).all()
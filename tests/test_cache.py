@@ -0,0 +1,174 @@
+# tests/test_cache.py
+import os
+
+import joblib
+import numpy as np
+
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor
+from utils import cache as cache_mod
+from utils.cache import ResultCache, cached_harvest_predict, file_version, image_digest
+
+SAMPLE_IMAGE = os.path.join(os.path.dirname(__file__), "..", "assets", "sample_tomato.jpg")
+
+
+def test_lru_eviction_and_stats():
+    cache = ResultCache(max_entries=2)
+    for i in range(3):
+        cache.put(f"k{i}", {"v": i})
+
+    assert cache.get("k0") is None
+    assert cache.get("k2") == {"v": 2}
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_returned_values_are_copies():
+    cache = ResultCache()
+    cache.put("k", {"nested": {"a": 1}})
+    cache.get("k")["nested"]["a"] = 2
+    assert cache.get("k") == {"nested": {"a": 1}}
+
+
+def test_disk_store_survives_new_instance(tmp_path):
+    ResultCache(disk_dir=str(tmp_path)).put("k", {"v": 1.5})
+    fresh = ResultCache(disk_dir=str(tmp_path))
+    assert fresh.get("k") == {"v": 1.5}
+    assert fresh.stats()["disk_hits"] == 1
+
+
+def test_file_version_changes_with_content(tmp_path):
+    path = tmp_path / "model.bin"
+    path.write_bytes(b"a")
+    first = file_version(str(path))
+    path.write_bytes(b"bb")
+    assert file_version(str(path)) != first
+
+
+def test_image_digest_is_content_based():
+    with open(SAMPLE_IMAGE, "rb") as f:
+        data = f.read()
+    assert image_digest(SAMPLE_IMAGE) == image_digest(data)
+    assert image_digest(np.zeros((2, 2, 3), np.uint8)) != image_digest(np.zeros((2, 3, 2), np.uint8))
+
+
+def test_harvest_prediction_is_cached(monkeypatch):
+    calls = []
+    real = cache_mod.extract_visual_features
+
+    def counting(image, max_side=None):
+        calls.append(1)
+        return real(image, max_side=max_side)
+
+    monkeypatch.setattr(cache_mod, "extract_visual_features", counting)
+    cache = ResultCache()
+    predictor = HarvestPredictor()
+
+    first = cached_harvest_predict(predictor, SAMPLE_IMAGE, "tomato", "unripe", cache)
+    second = cached_harvest_predict(predictor, SAMPLE_IMAGE, "tomato", "unripe", cache)
+    other_stage = cached_harvest_predict(predictor, SAMPLE_IMAGE, "tomato", "semiripe", cache)
+
+    assert first == second
+    assert other_stage["stage"] == "semiripe"
+    assert len(calls) == 1
+
+
+def _counting_predict(calls, result, tag):
+    def predict(image):
+        calls.append(1)
+        return dict(result)
+    predict.cache_tag = tag
+    return predict
+
+
+def test_stage_cache_keys_on_active_model_and_callable(random_model, monkeypatch, tmp_path):
+    from modules.stage_detection import abhi_predict
+    from utils.cache import cached_predict_image
+
+    # no checkpoint on disk must not break the cache
+    monkeypatch.setattr(abhi_predict, "MODEL_PATH", str(tmp_path / "missing.pth"))
+    cache = ResultCache()
+    image = np.zeros((8, 8, 3), np.uint8)
+    calls = []
+    fp32 = _counting_predict(calls, {"crop": "tomato"}, "fp32")
+
+    # untagged model (e.g. monkeypatched): never cached
+    cached_predict_image(image, cache, predict=fp32)
+    cached_predict_image(image, cache, predict=fp32)
+    assert len(calls) == 2 and cache.stats()["entries"] == 0
+
+    abhi_predict.use_model(random_model, tag="checkpoint")
+    cached_predict_image(image, cache, predict=fp32)
+    assert cached_predict_image(image, cache, predict=fp32) == {"crop": "tomato"}
+    assert len(calls) == 3
+
+    # another callable on the same model gets its own entry
+    other_calls = []
+    early_exit = _counting_predict(other_calls, {"crop": "mango"}, "cascade")
+    assert cached_predict_image(image, cache, predict=early_exit) == {"crop": "mango"}
+    assert len(other_calls) == 1
+
+    # swapping the model (fast / int8 build) invalidates
+    abhi_predict.use_model(random_model, tag="checkpoint+fast(quantize=static)")
+    cached_predict_image(image, cache, predict=fp32)
+    assert len(calls) == 4
+
+    # an anonymous callable is not cached
+    cached_predict_image(image, cache, predict=lambda img: {"crop": "banana"})
+    assert cached_predict_image(image, cache, predict=lambda img: {"crop": "papaya"}) == {"crop": "papaya"}
+
+    # replacing _model behind use_model's back drops the tag again
+    monkeypatch.setattr(abhi_predict, "_model", abhi_predict.MultiOutputModel().eval())
+    assert abhi_predict.model_tag() is None
+
+
+def test_stage_version_is_the_loaded_checkpoint(random_model, monkeypatch, tmp_path):
+    import torch
+    from modules.stage_detection import abhi_predict
+    from utils.cache import stage_model_version
+
+    path = tmp_path / "ripeness_model.pth"
+    torch.save(random_model.state_dict(), path)
+    monkeypatch.setattr(abhi_predict, "MODEL_PATH", str(path))
+    monkeypatch.setattr(abhi_predict, "_model", None)
+    monkeypatch.setattr(abhi_predict, "_tagged_model", (None, None))
+
+    # the first lookup loads the model instead of skipping the cache
+    loaded = stage_model_version()
+    assert loaded is not None and loaded.startswith("checkpoint:")
+
+    # a new file on disk does not relabel the weights still in memory
+    torch.manual_seed(1)
+    torch.save(abhi_predict.MultiOutputModel().state_dict(), path)
+    assert stage_model_version() == loaded
+
+    monkeypatch.setattr(abhi_predict, "_model", None)
+    assert stage_model_version() != loaded
+
+
+def test_harvest_version_is_the_loaded_forest(tmp_path):
+    from sklearn.ensemble import RandomForestRegressor
+
+    path = tmp_path / "rf.joblib"
+    X = np.random.default_rng(0).random((20, 7))
+    joblib.dump(RandomForestRegressor(n_estimators=2, random_state=0).fit(X, X[:, 0]), path)
+    predictor = HarvestPredictor(rf_model_path=str(path))
+    loaded = predictor.model_version
+
+    joblib.dump(RandomForestRegressor(n_estimators=3, random_state=0).fit(X, X[:, 1]), path)
+    assert predictor.model_version == loaded
+    assert HarvestPredictor(rf_model_path=str(path)).model_version != loaded
+    assert HarvestPredictor().model_version == "rule-based"
+
+
+def test_cascade_cache_tag_tracks_threshold(random_model):
+    from modules.stage_detection.cascade import FeatureCascade
+    from utils.cache import _callable_tag
+
+    images = [np.full((32, 32, 3), v, np.uint8) for v in (0, 90, 180, 250)]
+    cascade = FeatureCascade.fit(images, max_side=32, threshold=0.5)
+    first = _callable_tag(cascade.predict_image)
+    cascade.threshold = 0.9
+    assert _callable_tag(cascade.predict_image) != first
+    assert "FeatureCascade.predict_image" in first
@@ -0,0 +1,68 @@
+# tests/test_cascade.py
+import numpy as np
+import pytest
+
+from modules.stage_detection import abhi_predict
+from modules.stage_detection.cascade import FeatureCascade
+from utils.pipeline import analyze_image
+
+
+@pytest.fixture
+def images():
+    rng = np.random.default_rng(0)
+    out = []
+    for i in range(12):
+        color = np.array([rng.integers(0, 256), rng.integers(0, 256), rng.integers(0, 256)], dtype=np.uint8)
+        noise = rng.integers(0, 40, (96, 128, 3), dtype=np.uint8)
+        out.append(np.clip(color.astype(np.int16) + noise, 0, 255).astype(np.uint8))
+    return out
+
+
+def _strip(result):
+    return {k: v for k, v in result.items() if k != "early_exit"}
+
+
+def test_threshold_controls_early_exit(random_model, images):
+    cascade = FeatureCascade.fit(images, batch_size=5, max_side=64)
+
+    # nothing is confident enough: every answer comes from the full model
+    cascade.threshold = 1.01
+    results = cascade.predict_images(images)
+    assert not any(r["early_exit"] for r in results)
+    assert [_strip(r) for r in results] == [abhi_predict.predict_image(img) for img in images]
+    assert cascade.stats()["early_exit_rate"] == 0.0
+
+    # everything exits early
+    cascade.reset_stats()
+    cascade.threshold = 0.0
+    results = cascade.predict_images(images)
+    assert all(r["early_exit"] for r in results)
+    assert all(r["crop"] in abhi_predict.crops and r["stage"] in abhi_predict.stages for r in results)
+    stats = cascade.stats()
+    assert stats["images"] == 12 and stats["early_exits"] == 12 and stats["early_exit_rate"] == 1.0
+    assert stats["crop_agreement"] is None
+
+
+def test_audit_counts_agreement(random_model, images, tmp_path):
+    path = str(tmp_path / "cascade.joblib")
+    FeatureCascade.fit(images, max_side=64, threshold=0.0).save(path)
+
+    cascade = FeatureCascade.load(path, audit_rate=0.5)
+    assert cascade.threshold == 0.0 and cascade.max_side == 64
+    results = cascade.predict_images(images)
+
+    stats = cascade.stats()
+    assert stats["audited"] == 6
+    assert 0.0 <= stats["crop_agreement"] <= 1.0 and 0.0 <= stats["stage_agreement"] <= 1.0
+    # heads were fitted on these very images, early answers mostly match
+    full = [abhi_predict.predict_image(img) for img in images]
+    matches = sum(r["stage"] == f["stage"] for r, f in zip(results, full))
+    assert matches >= 6
+
+
+def test_cascade_as_pipeline_classifier(random_model, images):
+    cascade = FeatureCascade.fit(images, max_side=64, threshold=1.01)
+    result = analyze_image(images[0], 4.0, 2.0, 3.0, classify=cascade.predict_image)
+    expected = analyze_image(images[0], 4.0, 2.0, 3.0)
+    assert result["crop"] == expected["crop"] and result["stage_conf"] == expected["stage_conf"]
+    assert cascade.stats()["images"] == 1
@@ -0,0 +1,132 @@
+# tests/test_fertilizer_reco.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.fertilizer_reco import fert_reco
+from modules.fertilizer_reco.fert_reco import (
+    FertilizerMemo,
+    recommend_fertilizer,
+    recommend_fertilizer_batch,
+)
+
+
+@pytest.fixture(scope="module")
+def survey():
+    rng = np.random.default_rng(0)
+    n = 60
+    return pd.DataFrame({
+        "crop": rng.choice(["tomato", "banana", "mango", "papaya"], n),
+        "stage": rng.choice(["unripe", "semiripe", "ripe"], n),
+        "N_mgkg": rng.uniform(0, 60, n).round(1),
+        "P_mgkg": rng.uniform(0, 60, n).round(1),
+        "K_mgkg": rng.uniform(0, 60, n).round(1),
+    })
+
+
+def test_batch_matches_single_row(survey):
+    batch = recommend_fertilizer_batch(survey)
+    assert len(batch) == len(survey)
+
+    for i, row in survey.iterrows():
+        out = batch.loc[i]
+        if out["n_deficient"] == 0:
+            # recommend_fertilizer has no primary to return for these rows
+            assert out["primary_nutrient"] is None
+            continue
+
+        single = recommend_fertilizer(row.crop, row.stage, row.N_mgkg, row.P_mgkg, row.K_mgkg)
+        assert out["N_score"] == single["priority_scores"]["Nitrogen (N)"]
+        assert out["primary_nutrient"] == single["primary"]["nutrient"]
+        assert out["primary_fertilizer_name"] == single["primary"]["fertilizer_name"]
+        assert out["primary_dose_kg_acre"] == single["primary"]["dose_kg_acre"]
+        if "secondary" in single:
+            assert out["secondary_nutrient"] == single["secondary"]["nutrient"]
+            assert out["secondary_dose_kg_acre"] == single["secondary"]["dose_kg_acre"]
+        else:
+            assert out["secondary_nutrient"] is None
+
+
+def test_batch_requires_npk_columns(survey):
+    with pytest.raises(ValueError):
+        recommend_fertilizer_batch(survey.drop(columns=["K_mgkg"]))
+
+
+def test_memo_hits_on_quantized_inputs():
+    memo = FertilizerMemo(max_entries=8, step=0.1)
+    first = memo.recommend("tomato", "ripe", 4.0, 2.0, 3.0)
+    second = memo.recommend("tomato", "ripe", 4.0000001, 2.0, 3.0)
+
+    assert memo.stats()["hits"] == 1 and memo.stats()["misses"] == 1
+    assert first["priority_scores"] == second["priority_scores"]
+    assert second["soil_nutrients"]["N_mgkg"] == 4.0000001
+    assert first == recommend_fertilizer("tomato", "ripe", 4.0, 2.0, 3.0)
+
+
+def test_memo_returns_copies_and_evicts():
+    memo = FertilizerMemo(max_entries=2)
+    memo.recommend("tomato", "ripe", 4.0, 2.0, 3.0)["primary"]["dose_kg_acre"] = -1
+    assert memo.recommend("tomato", "ripe", 4.0, 2.0, 3.0)["primary"]["dose_kg_acre"] > 0
+
+    memo.recommend("tomato", "ripe", 5.0, 2.0, 3.0)
+    memo.recommend("tomato", "ripe", 6.0, 2.0, 3.0)
+    stats = memo.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_memo_failed_call_is_not_an_eviction(monkeypatch):
+    memo = FertilizerMemo(max_entries=2)
+    memo.recommend("tomato", "ripe", 4.0, 2.0, 3.0)
+
+    def failing(**kwargs):
+        raise KeyError(kwargs["crop"])
+
+    monkeypatch.setattr(fert_reco, "recommend_fertilizer", failing)
+    for _ in range(3):
+        with pytest.raises(KeyError):
+            memo.recommend("apple", "ripe", 4.0, 2.0, 3.0)
+
+    stats = memo.stats()
+    assert stats["misses"] == 4 and stats["entries"] == 1
+    assert stats["evictions"] == 0
+
+
+def test_compiled_models_match_sklearn_xgboost(survey):
+    # Model-facing spellings too, so the one-hot columns are exercised
+    rng = np.random.default_rng(1)
+    frame = pd.concat([survey, pd.DataFrame({
+        "crop": rng.choice(["Tomato", "Banana", "Mango", "Papaya"], 200),
+        "stage": rng.choice(["Unripe", "Semi-Ripe", "Ripe"], 200),
+        "N_mgkg": rng.uniform(0, 300, 200),
+        "P_mgkg": rng.uniform(0, 300, 200),
+        "K_mgkg": rng.uniform(0, 300, 200),
+    })], ignore_index=True)
+    for col, value in fert_reco.DEFAULT_FEATURES.items():
+        frame[col] = value
+    frame.loc[::3, "irrigation_type"] = "Flood"
+    frame.loc[5, "N_mgkg"] = np.nan  # missing value -> default branch
+
+    fert_reco._load_models()
+    X = fert_reco._preprocessor.transform(frame)
+    expected = np.column_stack([
+        fert_reco._priority_models[key].predict(X) for key in fert_reco.PRIORITY_MODEL_KEYS
+    ])
+
+    compiled = fert_reco._compiled
+    assert np.array_equal(compiled.preprocessor.transform_frame(frame), X.astype(np.float32), equal_nan=True)
+    assert np.array_equal(compiled.ensemble.predict(compiled.preprocessor.transform_frame(frame)), expected)
+    assert np.array_equal(compiled.score_frame(frame), expected)
+    assert np.array_equal(compiled.score_frame(frame.head(10)), expected[:10])
+    rows = frame.to_dict("records")
+    assert np.array_equal(np.array([compiled.score_row(row) for row in rows]), expected)
+
+
+def test_recommendations_same_with_and_without_compiled_models(survey, monkeypatch):
+    row = survey.iloc[0]
+    compiled = recommend_fertilizer(row.crop, row.stage, row.N_mgkg, row.P_mgkg, row.K_mgkg)
+    compiled_batch = recommend_fertilizer_batch(survey)
+
+    monkeypatch.setattr(fert_reco, "USE_COMPILED_MODELS", False)
+    assert recommend_fertilizer(row.crop, row.stage, row.N_mgkg, row.P_mgkg, row.K_mgkg) == compiled
+    pd.testing.assert_frame_equal(recommend_fertilizer_batch(survey), compiled_batch)
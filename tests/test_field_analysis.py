@@ -0,0 +1,54 @@
+# tests/test_field_analysis.py
+import json
+import os
+import shutil
+
+import pytest
+
+from modules.field_analysis import field_analyzer
+
+SAMPLE_IMAGE = os.path.join(os.path.dirname(__file__), "..", "assets", "sample_tomato.jpg")
+
+
+@pytest.fixture
+def field_dir(tmp_path, random_model):
+    for i in range(3):
+        shutil.copy(SAMPLE_IMAGE, tmp_path / f"img_{i}.jpg")
+    (tmp_path / "broken.jpg").write_bytes(b"not an image")
+    (tmp_path / "notes.txt").write_text("ignored")
+    return tmp_path
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_analyze_field_writes_report(field_dir, tmp_path, workers):
+    out = tmp_path / "report.json"
+    streamed = []
+    report = field_analyzer.analyze_field(
+        str(field_dir), 2.5, 4000, output_path=str(out), workers=workers, on_result=streamed.append
+    )
+
+    assert len(streamed) == 4
+    assert report["images_analyzed"] == 3
+    assert [d["image_num"] for d in report["per_image_details"]] == [2, 3, 4]
+    assert report["failed_images"][0]["filename"] == "broken.jpg"
+    assert sum(report["substage_distribution"].values()) == 3
+    assert all(0.5 <= d["substage_confidence"] <= 1.0 for d in report["per_image_details"])
+    ripeness = report["ripeness_analysis"]
+    assert ripeness["unripe_percentage"] + ripeness["semiripe_percentage"] + ripeness["ripe_percentage"] == pytest.approx(100, abs=0.2)
+    assert json.loads(out.read_text()) == report
+
+
+def test_analyze_field_streams_into_store(field_dir, tmp_path, monkeypatch):
+    from modules.field_analysis.field_store import FieldStore
+
+    monkeypatch.chdir(tmp_path)
+    with FieldStore(str(tmp_path / "fields.log")) as store:
+        report = field_analyzer.analyze_field(str(field_dir), 2.5, 4000, workers=1, store=store, field_id="north")
+        summary = store.summary("north")
+
+    # no output_path, no report file
+    assert not (tmp_path / "field_analysis_results.json").exists()
+
+    assert summary["images_analyzed"] == 3 and summary["images_failed"] == 1
+    for key in ("harvest_timeline", "ripeness_analysis", "substage_distribution", "yield_prediction"):
+        assert summary[key] == report[key]
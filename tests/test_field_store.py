@@ -0,0 +1,95 @@
+# tests/test_field_store.py
+import random
+
+import pytest
+
+from modules.field_analysis.field_analyzer import build_field_report
+from modules.field_analysis.field_store import FieldAggregate, FieldStore
+
+
+def _details(n, seed=0):
+    rng = random.Random(seed)
+    details = []
+    for i in range(n):
+        stage = rng.choice(["unripe", "semiripe", "ripe"])
+        details.append({
+            "image_num": i + 1,
+            "filename": f"img_{i}.jpg",
+            "crop": rng.choice(["tomato", "tomato", "mango"]),
+            "ripening_stage": stage,
+            "ripening_confidence": round(rng.random(), 4),
+            "crop_confidence": round(rng.random(), 4),
+            "substage": rng.choice(["early", "mid", "late"]),
+            "days_to_harvest": round(rng.uniform(0, 30), 2),
+            "harvest_date": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        })
+    return details
+
+
+def _without_timestamp(report):
+    return {k: v for k, v in report.items() if k not in ("timestamp", "per_image_details", "images_failed")}
+
+
+def test_incremental_and_merged_aggregates_match_full_report():
+    details = _details(50)
+    full = build_field_report(details, 2.5, 4000)
+
+    incremental = FieldAggregate()
+    for detail in details:
+        incremental.add(detail)
+    assert _without_timestamp(incremental.report(2.5, 4000)) == _without_timestamp(full)
+
+    # three workers, each with a slice, merged in any order
+    parts = [FieldAggregate.from_details(details[i::3]) for i in range(3)]
+    merged = FieldAggregate().merge(parts[2]).merge(parts[0]).merge(parts[1])
+    assert _without_timestamp(merged.report(2.5, 4000)) == _without_timestamp(full)
+
+    roundtrip = FieldAggregate.from_dict(merged.to_dict())
+    assert roundtrip.to_dict() == merged.to_dict()
+
+    empty = FieldAggregate().report(1.0, 10)
+    assert empty["images_analyzed"] == 0 and empty["harvest_timeline"]["harvest_window_days"] == 0
+
+
+def test_store_replays_log_and_compacts(tmp_path):
+    path = str(tmp_path / "fields.log")
+    details = _details(20, seed=1)
+
+    with FieldStore(path) as store:
+        store.set_field("north", area_hectares=2.5, num_seeds=4000)
+        for detail in details[:10]:
+            store.add("north", detail)
+        store.merge("north", FieldAggregate.from_details(details[10:]))
+        store.add("north", {"filename": "broken.jpg", "error": "cannot decode"})
+        store.add_many("south", details[:3])
+        live = store.summary("north")
+
+    expected = build_field_report(details, 2.5, 4000)
+    assert _without_timestamp(live) == _without_timestamp(expected)
+    assert live["images_failed"] == 1
+
+    # simulate a crash in the middle of an append
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"type": "image", "field": "north", "det')
+
+    with FieldStore(path) as store:
+        assert store.fields() == ["north", "south"]
+        assert _without_timestamp(store.summary("north")) == _without_timestamp(live)
+        store.add("south", details[3])
+        store.compact()
+
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 3  # north field + north snapshot + south snapshot
+
+    with FieldStore(path) as store:
+        assert _without_timestamp(store.summary("north")) == _without_timestamp(live)
+        south = store.summary("south", area_hectares=1.0, num_seeds=100)
+        assert south["images_analyzed"] == 4
+        assert south["planting_area_hectares"] == 1.0
+
+
+def test_corrupt_record_in_the_middle_is_an_error(tmp_path):
+    path = tmp_path / "fields.log"
+    path.write_text('{"type": "image", "field": "x", "detail": {"error": "e"}}\nnot json\n{}\n')
+    with pytest.raises(ValueError, match="corrupt record"):
+        FieldStore(str(path))
@@ -0,0 +1,123 @@
+# tests/test_harvest_prediction.py
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from modules.harvest_prediction.harvest_predictor import (
+    HarvestPredictor,
+    _legacy_visual_features,
+    extract_visual_features,
+    sub_stage_confidence,
+)
+from utils.preprocess import decode_image
+
+SAMPLE_IMAGE = os.path.join(os.path.dirname(__file__), "..", "assets", "sample_tomato.jpg")
+
+
+def test_features_accept_path_bytes_and_array():
+    from_path = extract_visual_features(SAMPLE_IMAGE)
+    with open(SAMPLE_IMAGE, "rb") as f:
+        from_bytes = extract_visual_features(f.read())
+    from_array = extract_visual_features(decode_image(SAMPLE_IMAGE))
+
+    assert from_bytes == from_path
+    # PIL and OpenCV JPEG decoders differ by a rounding step at most
+    for key in from_path:
+        assert from_array[key] == pytest.approx(from_path[key], rel=0.02, abs=1.0)
+
+
+def test_predict_rule_based_window():
+    result = HarvestPredictor().predict(decode_image(SAMPLE_IMAGE), "tomato", "semiripe")
+    days = result["harvest_window_days"]
+    assert result["sub_stage"] in ("early", "mid", "late")
+    assert days["earliest"] <= days["expected"] <= days["latest"]
+
+
+@pytest.fixture
+def rf_model_path(tmp_path):
+    rng = np.random.default_rng(0)
+    X = rng.random((200, 7)) * [3, 2, 2, 180, 255, 255, 300]
+    rf = RandomForestRegressor(n_estimators=20, random_state=0).fit(X, rng.random(200) * 3)
+    path = tmp_path / "rf.pkl"
+    joblib.dump(rf, path)
+    return str(path)
+
+
+def _features(n):
+    rng = np.random.default_rng(1)
+    return [
+        {"hue": h, "saturation": s, "brightness": b, "laplacian": lap, "a_channel": a}
+        for h, s, b, lap, a in rng.random((n, 5)) * [180, 255, 255, 300, 200]
+    ]
+
+
+def test_predict_many_matches_per_image_forest(rf_model_path):
+    predictor = HarvestPredictor(rf_model_path)
+    features = _features(12)
+    crops = ["tomato", "banana", "mango", "papaya"] * 3
+    stages = ["unripe", "semiripe", "ripe"] * 4
+
+    batch = predictor.predict_from_features(features, crops, stages)
+    for f, crop, stage, result in zip(features, crops, stages, batch):
+        X = np.array([[
+            predictor.crop_encoder.transform([crop])[0],
+            predictor.stage_encoder.transform([stage])[0],
+            predictor.substage_encoder.transform([result["sub_stage"]])[0],
+            f["hue"], f["saturation"], f["brightness"], f["laplacian"],
+        ]])
+        tree_preds = np.array([tree.predict(X)[0] for tree in predictor.rf.estimators_])
+        days = result["harvest_window_days"]
+        assert days["earliest"] == round(float(tree_preds.min()), 2)
+        assert days["expected"] == round(float(tree_preds.mean()), 2)
+        assert days["latest"] == round(float(tree_preds.max()), 2)
+
+
+def test_flat_forest_matches_sklearn_trees(rf_model_path):
+    predictor = HarvestPredictor(rf_model_path)
+    rng = np.random.default_rng(2)
+    X = rng.random((500, 7)) * [3, 2, 2, 180, 255, 255, 300]
+    expected = np.stack([tree.predict(X) for tree in predictor.rf.estimators_])
+    assert np.array_equal(predictor._forest.predict_trees(X, chunk_rows=128), expected)
+
+
+def test_window_quantiles_narrow_the_window(rf_model_path):
+    features = _features(8)
+    crops, stages = ["tomato"] * 8, ["unripe"] * 8
+    full = HarvestPredictor(rf_model_path).predict_from_features(features, crops, stages)
+    narrow = HarvestPredictor(rf_model_path, window_quantiles=(0.1, 0.9)).predict_from_features(
+        features, crops, stages
+    )
+    for a, b in zip(full, narrow):
+        assert a["harvest_window_days"]["earliest"] <= b["harvest_window_days"]["earliest"]
+        assert b["harvest_window_days"]["latest"] <= a["harvest_window_days"]["latest"]
+
+    with pytest.raises(ValueError):
+        HarvestPredictor(window_quantiles=(0.9, 0.1))
+
+
+def test_fast_features_match_legacy_implementation():
+    pixels = decode_image(SAMPLE_IMAGE)
+    legacy = _legacy_visual_features(pixels, "RGB")
+    fast = extract_visual_features(pixels)
+    for key in legacy:
+        assert fast[key] == pytest.approx(legacy[key], rel=1e-9)
+
+
+def test_downsampled_features_within_documented_tolerance():
+    pixels = decode_image(SAMPLE_IMAGE)
+    full = extract_visual_features(pixels)
+    small = extract_visual_features(pixels, max_side=1024)
+    assert small["hue"] == pytest.approx(full["hue"], abs=0.5)
+    for key in ("saturation", "brightness", "a_channel"):
+        assert small[key] == pytest.approx(full[key], abs=0.1)
+
+
+def test_sub_stage_confidence_grows_away_from_thresholds():
+    tomato = {"hue": 0.0, "saturation": 0.0, "brightness": 0.0, "laplacian": 0.0}
+    assert sub_stage_confidence({**tomato, "a_channel": 135.0}, "tomato", "semiripe") == 0.5
+    assert sub_stage_confidence({**tomato, "a_channel": 142.5}, "tomato", "semiripe") == 1.0
+    assert sub_stage_confidence({**tomato, "a_channel": 131.25}, "tomato", "unripe") == 0.75
+    assert sub_stage_confidence({**tomato, "a_channel": 135.0}, "tomato", "ripe") == 1.0
@@ -0,0 +1,85 @@
+# tests/test_harvest_scheduler.py
+import itertools
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from modules.harvest_prediction.harvest_scheduler import HarvestScheduler
+
+DAY0 = date(2026, 1, 1)
+
+
+def _random_scheduler(n, seed, horizon=30, max_len=6):
+    rng = random.Random(seed)
+    scheduler, windows = HarvestScheduler(), {}
+    for plot in range(n):
+        start = rng.randrange(horizon)
+        end = start + rng.randrange(max_len)
+        windows[plot] = (start, end)
+        scheduler.add_window(plot, DAY0 + timedelta(start), DAY0 + timedelta(end))
+    return scheduler, windows
+
+
+def _min_crew_days_brute_force(windows, capacity):
+    # smallest k such that some k crew-days (with repetition) cover everyone
+    days = sorted({d for s, e in windows.values() for d in range(s, e + 1)})
+    for k in range(1, len(windows) + 1):
+        for combo in itertools.combinations_with_replacement(days, k):
+            slots = list(combo)
+            # assign plots by deadline to the earliest usable slot (EDF on slots)
+            load = {i: 0 for i in range(len(slots))}
+            ok = True
+            for plot, (s, e) in sorted(windows.items(), key=lambda kv: kv[1][1]):
+                for i, d in enumerate(slots):
+                    if s <= d <= e and load[i] < capacity:
+                        load[i] += 1
+                        break
+                else:
+                    ok = False
+                    break
+            if ok:
+                return k
+    return len(windows)
+
+
+def test_harvestable_on_matches_scan():
+    scheduler, windows = _random_scheduler(300, seed=1)
+    for offset in range(-2, 40):
+        day = DAY0 + timedelta(offset)
+        expected = sorted(p for p, (s, e) in windows.items() if s <= offset <= e)
+        assert scheduler.harvestable_on(day) == expected
+        assert scheduler.count_harvestable_on(day) == len(expected)
+
+
+def test_plan_covers_every_window_and_respects_capacity():
+    scheduler, windows = _random_scheduler(200, seed=2)
+    plan = scheduler.plan(crew_capacity=5)
+    seen = []
+    for crew_day in plan:
+        offset = (date.fromisoformat(crew_day["date"]) - DAY0).days
+        assert len(crew_day["plots"]) <= 5
+        for plot in crew_day["plots"]:
+            assert windows[plot][0] <= offset <= windows[plot][1]
+        seen.extend(crew_day["plots"])
+    assert sorted(seen) == sorted(windows)
+
+
+@pytest.mark.parametrize("capacity", [None, 1, 2])
+def test_min_crew_days_is_optimal_on_small_fields(capacity):
+    for seed in range(15):
+        scheduler, windows = _random_scheduler(6, seed=seed, horizon=8, max_len=3)
+        brute = _min_crew_days_brute_force(windows, capacity or len(windows))
+        assert scheduler.min_crew_days(capacity) == brute
+
+
+def test_add_prediction_and_replan():
+    scheduler = HarvestScheduler()
+    scheduler.add_prediction("plot-a", {"harvest_window_dates": {
+        "earliest": "2026-01-02", "expected": "2026-01-03", "latest": "2026-01-04"}})
+    assert scheduler.harvestable_on("2026-01-03") == ["plot-a"]
+
+    scheduler.add_window("plot-a", "2026-02-01", "2026-02-02")
+    assert scheduler.harvestable_on("2026-01-03") == []
+    with pytest.raises(ValueError):
+        scheduler.add_window("plot-b", "2026-02-02", "2026-02-01")
@@ -0,0 +1,67 @@
+# tests/test_logger.py
+import os
+
+import pytest
+
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor
+from utils import logger
+from utils.preprocess import decode_image
+
+
+@pytest.fixture
+def metrics_on():
+    logger.metrics.reset()
+    logger.enable(True)
+    yield logger.metrics
+    logger.enable(False)
+    logger.metrics.reset()
+
+
+def test_disabled_records_nothing():
+    logger.enable(False)
+    logger.metrics.reset()
+
+    @logger.instrument("stage_a")
+    def work():
+        return 1
+
+    with logger.timed("stage_b"):
+        work()
+    assert logger.metrics.snapshot() == {}
+
+
+def test_percentiles_and_errors(metrics_on):
+    for ms in range(1, 101):
+        metrics_on.observe("model_forward", ms / 1000)
+    metrics_on.observe("model_forward", 0.001, error=True)
+
+    stats = metrics_on.snapshot()["model_forward"]
+    assert stats["count"] == 101 and stats["errors"] == 1
+    assert stats["p50_ms"] == pytest.approx(50, abs=1)
+    assert stats["p95_ms"] == pytest.approx(95, abs=1)
+    assert stats["p99_ms"] == pytest.approx(99, abs=1)
+
+    text = metrics_on.to_prometheus()
+    assert 'agritrifusion_stage_seconds_count{stage="model_forward"} 101' in text
+    assert 'agritrifusion_stage_errors_total{stage="model_forward"} 1' in text
+
+
+def test_throughput_is_calls_per_wall_clock_second(metrics_on, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(logger.time, "perf_counter", lambda: clock[0])
+    metrics_on.reset()
+    for _ in range(10):
+        metrics_on.observe("model_forward", 0.001)
+    clock[0] += 5.0
+    # 10 calls in 5 s, however short each call was
+    assert metrics_on.snapshot()["model_forward"]["throughput_per_s"] == 2.0
+
+
+def test_trace_collects_nested_spans(metrics_on):
+    image = os.path.join(os.path.dirname(__file__), "..", "assets", "sample_tomato.jpg")
+    with logger.trace() as t:
+        HarvestPredictor().predict(decode_image(image), "tomato", "unripe")
+
+    stages = [span["stage"] for span in t.to_dict()["spans"]]
+    assert stages == ["image_decode", "feature_extraction", "harvest_prediction"]
+    assert set(metrics_on.snapshot()) == set(stages)
@@ -0,0 +1,65 @@
+# tests/test_ortho_analysis.py
+import numpy as np
+import pytest
+from PIL import Image
+
+from modules.field_analysis.ortho_analyzer import analyze_orthomosaic
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor
+from modules.stage_detection import abhi_predict
+
+
+@pytest.fixture
+def mosaic():
+    # 700 x 900 field: green left half, red right half, black nodata strip at the bottom
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 40, (700, 900, 3), dtype=np.uint8)
+    img[:, :450, 1] += 150
+    img[:, 450:, 0] += 180
+    img[600:] = 0
+    return img
+
+
+def test_tiles_match_single_image_pipeline(random_model, mosaic):
+    grid = analyze_orthomosaic(mosaic, tile_size=256, batch_size=4, workers=1)
+
+    assert grid.shape == (3, 4)
+    # last row only has 88 px of field over a 100 px nodata strip
+    assert (grid.crop[2] == -1).all() and np.isnan(grid.harvest_days[2]).all()
+    assert grid.summary()["tiles_analyzed"] == 8
+
+    predictor = HarvestPredictor()
+    for record in grid.records():
+        tile = mosaic[record["y"]:record["y"] + 256, record["x"]:record["x"] + 256]
+        expected = abhi_predict.predict_image(tile)
+        harvest = predictor.predict(tile, expected["crop"], expected["stage"])
+        assert (record["crop"], record["stage"]) == (expected["crop"], expected["stage"])
+        assert record["sub_stage"] == harvest["sub_stage"]
+        assert record["days_to_harvest"] == pytest.approx(harvest["harvest_window_days"]["expected"])
+
+
+def test_memory_mapped_source_in_parallel(random_model, mosaic, tmp_path):
+    path = tmp_path / "mosaic.npy"
+    np.save(path, mosaic)
+
+    serial = analyze_orthomosaic(mosaic, tile_size=256, batch_size=3, workers=1)
+    parallel = analyze_orthomosaic(str(path), tile_size=256, batch_size=3, workers=2)
+
+    # forked workers inherit the random model
+    assert np.array_equal(serial.crop, parallel.crop)
+    assert np.array_equal(serial.sub_stage, parallel.sub_stage)
+    assert np.allclose(serial.harvest_days, parallel.harvest_days, equal_nan=True)
+
+
+def test_heatmap_and_image_file(random_model, mosaic, tmp_path):
+    path = tmp_path / "mosaic.png"
+    Image.fromarray(mosaic).save(path)
+    grid = analyze_orthomosaic(str(path), tile_size=300, workers=1)
+
+    assert grid.shape == (3, 3)
+    heat = grid.heatmap("harvest_days", cell_px=4)
+    assert heat.shape == (12, 12, 3) and heat.dtype == np.uint8
+    assert (heat[8:] == 0).all()  # nodata row
+    stage = grid.heatmap("stage", cell_px=1)
+    assert stage.shape == (3, 3, 3)
+    with pytest.raises(ValueError):
+        grid.heatmap("nope")
@@ -1,12 +1,44 @@
 # tests/test_pipeline.py
-from modules.stage_detection.predict_stage import predict_stage
-from modules.fertilizer_reco.fert_reco import recommend_fertilizer
-from modules.yield_prediction.predict_yield import predict_yield_from_fertilizer
-
-def test_end_to_end_mock():
-    s = predict_stage(None)  # mock
-    assert 'stage' in s and 'crop' in s
-    f = recommend_fertilizer(s)
-    assert 'fertilizer' in f and 'dose' in f
-    y = predict_yield_from_fertilizer(f)
-    assert 'yield' in y and 'days_left' in y
+import os
+
+import pytest
+
+from modules.stage_detection import abhi_predict
+from modules.stage_detection.predict_stage import predict_stage_real
+from modules.yield_prediction.yield_estimator import estimate_yield
+from utils import logger
+from utils.pipeline import analyze_image
+from utils.preprocess import decode_image
+
+SAMPLE_IMAGE = os.path.join(os.path.dirname(__file__), "..", "assets", "sample_tomato.jpg")
+
+
+def test_end_to_end(random_model):
+    crop, stage = predict_stage_real(SAMPLE_IMAGE)
+    assert crop in abhi_predict.crops and stage in abhi_predict.stages
+
+    res = analyze_image(SAMPLE_IMAGE, 4.0, 2.0, 3.0)
+    assert res["crop"].lower() == crop and res["stage"].lower() == stage
+    assert "primary" in res["fertilizer"]
+    assert res["harvest"]["sub_stage"] in ("early", "mid", "late")
+
+    y = estimate_yield(crop, 2.5, 4000, 6.5, "medium")
+    assert y["estimated_yield_kg"] == pytest.approx(y["estimated_yield_tons"] * 1000)
+
+
+def test_concurrent_stages_match_serial_run(random_model):
+    image = decode_image(SAMPLE_IMAGE)
+    serial = analyze_image(image, 4.0, 2.0, 3.0, concurrent=False)
+
+    logger.enable(True)
+    try:
+        with logger.trace() as t:
+            concurrent = analyze_image(image, 4.0, 2.0, 3.0, concurrent=True)
+    finally:
+        logger.enable(False)
+        logger.metrics.reset()
+
+    assert concurrent == serial
+    stages = {span["stage"] for span in t.spans}
+    # spans recorded on the worker threads reach the request trace
+    assert {"feature_extraction", "fertilizer_scoring", "model_forward"} <= stages
@@ -0,0 +1,84 @@
+# tests/test_results_db.py
+import json
+from datetime import datetime, timedelta
+from itertools import product
+
+import pytest
+
+from utils.results_db import ResultsDB
+
+
+def _result(crop, stage, days=10.0):
+    return {
+        "crop": crop.capitalize(),
+        "stage": stage.capitalize(),
+        "crop_conf": 91.5,
+        "stage_conf": 80.25,
+        "fertilizer": {"primary": {"fertilizer_name": "Urea (46% N)"}},
+        "harvest": {
+            "sub_stage": "mid",
+            "harvest_window_days": {"earliest": days - 2, "expected": days, "latest": days + 2},
+            "harvest_window_dates": {"expected": "2026-10-27"},
+        },
+    }
+
+
+@pytest.fixture
+def db(tmp_path):
+    with ResultsDB(str(tmp_path / "results.db"), batch_size=100) as db:
+        yield db
+
+
+def test_bulk_insert_and_history_queries(db):
+    now = datetime.now()
+    combos = list(product(["north", "south"], ["tomato", "mango"], ["unripe", "semiripe", "ripe"]))
+    for i in range(3000):
+        field, crop, stage = combos[i % len(combos)]
+        db.add(_result(crop, stage), field=field, image_hash=f"h{i}", analyzed_at=now - timedelta(hours=i))
+
+    assert db.count() == 3000
+    # 3000 hours ~ 125 days; one combo every 12 hours -> 7 days = 14 rows
+    week = db.query(field="north", crop="Tomato", stage="ripe", last_days=7)
+    assert len(week) == 14
+    assert all(r["field"] == "north" and r["crop"] == "tomato" and r["stage"] == "ripe" for r in week)
+    assert [r["analyzed_at"] for r in week] == sorted((r["analyzed_at"] for r in week), reverse=True)
+    assert week[0]["result"] == _result("tomato", "ripe")
+    assert week[0]["sub_stage"] == "mid" and week[0]["days_to_harvest"] == 10.0
+    assert week[0]["fertilizer"] == "Urea (46% N)"
+
+    assert db.query(field="north", limit=5, with_result=False)[0].keys() >= {"crop", "stage", "image_hash"}
+    assert "result" not in db.query(limit=1, with_result=False)[0]
+    assert db.latest_for_image("h7")["crop"] == combos[7][1].capitalize()
+    assert db.latest_for_image("missing") is None
+
+    counts = db.stage_counts(field="south")
+    assert sum(counts.values()) == 1500 and counts[("mango", "ripe")] == 250
+
+
+def test_queries_use_indexes(db):
+    plan = " ".join(db.explain(field="north", crop="tomato", stage="ripe", last_days=7))
+    assert "idx_analyses_field" in plan
+    assert "idx_analyses_crop" in " ".join(db.explain(crop="tomato", stage="ripe"))
+    assert "idx_analyses_hash" in " ".join(db.explain(image_hash="abc"))
+    assert "idx_analyses_time" in " ".join(db.explain(last_days=1))
+
+
+def test_field_details_and_reopen(tmp_path):
+    path = str(tmp_path / "results.db")
+    detail = {
+        "image_num": 1, "filename": "img_0.jpg", "crop": "tomato", "ripening_stage": "ripe",
+        "ripening_confidence": 0.8, "crop_confidence": 0.95, "substage": "late",
+        "days_to_harvest": 1.5, "harvest_date": "2026-10-18",
+    }
+    with ResultsDB(path) as db:
+        db.add_many([detail, detail], field="north", analyzed_at="2026-10-17T10:00:00")
+        db.add(_result("mango", "unripe"), field="north")  # stays buffered until close
+
+    with ResultsDB(path) as db:
+        assert db.count(field="north") == 3
+        rows = db.query(field="north", crop="tomato", since="2026-10-17", until="2026-10-18")
+        assert len(rows) == 2
+        assert rows[0]["source"] == "img_0.jpg" and rows[0]["stage_conf"] == pytest.approx(80.0)
+        assert rows[0]["result"] == json.loads(json.dumps(detail))
+        mode = db._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
@@ -0,0 +1,119 @@
+# tests/test_server.py
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from modules.stage_detection import abhi_predict
+from utils.pipeline import analyze_image
+from utils.server import InferenceService
+
+SAMPLE_IMAGE = os.path.join(os.path.dirname(__file__), "..", "assets", "sample_tomato.jpg")
+
+
+@pytest.fixture
+def image_bytes():
+    with open(SAMPLE_IMAGE, "rb") as f:
+        return f.read()
+
+
+def _request(url, data=None, content_type="application/octet-stream"):
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(req, timeout=60) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as exc:
+        return exc.code, exc.read()
+
+
+def test_endpoints_match_in_process_results(random_model, image_bytes):
+    expected_stage = abhi_predict.predict_image(image_bytes)
+
+    with InferenceService(port=0) as service:
+        status, body = _request(service.url + "/predict/stage", image_bytes)
+        assert status == 200
+        stage = json.loads(body)
+        assert stage["crop"] == expected_stage["crop"] and stage["stage"] == expected_stage["stage"]
+        assert stage["crop_confidence"] == pytest.approx(expected_stage["crop_confidence"], abs=1e-6)
+
+        status, body = _request(service.url + "/predict/harvest?crop=tomato&stage=ripe", image_bytes)
+        assert status == 200 and json.loads(body)["sub_stage"] in ("early", "mid", "late")
+
+        fert = json.dumps({"crop": "tomato", "stage": "ripe", "N_mgkg": 4, "P_mgkg": 2, "K_mgkg": 3})
+        status, body = _request(service.url + "/predict/fertilizer", fert.encode(), "application/json")
+        assert status == 200 and "primary" in json.loads(body)
+
+        status, body = _request(service.url + "/analyze?N=4&P=2&K=3", image_bytes)
+        assert status == 200
+        combined = json.loads(body)
+        expected = analyze_image(image_bytes, 4.0, 2.0, 3.0)
+        assert combined["crop"] == expected["crop"] and combined["stage"] == expected["stage"]
+        assert combined["fertilizer"] == expected["fertilizer"]
+        assert combined["harvest"] == expected["harvest"]
+
+        status, body = _request(service.url + "/health")
+        health = json.loads(body)
+        assert status == 200 and health["status"] == "ok"
+        assert health["batcher"]["requests"] == 2
+
+        status, body = _request(service.url + "/metrics")
+        assert status == 200 and b"agritrifusion_batcher_batches" in body
+
+
+def test_concurrent_requests_are_batched(random_model, image_bytes):
+    results = [None] * 8
+
+    def call(i):
+        results[i] = _request(service.url + "/predict/stage", image_bytes)
+
+    # A long deadline so every request lands in the same batch
+    with InferenceService(port=0, max_batch_size=8, max_wait_ms=2000) as service:
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = service.batcher.stats()
+
+    assert all(status == 200 for status, _ in results)
+    assert len({json.loads(body)["crop"] for _, body in results}) == 1
+    assert stats["requests"] == 8
+    assert stats["batches"] < 8
+    assert stats["mean_batch_size"] > 1
+
+
+def test_errors_and_timeouts(random_model, image_bytes, monkeypatch):
+    with InferenceService(port=0, request_timeout=0.2, max_body_mb=0.001) as service:
+        assert _request(service.url + "/nope", b"x")[0] == 404
+        assert _request(service.url + "/predict/stage", b"not an image")[0] == 400
+        assert _request(service.url + "/analyze?N=4&P=2", b"x")[0] == 400
+        assert _request(service.url + "/predict/fertilizer", b"{}", "application/json")[0] == 400
+        assert _request(service.url + "/predict/stage", image_bytes)[0] == 413
+
+    with InferenceService(port=0) as service:
+        status, body = _request(service.url + "/predict/harvest?crop=apple&stage=ripe", image_bytes)
+        assert status == 400 and "apple" in json.loads(body)["error"]
+        assert _request(service.url + "/predict/harvest?stage=overripe", image_bytes)[0] == 400
+        fert = json.dumps({"crop": "apple", "stage": "ripe", "N_mgkg": 4, "P_mgkg": 2, "K_mgkg": 3})
+        assert _request(service.url + "/predict/fertilizer", fert.encode(), "application/json")[0] == 400
+        fert = json.dumps({"crop": "Tomato", "stage": 3, "N_mgkg": 4, "P_mgkg": 2, "K_mgkg": 3})
+        assert _request(service.url + "/predict/fertilizer", fert.encode(), "application/json")[0] == 400
+        # still serving after the rejected requests
+        assert _request(service.url + "/predict/harvest?crop=TOMATO&stage=ripe", image_bytes)[0] == 200
+
+    release = threading.Event()
+
+    def stuck_model(tensors):
+        release.wait()
+        return []
+
+    monkeypatch.setattr(abhi_predict, "predict_tensors", stuck_model)
+
+    with InferenceService(port=0, request_timeout=0.2) as service:
+        status, _ = _request(service.url + "/predict/stage", image_bytes)
+        release.set()
+        assert status == 504
+        assert service.batcher.stats()["timeouts"] == 1
@@ -0,0 +1,77 @@
+# tests/test_shared_models.py
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from modules.stage_detection import abhi_predict
+from modules.fertilizer_reco import fert_reco
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor
+from utils import shared_models
+from utils.pipeline import analyze_image
+from utils.shared_models import SharedModelPool, memory_usage
+
+SAMPLE_IMAGE = os.path.join(os.path.dirname(__file__), "..", "assets", "sample_tomato.jpg")
+
+
+def _worker_state():
+    # runs inside a pool worker
+    model = abhi_predict.get_model()
+    ensemble = fert_reco._compiled.ensemble
+    return {
+        "all_shared": all(p.is_shared() for p in model.parameters()),
+        "memmapped": all(
+            isinstance(a, np.memmap) for a in (ensemble.feature, ensemble.threshold, ensemble.left, ensemble.value)
+        ),
+        "loaded_joblib_models": fert_reco._priority_models is not None,
+        "pid": os.getpid(),
+        "predictor": id(shared_models._predictor),
+        "rf_loaded": shared_models._predictor.rf is not None,
+    }
+
+
+@pytest.mark.parametrize("context", ["spawn", "fork"])
+def test_workers_use_parent_models(random_model, tmp_path, context):
+    rf_path = str(tmp_path / "harvest_rf.joblib")
+    X = np.random.default_rng(0).random((30, 7))
+    joblib.dump(RandomForestRegressor(n_estimators=3, random_state=0).fit(X, 10 * X[:, 0]), rf_path)
+    expected = analyze_image(
+        SAMPLE_IMAGE, 4.0, 2.0, 3.0, predictor=HarvestPredictor(rf_path), concurrent=False
+    )
+
+    with SharedModelPool(workers=2, mp_context=context, cache_dir=str(tmp_path), rf_model_path=rf_path) as pool:
+        results = list(pool.analyze([SAMPLE_IMAGE] * 4, 4.0, 2.0, 3.0))
+        states = [pool.submit(_worker_state).result() for _ in range(4)]
+        report = pool.memory_report()
+        pids = pool.worker_pids()
+
+    for result in results:
+        assert result["crop"] == expected["crop"] and result["stage"] == expected["stage"]
+        assert result["crop_conf"] == pytest.approx(expected["crop_conf"], abs=1e-5)
+        assert result["fertilizer"] == expected["fertilizer"]
+        assert result["harvest"] == expected["harvest"]
+
+    for state in states:
+        assert state["all_shared"] and state["memmapped"] and state["rf_loaded"]
+        assert state["pid"] in pids
+        if context == "spawn":
+            # forked workers inherit whatever the parent had loaded already
+            assert not state["loaded_joblib_models"]
+    # one predictor per worker, reused across tasks
+    assert len({(s["pid"], s["predictor"]) for s in states}) == len({s["pid"] for s in states})
+
+    assert 1 <= len(report["workers"]) <= 2
+    for worker in report["workers"]:
+        assert 0 < worker["uss_mb"] <= worker["rss_mb"]
+    assert report["workers_uss_mb"] == pytest.approx(sum(w["uss_mb"] for w in report["workers"]), abs=0.2)
+
+
+def test_memory_usage_of_this_process():
+    usage = memory_usage()
+    assert usage["pid"] == os.getpid()
+    assert usage["rss_mb"] > 0
+    if usage["uss_mb"] is not None:
+        assert usage["uss_mb"] <= usage["rss_mb"]
+        assert usage["pss_mb"] <= usage["rss_mb"]
@@ -0,0 +1,101 @@
+# tests/test_stage_detection.py
+import numpy as np
+import pytest
+from PIL import Image
+
+from modules.stage_detection import abhi_predict, cpu_inference
+
+
+def _images(n):
+    rng = np.random.default_rng(0)
+    return [
+        Image.fromarray(rng.integers(0, 255, (64 + i, 80, 3), dtype=np.uint8))
+        for i in range(n)
+    ]
+
+
+def test_import_does_not_load_model():
+    assert abhi_predict._model is None
+
+
+@pytest.mark.parametrize("shape", [(48, 64), (48, 64, 4)])
+def test_gray_and_rgba_arrays_are_converted_like_files(random_model, tmp_path, shape):
+    pixels = np.random.default_rng(1).integers(0, 255, shape, dtype=np.uint8)
+    path = tmp_path / "image.png"
+    Image.fromarray(pixels).save(path)
+    assert abhi_predict.predict_image(pixels) == abhi_predict.predict_image(str(path))
+
+
+def test_predict_images_matches_predict_image(random_model):
+    images = _images(5)
+    single = [abhi_predict.predict_image(img) for img in images]
+    batched = list(abhi_predict.predict_images(images, batch_size=2))
+
+    assert len(batched) == len(single)
+    for a, b in zip(single, batched):
+        assert a.keys() == b.keys()
+        assert a["crop"] == b["crop"] and a["stage"] == b["stage"]
+        assert a["crop_confidence"] == pytest.approx(b["crop_confidence"], abs=0.05)
+        assert a["stage_confidence"] == pytest.approx(b["stage_confidence"], abs=0.05)
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 7])
+def test_predict_images_keeps_input_order_across_batches(random_model, batch_size):
+    images = _images(5)
+    expected = [abhi_predict.predict_image(img) for img in images]
+
+    # generator input, partial last batch
+    batched = list(abhi_predict.predict_images((img for img in images), batch_size=batch_size))
+    assert [(r["crop"], r["stage"]) for r in batched] == [(r["crop"], r["stage"]) for r in expected]
+    assert [r["crop_confidence"] for r in batched] == pytest.approx(
+        [r["crop_confidence"] for r in expected], abs=0.05
+    )
+    assert list(abhi_predict.predict_images([], batch_size=batch_size)) == []
+
+
+def test_predict_images_rejects_bad_batch_size(random_model):
+    with pytest.raises(ValueError):
+        list(abhi_predict.predict_images(_images(1), batch_size=0))
+
+
+def test_warmup_uses_shared_model(random_model):
+    abhi_predict.warmup()
+    assert abhi_predict.get_model() is random_model
+
+
+def test_fast_fp32_build_matches_reference(random_model):
+    images = _images(4)
+    fast = cpu_inference.build_fast_model(random_model, channels_last=True, trace=True)
+    report = cpu_inference.accuracy_report(random_model, fast, images, batch_size=2)
+
+    assert report["images"] == 4
+    assert report["crop_agreement"] == 1.0 and report["stage_agreement"] == 1.0
+    assert report["max_abs_prob_delta"] < 1e-4
+
+
+def test_static_int8_build_runs_through_predict_image(random_model):
+    images = _images(4)
+    fast = cpu_inference.build_fast_model(random_model, quantize="static", calibration_images=images)
+    report = cpu_inference.accuracy_report(random_model, fast, images)
+    assert 0.0 <= report["max_abs_prob_delta"] <= 1.0
+
+    abhi_predict.use_model(fast)
+    result = abhi_predict.predict_image(images[0])
+    assert result["crop"] in abhi_predict.crops
+
+    with pytest.raises(ValueError):
+        cpu_inference.build_fast_model(random_model, quantize="static")
+
+
+def test_fast_inference_tag_covers_calibration_set(random_model):
+    images = _images(4)
+    tags = []
+    for calibration in (images[:2], images[2:], iter(images[:2])):
+        abhi_predict.use_model(random_model, tag="checkpoint:test")
+        reference = cpu_inference.enable_fast_inference(quantize="static", calibration_images=calibration)
+        assert reference is random_model
+        tags.append(abhi_predict.model_tag())
+
+    assert tags[0].startswith("checkpoint:test+fast(") and "calibration=" in tags[0]
+    assert tags[0] != tags[1]
+    assert tags[0] == tags[2]
@@ -0,0 +1,114 @@
+# tests/test_tensor_pack.py
+import json
+import os
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from modules.stage_detection import abhi_predict
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor, extract_visual_features
+from utils.preprocess import decode_image
+from utils import tensor_pack
+from utils.tensor_pack import PackedArchive, analyze_packed, pack_archive, predict_packed
+
+
+@pytest.fixture
+def images(tmp_path):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"img_{i}.jpg"
+        Image.fromarray(rng.integers(0, 256, (120 + 10 * i, 160, 3), dtype=np.uint8)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_pack_round_trip(images, tmp_path, workers):
+    out = tmp_path / "archive"
+    summary = pack_archive(images, str(out), chunk_size=2, workers=workers)
+    assert summary == {"packed": 5, "skipped": 0, "failed": []}
+    assert len(json.loads((out / "index.json").read_text())["chunks"]) == 3
+
+    archive = PackedArchive(str(out))
+    assert len(archive) == 5
+    for i, path in enumerate(images):
+        pixels = decode_image(path)
+        assert torch.equal(archive.tensor(i), abhi_predict.preprocess(pixels))
+        assert archive.features(i) == pytest.approx(extract_visual_features(pixels))
+
+    sources, tensors, features = next(archive.iter_batches(batch_size=8))
+    assert len(sources) == 2 and tensors.shape == (2, 3, 224, 224)
+    assert features.shape == (2, 5)
+
+
+def test_pack_appends_and_records_failures(images, tmp_path):
+    out = str(tmp_path / "archive")
+    pack_archive(images[:3], out, workers=1)
+
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+    summary = pack_archive(images + [str(broken)], out, workers=1)
+
+    assert summary["packed"] == 2 and summary["skipped"] == 3
+    assert len(summary["failed"]) == 1
+    archive = PackedArchive(out)
+    assert len(archive) == 5 and len(archive.failed) == 1
+
+
+def test_interrupted_pack_resumes_from_log(images, tmp_path, monkeypatch):
+    out = tmp_path / "archive"
+    pack_one = tensor_pack._pack_one
+
+    def crash_on_fourth(path):
+        if path.endswith("img_3.jpg"):
+            raise KeyboardInterrupt
+        return pack_one(path)
+
+    monkeypatch.setattr(tensor_pack, "_pack_one", crash_on_fourth)
+    with pytest.raises(KeyboardInterrupt):
+        pack_archive(images, str(out), chunk_size=2, workers=1)
+    monkeypatch.undo()
+
+    # index.json was only written at the start, the finished chunks are in the log
+    assert json.loads((out / "index.json").read_text())["chunks"] == []
+    with open(out / "index.log", "a", encoding="utf-8") as f:
+        f.write('{"chunk": {"tens')  # torn last record
+    assert len(PackedArchive(str(out))) == 2
+
+    summary = pack_archive(images, str(out), chunk_size=2, workers=1)
+    assert summary == {"packed": 3, "skipped": 2, "failed": []}
+    assert not (out / "index.log").exists()
+    assert len(json.loads((out / "index.json").read_text())["chunks"]) == 3
+    assert PackedArchive(str(out)).sources == [os.path.abspath(p) for p in images]
+
+
+def test_packed_inference_matches_image_inference(random_model, images, tmp_path):
+    out = str(tmp_path / "archive")
+    pack_archive(images, out, chunk_size=3, workers=1)
+    archive = PackedArchive(out)
+    predictor = HarvestPredictor()
+
+    stage_results = dict(predict_packed(archive, batch_size=2))
+    for record in analyze_packed(archive, predictor, batch_size=2):
+        path = record["source"]
+        expected = abhi_predict.predict_image(path)
+        assert stage_results[path] == expected
+        assert record["stage_detection"] == expected
+        assert record["harvest"] == predictor.predict(path, expected["crop"], expected["stage"])
+
+
+def test_float16_archive(random_model, images, tmp_path):
+    out = str(tmp_path / "archive")
+    pack_archive(images, out, dtype="float16", workers=1)
+    archive = PackedArchive(out)
+
+    exact = abhi_predict.preprocess(decode_image(images[0]))
+    assert archive.tensor(0).dtype == torch.float16
+    assert torch.allclose(archive.tensor(0).float(), exact, atol=1e-2)
+    assert len(list(predict_packed(archive))) == 5
+
+    with pytest.raises(ValueError):
+        pack_archive(images, out, dtype="float32", workers=1)
@@ -0,0 +1,74 @@
+# tests/test_video_analysis.py
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from modules.field_analysis import video_analyzer
+from modules.field_analysis.video_analyzer import FrameSampler, StreamAggregate, analyze_stream
+from modules.stage_detection import abhi_predict
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor
+
+
+def _frames():
+    # 3 scenes x 6 near-identical frames (small sensor noise)
+    rng = np.random.default_rng(0)
+    scenes = [rng.integers(0, 256, (96, 128, 3), dtype=np.uint8) for _ in range(3)]
+    return [
+        np.clip(scene.astype(np.int16) + rng.integers(-2, 3, scene.shape), 0, 255).astype(np.uint8)
+        for scene in scenes for _ in range(6)
+    ]
+
+
+@pytest.fixture
+def video_path(tmp_path):
+    path = str(tmp_path / "field.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (128, 96))
+    if not writer.isOpened():
+        pytest.skip("OpenCV has no video writer backend")
+    for frame in _frames():
+        writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    writer.release()
+    return path
+
+
+def test_sampler_skips_near_duplicates():
+    sampler = FrameSampler(threshold=6.0, max_skip=30)
+    kept = [i for i, frame in enumerate(_frames()) if sampler.keep(frame)]
+    assert kept == [0, 6, 12]
+
+    sampler = FrameSampler(threshold=6.0, max_skip=2)
+    kept = [i for i, frame in enumerate(_frames()[:6]) if sampler.keep(frame)]
+    assert kept == [0, 3]
+
+
+def test_video_stream_aggregates(random_model, video_path):
+    records = []
+    summary = analyze_stream(video_path, batch_size=2, on_result=records.append)
+
+    assert summary["frames_seen"] == 18
+    assert summary["frames_analyzed"] == len(records) == 3
+    assert [r["frame_index"] for r in records] == [0, 6, 12]
+    assert sum(summary["substage_distribution"].values()) == 3
+    assert sum(summary["stage_distribution"].values()) == pytest.approx(100, abs=0.2)
+    window = summary["harvest_window"]
+    assert window["earliest_days"] <= window["expected_days"] <= window["latest_days"]
+
+
+def test_frames_match_single_image_pipeline(random_model, tmp_path):
+    paths = []
+    for i, frame in enumerate(_frames()[::6]):
+        paths.append(str(tmp_path / f"frame_{i}.png"))
+        Image.fromarray(frame).save(paths[-1])
+
+    predictor = HarvestPredictor()
+    aggregate = StreamAggregate()
+    records = list(video_analyzer.iter_stream_results(
+        str(tmp_path), batch_size=2, sampler=False, predictor=predictor, aggregate=aggregate
+    ))
+
+    assert len(records) == 3 and aggregate.frames_seen == 3
+    for path, record in zip(paths, records):
+        expected = abhi_predict.predict_image(path)
+        assert record["stage_detection"] == expected
+        assert record["harvest"] == predictor.predict(path, expected["crop"], expected["stage"])
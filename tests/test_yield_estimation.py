@@ -0,0 +1,111 @@
+# tests/test_yield_estimation.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.yield_prediction import yield_estimator
+from modules.yield_prediction.yield_estimator import (
+    estimate_field_yield,
+    estimate_field_yield_frame,
+    monte_carlo_yield,
+    yield_scenario_grid,
+)
+
+CROPS = ["tomato", "banana", "mango", "papaya"]
+SOILS = ["Loamy", "Black", "Red", "Clay", "Sandy"]
+IRRIGATION = ["Drip", "Sprinkler", "Flood", "Rain-fed"]
+FERTILIZER = ["Low", "Medium", "High"]
+
+
+def _reference_tons(crop, area_acres, num_plants, soil_type, soil_ph, irrigation, fertilizer_level, avg_temp):
+    # The inline model the Streamlit app used before it moved to the library
+    BASE_YIELD_TONS_ACRE = {"tomato": 26.3, "banana": 16.2, "mango": 6.1, "papaya": 20.2}
+    ph_factor = 1.0 if 6.0 <= soil_ph <= 7.0 else 0.9 if 5.5 <= soil_ph <= 7.5 else 0.75
+    soil_factor = {"Loamy": 1.0, "Black": 0.98, "Red": 0.92, "Clay": 0.88, "Sandy": 0.80}.get(soil_type, 0.85)
+    irr_factor = {"Drip": 1.1, "Sprinkler": 1.0, "Flood": 0.9, "Rain-fed": 0.75}.get(irrigation, 0.9)
+    fert_factor = {"Low": 0.8, "Medium": 1.0, "High": 1.15}.get(fertilizer_level, 1.0)
+    temp_factor = 1.0 if 20 <= avg_temp <= 32 else 0.9 if 15 <= avg_temp <= 35 else 0.75
+    optimal = {"tomato": 10000, "banana": 700, "mango": 40, "papaya": 2000}.get(crop, 5000)
+    density_factor = min(1.15, max(0.7, num_plants / (area_acres * optimal)))
+    return (BASE_YIELD_TONS_ACRE[crop] * area_acres * ph_factor * soil_factor * irr_factor
+            * fert_factor * temp_factor * density_factor)
+
+
+@pytest.fixture(scope="module")
+def fields():
+    rng = np.random.default_rng(0)
+    n = 500
+    return pd.DataFrame({
+        "crop": rng.choice(CROPS, n),
+        "area_acres": rng.uniform(0.1, 20, n).round(1),
+        "num_plants": rng.integers(1, 200000, n),
+        "soil_type": rng.choice(SOILS, n),
+        "soil_ph": rng.uniform(4.5, 8.5, n).round(1),
+        "irrigation": rng.choice(IRRIGATION, n),
+        "fertilizer_level": rng.choice(FERTILIZER, n),
+        "avg_temp": rng.uniform(10, 45, n).round(1),
+    })
+
+
+def test_vectorized_matches_scalar_model(fields):
+    result = estimate_field_yield_frame(fields)
+    expected = [_reference_tons(*row) for row in fields.itertuples(index=False)]
+    np.testing.assert_allclose(result["estimated_tons"], expected, rtol=1e-12)
+    np.testing.assert_allclose(result["max_tons"], np.array(expected) * 1.15, rtol=1e-12)
+
+    single = estimate_field_yield("tomato", 1.0, 5000, "Loamy", 6.5, "Drip")
+    assert float(single["estimated_tons"]) == pytest.approx(_reference_tons("tomato", 1.0, 5000, "Loamy", 6.5, "Drip", "Medium", 28.0))
+
+
+def test_unknown_crop_is_rejected():
+    with pytest.raises(ValueError):
+        estimate_field_yield(np.array(["tomato", "apple"]), 1.0, 5000, "Loamy", 6.5, "Drip")
+
+
+def test_scenario_grid_covers_every_combination():
+    ph = [5.0, 5.8, 6.5, 7.3, 8.0]
+    densities = [2000, 8000, 12000]
+    grid = yield_scenario_grid("tomato", 2.0, densities, "Loamy", ph, IRRIGATION)
+    assert len(grid) == len(ph) * len(IRRIGATION) * len(densities)
+
+    for row in grid.sample(10, random_state=0).itertuples(index=False):
+        assert row.estimated_tons == pytest.approx(_reference_tons(
+            row.crop, row.area_acres, row.num_plants, row.soil_type, row.soil_ph,
+            row.irrigation, row.fertilizer_level, row.avg_temp))
+
+    axes, tons = yield_scenario_grid("tomato", 2.0, densities, "Loamy", ph, IRRIGATION, as_frame=False)
+    assert tons.shape == (1, 1, 3, 1, 5, 4, 1, 1)
+
+
+def test_monte_carlo_bands():
+    deterministic = monte_carlo_yield(
+        ["tomato", "mango"], 2.0, [20000, 80], "Loamy", 6.5, "Drip",
+        n_samples=50, soil_ph_sd=0.0, avg_temp_sd=0.0, base_yield_cv=0.0, seed=0,
+    )
+    expected = estimate_field_yield(["tomato", "mango"], 2.0, [20000, 80], "Loamy", 6.5, "Drip")["estimated_tons"]
+    np.testing.assert_allclose(deterministic["p50"], expected)
+
+    bands = monte_carlo_yield("tomato", 2.0, 20000, "Loamy", 6.5, "Drip", n_samples=20000, seed=0, chunk_size=5000)
+    assert bands["p5"][0] < bands["p50"][0] < bands["p95"][0]
+
+
+def test_monte_carlo_chunks_samples_beyond_chunk_size(monkeypatch):
+    sizes = []
+    field_tons = yield_estimator._field_tons
+
+    def recording(*args):
+        tons = field_tons(*args)
+        sizes.append(tons.size)
+        return tons
+
+    monkeypatch.setattr(yield_estimator, "_field_tons", recording)
+    chunked = monte_carlo_yield(
+        ["tomato", "mango"], 2.0, [20000, 80], "Loamy", 6.5, "Drip", n_samples=20000, seed=0, chunk_size=3000
+    )
+    assert max(sizes) <= 3000 and sum(sizes) == 2 * 20000
+
+    whole = monte_carlo_yield(
+        ["tomato", "mango"], 2.0, [20000, 80], "Loamy", 6.5, "Drip", n_samples=20000, seed=1
+    )
+    for key in ("p5", "p50", "p95", "mean"):
+        np.testing.assert_allclose(chunked[key], whole[key], rtol=0.02)
@@ -0,0 +1,251 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+from modules.stage_detection import abhi_predict
+from modules.harvest_prediction.harvest_predictor import extract_visual_features
+
+# --------------------------------------------------
+# Content hashes
+# --------------------------------------------------
+def image_digest(image):
+    """
+    sha256 of the image content: file bytes for paths, the raw bytes for
+    bytes / uploads, pixels + shape for decoded arrays.
+    """
+    h = hashlib.sha256()
+    if isinstance(image, np.ndarray):
+        h.update(f"{image.shape}|{image.dtype}".encode())
+        h.update(np.ascontiguousarray(image).data)
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        h.update(image)
+    elif hasattr(image, "getvalue"):
+        h.update(image.getvalue())
+    else:
+        with open(image, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+_file_versions = {}
+_file_versions_lock = threading.Lock()
+
+
+def file_version(path):
+    """
+    Content hash of a model file, recomputed only when its size or mtime
+    changes, so replacing the file invalidates every cached result.
+    """
+    st = os.stat(path)
+    signature = (st.st_size, st.st_mtime_ns)
+
+    with _file_versions_lock:
+        cached = _file_versions.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    with open(path, "rb") as f:
+        version = hashlib.sha256(f.read()).hexdigest()[:16]
+
+    with _file_versions_lock:
+        _file_versions[path] = (signature, version)
+    return version
+
+
+# --------------------------------------------------
+# LRU + optional disk store
+# --------------------------------------------------
+class ResultCache:
+    """
+    In-process LRU of JSON-serialisable results keyed by
+    (namespace, image hash, model version, extra key parts).
+    disk_dir: optional directory where every entry is also written so hits
+    survive restarts (only the in-memory part is bounded by max_entries).
+    Values are copied in and out, callers can mutate what they get.
+    """
+
+    def __init__(self, max_entries=1024, disk_dir=None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(namespace, digest, version, *extra):
+        parts = [namespace, digest, version, *map(str, extra)]
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(self._entries[key])
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, value)
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._store(key, value)
+        self._write_disk(key, value)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    # ---- internals (caller holds the lock for _store) ----
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(value, f, default=float)
+        os.replace(tmp, path)
+
+
+# --------------------------------------------------
+# Cached pipeline stages
+# --------------------------------------------------
+def _callable_tag(predict):
+    # module.qualname, plus a cache_tag attribute of the function or of the
+    # object it is bound to (e.g. the cascade's threshold / heads).
+    # None for lambdas / closures without a cache_tag: their name does not
+    # say what they compute.
+    name = f"{getattr(predict, '__module__', '')}.{getattr(predict, '__qualname__', type(predict).__name__)}"
+    tag = getattr(predict, "cache_tag", None)
+    if tag is None:
+        tag = getattr(getattr(predict, "__self__", None), "cache_tag", None)
+    if tag is None:
+        return None if "<" in name else name
+    return f"{name}[{tag}]"
+
+
+def stage_model_version(predict=None):
+    """
+    Cache version of the crop / stage classifier: the active model's tag
+    (abhi_predict.model_tag, which hashes the checkpoint bytes when they
+    are loaded) and the predict callable. None when the model (installed
+    without a tag) or the callable cannot be identified; then nothing
+    should be cached.
+    """
+    # load first, the tag only exists once the checkpoint is in memory
+    abhi_predict.get_model()
+    tag = abhi_predict.model_tag()
+    callable_tag = _callable_tag(predict or abhi_predict.predict_image)
+    if tag is None or callable_tag is None:
+        return None
+    return f"{tag}|{callable_tag}"
+
+
+def cached_predict_image(image, cache, digest=None, predict=None):
+    """
+    predict_image (or the given predict callable) through the cache.
+    Keyed on the active model and the callable (stage_model_version), so
+    fast / int8 builds, cascades and the fp32 checkpoint never share
+    entries; an untagged model is not cached at all.
+    """
+    predict = predict or abhi_predict.predict_image
+    version = stage_model_version(predict)
+    if version is None:
+        return predict(image)
+    digest = digest or image_digest(image)
+    key = cache.make_key("stage", digest, version)
+    return cache.get_or_compute(key, lambda: predict(image))
+
+
+def cached_visual_features(image, cache, digest=None, max_side=None):
+    """
+    extract_visual_features through the cache (model independent).
+    """
+    digest = digest or image_digest(image)
+    key = cache.make_key("features", digest, "v1", max_side)
+    return cache.get_or_compute(
+        key, lambda: extract_visual_features(image, max_side=max_side)
+    )
+
+
+def cached_harvest_predict(predictor, image, crop, stage, cache, digest=None):
+    """
+    HarvestPredictor.predict through the cache. The features are cached on
+    their own; the prediction is keyed on the harvest model the predictor
+    loaded (or the rule-based fallback), the window quantiles and today's
+    date, since the result carries calendar dates.
+    """
+    digest = digest or image_digest(image)
+    key = cache.make_key(
+        "harvest", digest, predictor.model_version, crop, stage,
+        predictor.window_quantiles, date.today().isoformat(),
+    )
+
+    def compute():
+        features = cached_visual_features(image, cache, digest)
+        return predictor.predict_from_features([features], [crop], [stage])[0]
+
+    return cache.get_or_compute(key, compute)
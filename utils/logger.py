@@ -0,0 +1,234 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# Off unless AGRITRIFUSION_METRICS=1 (or enable() is called)
+_enabled = os.environ.get("AGRITRIFUSION_METRICS", "0") not in ("", "0", "false", "False")
+_current_trace = contextvars.ContextVar("agritrifusion_trace", default=None)
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled():
+    return _enabled
+
+
+# --------------------------------------------------
+# Registry: counters + latency samples per stage
+# --------------------------------------------------
+class _StageStats:
+    __slots__ = ("count", "errors", "total_seconds", "samples")
+
+    def __init__(self, window):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        # recent latencies for p50 / p95 / p99, bounded memory
+        self.samples = deque(maxlen=window)
+
+
+def _percentile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    idx = min(len(sorted_samples) - 1, max(0, round(q * len(sorted_samples)) - 1))
+    return sorted_samples[idx]
+
+
+class Metrics:
+    """
+    Thread-safe per-stage counters and latency windows (last `window`
+    observations per stage), exported as a dict / JSON / Prometheus text.
+    throughput_per_s is completed calls per wall-clock second since the
+    registry was created or reset.
+    """
+
+    def __init__(self, window=4096):
+        self.window = window
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def observe(self, stage, seconds, error=False):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = _StageStats(self.window)
+            stats.count += 1
+            stats.total_seconds += seconds
+            stats.samples.append(seconds)
+            if error:
+                stats.errors += 1
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._started = time.perf_counter()
+
+    def snapshot(self):
+        with self._lock:
+            stages = {
+                name: (s.count, s.errors, s.total_seconds, sorted(s.samples))
+                for name, s in self._stages.items()
+            }
+            elapsed = time.perf_counter() - self._started
+
+        result = {}
+        for name, (count, errors, total, samples) in stages.items():
+            result[name] = {
+                "count": count,
+                "errors": errors,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total * 1000 / count, 3) if count else 0.0,
+                "p50_ms": round(_percentile(samples, 0.50) * 1000, 3),
+                "p95_ms": round(_percentile(samples, 0.95) * 1000, 3),
+                "p99_ms": round(_percentile(samples, 0.99) * 1000, 3),
+                "throughput_per_s": round(count / elapsed, 3) if elapsed > 0 else 0.0,
+            }
+        return result
+
+    def to_json(self, **kwargs):
+        return json.dumps({"timestamp": time.time(), "stages": self.snapshot()}, **kwargs)
+
+    def to_prometheus(self):
+        # one snapshot, so both blocks list the same stages and counts
+        stages = sorted(self.snapshot().items())
+        lines = [
+            "# HELP agritrifusion_stage_seconds Pipeline stage latency",
+            "# TYPE agritrifusion_stage_seconds summary",
+        ]
+        for name, s in stages:
+            label = f'stage="{name}"'
+            for q, key in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+                lines.append(f'agritrifusion_stage_seconds{{{label},quantile="{q}"}} {s[key] / 1000:.6f}')
+            lines.append(f"agritrifusion_stage_seconds_sum{{{label}}} {s['total_ms'] / 1000:.6f}")
+            lines.append(f"agritrifusion_stage_seconds_count{{{label}}} {s['count']}")
+        lines.append("# TYPE agritrifusion_stage_errors_total counter")
+        for name, s in stages:
+            lines.append(f'agritrifusion_stage_errors_total{{stage="{name}"}} {s["errors"]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# --------------------------------------------------
+# Timing helpers
+# --------------------------------------------------
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        metrics.observe(self.stage, end - self.start, error=exc_type is not None)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append({
+                "stage": self.stage,
+                "start_ms": round((self.start - trace.start) * 1000, 3),
+                "duration_ms": round((end - self.start) * 1000, 3),
+                "error": exc_type is not None,
+            })
+        return False
+
+
+def timed(stage):
+    """
+    with timed("model_forward"): ...
+    Returns a shared no-op context manager when metrics are disabled.
+    """
+    return _Timer(stage) if _enabled else _NULL_TIMER
+
+
+def instrument(stage):
+    """
+    Decorator version of timed(); a single flag check when disabled.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --------------------------------------------------
+# Per-request trace
+# --------------------------------------------------
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def to_dict(self):
+        return {
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "spans": list(self.spans),
+        }
+
+
+@contextmanager
+def trace():
+    """
+    with trace() as t: analyze_image(...)
+    Collects every timed stage of the current request (thread / task) in
+    t.spans. Only records while metrics are enabled.
+    """
+    t = Trace()
+    token = _current_trace.set(t)
+    try:
+        yield t
+    finally:
+        _current_trace.reset(token)
+
+
+# --------------------------------------------------
+# Optional Streamlit sidebar panel
+# --------------------------------------------------
+def render_streamlit_panel(last_trace=None):
+    import streamlit as st
+
+    with st.sidebar:
+        st.markdown("### ⏱️ Pipeline Metrics")
+        snapshot = metrics.snapshot()
+        if not snapshot:
+            st.caption("No measurements yet.")
+        for name, s in snapshot.items():
+            st.markdown(
+                f"**{name}** · n={s['count']} · p50 {s['p50_ms']:.1f} ms · "
+                f"p95 {s['p95_ms']:.1f} ms · p99 {s['p99_ms']:.1f} ms"
+            )
+        if last_trace is not None:
+            st.markdown("#### Last request")
+            st.json(last_trace)
+        st.download_button("Download metrics (JSON)", metrics.to_json(indent=2), "metrics.json")
@@ -0,0 +1,105 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.stage_detection.abhi_predict import predict_image
+from modules.fertilizer_reco.fert_reco import recommend_fertilizer
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor, extract_visual_features
+from utils.preprocess import decode_image
+from utils.cache import (
+    cached_harvest_predict,
+    cached_predict_image,
+    cached_visual_features,
+    image_digest,
+)
+
+# --------------------------------------------------
+# Shared worker threads for independent stages
+# (OpenCV, torch and XGBoost release the GIL while they compute)
+# --------------------------------------------------
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="agritrifusion-stage")
+    return _executor
+
+
+def _submit(fn, *args, **kwargs):
+    # Copy the context so per-request traces (utils.logger.trace) see the spans
+    ctx = contextvars.copy_context()
+    return _get_executor().submit(ctx.run, fn, *args, **kwargs)
+
+
+def analyze_image(image, N_mgkg, P_mgkg, K_mgkg, predictor=None, cache=None, concurrent=True,
+                  classify=None):
+    """
+    Full "Analyze Crop" flow for one image.
+    The image (path, bytes, upload or array) is decoded once and the same
+    RGB array is handed to the classifier and the harvest feature
+    extractor, no temp files involved.
+    cache: optional utils.cache.ResultCache; classifier and harvest outputs
+    are then looked up by the content hash of the original image.
+    concurrent: harvest feature extraction starts right after decoding,
+    in parallel with the classifier, and fertilizer scoring runs alongside
+    the harvest window. The result is identical to the serial run.
+    classify: replaces predict_image for the crop / stage step (the HTTP
+    service passes its micro-batcher here).
+    Returns the same dict the Streamlit app keeps in session_state.results.
+    """
+    digest = image_digest(image) if cache is not None else None
+    pixels = decode_image(image)
+    if predictor is None:
+        predictor = HarvestPredictor()
+    if classify is None:
+        classify = predict_image
+
+    # Harvest features only need the pixels, start them now
+    features_future = None
+    if concurrent:
+        if cache is not None:
+            features_future = _submit(cached_visual_features, pixels, cache, digest)
+        else:
+            features_future = _submit(extract_visual_features, pixels)
+
+    # Step 1: Detect crop & stage
+    if cache is not None:
+        abhi_result = cached_predict_image(pixels, cache, digest, predict=classify)
+    else:
+        abhi_result = classify(pixels)
+    crop = abhi_result["crop"]
+    stage = abhi_result["stage"]
+
+    # Step 2: Fertilizer using detected crop/stage + manual NPK
+    fert_kwargs = dict(crop=crop, stage=stage, N_mgkg=N_mgkg, P_mgkg=P_mgkg, K_mgkg=K_mgkg)
+    if concurrent:
+        fert_future = _submit(recommend_fertilizer, **fert_kwargs)
+    else:
+        fert_result = recommend_fertilizer(**fert_kwargs)
+
+    # Step 3: Harvest prediction
+    if cache is not None:
+        if features_future is not None:
+            features_future.result()  # features are in the cache now
+        harvest_result = cached_harvest_predict(predictor, pixels, crop, stage, cache, digest)
+    elif features_future is not None:
+        harvest_result = predictor.predict_from_features([features_future.result()], [crop], [stage])[0]
+    else:
+        harvest_result = predictor.predict(pixels, crop, stage)
+
+    if concurrent:
+        fert_result = fert_future.result()
+
+    return {
+        "crop": crop.capitalize(),
+        "stage": stage.capitalize(),
+        "crop_conf": abhi_result["crop_confidence"],
+        "stage_conf": abhi_result["stage_confidence"],
+        "fertilizer": fert_result,
+        "harvest": harvest_result
+    }
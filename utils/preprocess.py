@@ -1,6 +1,11 @@
+import io
+import os
+
 from PIL import Image
 import numpy as np
 
+from utils.logger import instrument
+
 def preprocess_image_pil(image, size=(224,224)):
     image = image.convert('RGB').resize(size)
     arr = np.array(image).astype('float32') / 255.0
@@ -8,3 +13,22 @@ def preprocess_image_pil(image, size=(224,224)):
 
 def quality_check(image, min_size=(100,100)):
     return image.size[0] >= min_size[0] and image.size[1] >= min_size[1]
+
+@instrument("image_decode")
+def decode_image(source):
+    """
+    Decodes an image exactly once into an RGB uint8 array (H, W, 3).
+    Accepts a file path, raw bytes, a file-like object (e.g. a Streamlit
+    upload), a PIL image or an array that is already decoded (returned as is).
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, Image.Image):
+        return np.asarray(source.convert('RGB'))
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif isinstance(source, (str, os.PathLike)) and not os.path.isfile(source):
+        raise FileNotFoundError(f"Image not found: {source}")
+
+    with Image.open(source) as image:
+        return np.asarray(image.convert('RGB'))
@@ -0,0 +1,297 @@
+# utils/results_db.py
+"""
+SQLite history of analysis results.
+
+    python -m utils.results_db results.db import field_analysis_results.json --field north
+    python -m utils.results_db results.db query --field north --crop tomato --stage ripe --days 7
+
+One row per analyzed image with the columns the history queries filter
+on (field, crop, stage, time, image hash) plus the full result as JSON.
+The database runs in WAL mode, so the app / workers can keep inserting
+while reports are read. Inserts are buffered and written batch_size rows
+per transaction.
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY,
+    analyzed_at TEXT NOT NULL,          -- ISO 8601, local time
+    field TEXT,
+    image_hash TEXT,
+    source TEXT,
+    crop TEXT NOT NULL,                 -- lowercase, as in abhi_predict.crops
+    stage TEXT NOT NULL,                -- lowercase, as in abhi_predict.stages
+    crop_conf REAL,                     -- percent
+    stage_conf REAL,                    -- percent
+    sub_stage TEXT,
+    days_to_harvest REAL,
+    harvest_date TEXT,                  -- expected date, YYYY-MM-DD
+    fertilizer TEXT,                    -- primary fertilizer name
+    result TEXT NOT NULL                -- full result, JSON
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_field ON analyses (field, crop, stage, analyzed_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_crop ON analyses (crop, stage, analyzed_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_stage ON analyses (stage, analyzed_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_time ON analyses (analyzed_at);
+CREATE INDEX IF NOT EXISTS idx_analyses_hash ON analyses (image_hash);
+"""
+
+_COLUMNS = (
+    "analyzed_at", "field", "image_hash", "source", "crop", "stage", "crop_conf", "stage_conf",
+    "sub_stage", "days_to_harvest", "harvest_date", "fertilizer", "result",
+)
+_INSERT = f"INSERT INTO analyses ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+
+
+def _timestamp(value):
+    if value is None:
+        return datetime.now().isoformat(timespec="seconds")
+    if isinstance(value, datetime):
+        return value.isoformat(timespec="seconds")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _row(result, field, image_hash, source, analyzed_at):
+    """
+    result: an analyze_image dict, or a field report per_image_details entry.
+    """
+    if "ripening_stage" in result:
+        # field_analyzer detail, confidences are fractions there
+        crop, stage = result["crop"], result["ripening_stage"]
+        crop_conf = result["crop_confidence"] * 100
+        stage_conf = result["ripening_confidence"] * 100
+        sub_stage = result["substage"]
+        days, harvest_date = result["days_to_harvest"], result["harvest_date"]
+        fertilizer = None
+        source = source or result.get("filename")
+    else:
+        crop, stage = result["crop"], result["stage"]
+        crop_conf, stage_conf = result.get("crop_conf"), result.get("stage_conf")
+        harvest = result.get("harvest") or {}
+        sub_stage = harvest.get("sub_stage")
+        days = harvest.get("harvest_window_days", {}).get("expected")
+        harvest_date = harvest.get("harvest_window_dates", {}).get("expected")
+        fertilizer = ((result.get("fertilizer") or {}).get("primary") or {}).get("fertilizer_name")
+
+    return (
+        _timestamp(analyzed_at), field, image_hash, source, crop.lower(), stage.lower(), crop_conf,
+        stage_conf, sub_stage, days, harvest_date, fertilizer, json.dumps(result),
+    )
+
+
+class ResultsDB:
+    """
+    db = ResultsDB("results.db")
+    db.add(result, field="north", image_hash=image_digest(upload))
+    db.query(field="north", crop="tomato", stage="ripe", last_days=7)
+
+    One connection shared by the calling threads (serialized with a lock).
+    Other processes can open the same file; WAL lets them read while one
+    of them writes.
+    """
+
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        # autocommit mode, transactions are explicit
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"{path}: schema version {version} is newer than this code ({SCHEMA_VERSION})")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    # ---------------- writes ----------------
+
+    def add(self, result, field=None, image_hash=None, source=None, analyzed_at=None):
+        """
+        Buffers one result; written with the next full batch or flush().
+        """
+        row = _row(result, field, image_hash, source, analyzed_at)
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def add_many(self, results, field=None, analyzed_at=None):
+        """
+        results: iterable of result dicts, or of (result, image_hash) pairs.
+        Written in transactions of batch_size rows.
+        """
+        for item in results:
+            result, image_hash = item if isinstance(item, tuple) else (item, None)
+            self.add(result, field=field, image_hash=image_hash, analyzed_at=analyzed_at)
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(_INSERT, self._pending)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        self._pending = []
+
+    # ---------------- reads ----------------
+
+    def _where(self, field, crop, stage, image_hash, since, until, last_days):
+        clauses, params = [], []
+        for column, value in (("field", field), ("image_hash", image_hash)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        for column, value in (("crop", crop), ("stage", stage)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value.lower())
+        if last_days is not None:
+            since = datetime.now() - timedelta(days=last_days)
+        if since is not None:
+            clauses.append("analyzed_at >= ?")
+            params.append(_timestamp(since))
+        if until is not None:
+            clauses.append("analyzed_at < ?")
+            params.append(_timestamp(until))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(
+        self,
+        field=None,
+        crop=None,
+        stage=None,
+        image_hash=None,
+        since=None,
+        until=None,
+        last_days=None,
+        limit=None,
+        with_result=True,
+    ):
+        """
+        Matching rows, newest first, as dicts of the table columns
+        ("result" decoded, or left out with with_result=False).
+        since / until: datetime, date or ISO string (until is exclusive).
+        last_days: shortcut for since=now - last_days.
+        """
+        self.flush()
+        where, params = self._where(field, crop, stage, image_hash, since, until, last_days)
+        columns = "*" if with_result else ", ".join(("id",) + _COLUMNS[:-1])
+        sql = f"SELECT {columns} FROM analyses{where} ORDER BY analyzed_at DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        records = [dict(row) for row in rows]
+        if with_result:
+            for record in records:
+                record["result"] = json.loads(record["result"])
+        return records
+
+    def count(self, field=None, crop=None, stage=None, image_hash=None, since=None, until=None, last_days=None):
+        self.flush()
+        where, params = self._where(field, crop, stage, image_hash, since, until, last_days)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM analyses{where}", params).fetchone()[0]
+
+    def stage_counts(self, field=None, crop=None, since=None, until=None, last_days=None):
+        """
+        {(crop, stage): count} over the matching rows.
+        """
+        self.flush()
+        where, params = self._where(field, crop, None, None, since, until, last_days)
+        sql = f"SELECT crop, stage, COUNT(*) FROM analyses{where} GROUP BY crop, stage"
+        with self._lock:
+            return {(c, s): n for c, s, n in self._conn.execute(sql, params)}
+
+    def latest_for_image(self, image_hash):
+        """
+        Most recent result stored for this image content, or None.
+        """
+        rows = self.query(image_hash=image_hash, limit=1)
+        return rows[0]["result"] if rows else None
+
+    def explain(self, **filters):
+        """
+        SQLite's plan for query(**filters) (to check index use).
+        """
+        where, params = self._where(
+            filters.get("field"), filters.get("crop"), filters.get("stage"), filters.get("image_hash"),
+            filters.get("since"), filters.get("until"), filters.get("last_days"),
+        )
+        sql = f"EXPLAIN QUERY PLAN SELECT * FROM analyses{where} ORDER BY analyzed_at DESC, id DESC"
+        with self._lock:
+            return [row[-1] for row in self._conn.execute(sql, params)]
+
+    # ---------------- lifecycle ----------------
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+# =====================================================
+# CLI
+# =====================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analysis history database")
+    parser.add_argument("db", help="SQLite file")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="store the per-image details of a field report")
+    imp.add_argument("report", help="field_analysis_results.json")
+    imp.add_argument("--field", required=True)
+
+    q = sub.add_parser("query", help="print matching rows as JSON lines")
+    q.add_argument("--field")
+    q.add_argument("--crop")
+    q.add_argument("--stage")
+    q.add_argument("--image-hash")
+    q.add_argument("--days", type=float, default=None, help="only the last N days")
+    q.add_argument("--limit", type=int, default=100)
+
+    args = parser.parse_args()
+
+    with ResultsDB(args.db) as db:
+        if args.command == "import":
+            with open(args.report, encoding="utf-8") as f:
+                report = json.load(f)
+            db.add_many(report["per_image_details"], field=args.field, analyzed_at=report.get("timestamp"))
+            print(f"{len(report['per_image_details'])} rows added to {args.db}")
+        else:
+            for row in db.query(
+                field=args.field, crop=args.crop, stage=args.stage, image_hash=args.image_hash,
+                last_days=args.days, limit=args.limit, with_result=False,
+            ):
+                print(json.dumps(row))
@@ -0,0 +1,435 @@
+# utils/server.py
+"""
+Local HTTP inference service (no Streamlit needed).
+
+    python -m utils.server --port 8000 --workers 2 --max-batch 16 --max-wait-ms 5
+
+POST /predict/stage       raw image bytes -> crop / stage / confidences
+POST /predict/harvest     raw image bytes, ?crop=&stage= (detected if missing)
+POST /predict/fertilizer  JSON {"crop", "stage", "N_mgkg", "P_mgkg", "K_mgkg"}
+POST /analyze             raw image bytes, ?N=&P=&K= -> same dict as the app
+GET  /health              status + batcher counters (JSON)
+GET  /metrics             Prometheus text (stage latencies + batcher counters)
+
+Images from concurrent requests are preprocessed on the request threads
+and collected into micro-batches: a batch goes to the model when it is
+full or when its oldest request has waited max_wait_ms.
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from modules.stage_detection import abhi_predict
+from modules.fertilizer_reco.fert_reco import recommend_fertilizer
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor, extract_visual_features
+from utils import logger
+from utils.pipeline import analyze_image
+from utils.preprocess import decode_image
+
+_STOP = object()
+
+
+class QueueFull(Exception):
+    pass
+
+
+# --------------------------------------------------
+# Micro-batching queue in front of MultiOutputModel
+# --------------------------------------------------
+class MicroBatcher:
+    """
+    predict(image) -> same dict as abhi_predict.predict_image, but the
+    model runs on batches of up to max_batch_size requests. `workers`
+    threads pull batches off the queue (torch releases the GIL during the
+    forward pass). Requests that time out are cancelled and skipped if
+    their batch has not started yet.
+    """
+
+    def __init__(self, max_batch_size=16, max_wait_ms=5.0, workers=1, max_queue=1024):
+        if max_batch_size < 1 or workers < 1:
+            raise ValueError("max_batch_size and workers must be >= 1")
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._counts = {"requests": 0, "batches": 0, "batched_images": 0,
+                        "timeouts": 0, "rejected": 0, "errors": 0}
+
+    def start(self):
+        if not self._threads:
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"agritrifusion-batcher-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def submit(self, tensor):
+        future = Future()
+        try:
+            self._queue.put_nowait((tensor, future))
+        except queue.Full:
+            self._count("rejected")
+            raise QueueFull("inference queue is full") from None
+        self._count("requests")
+        return future
+
+    def predict(self, image, timeout=None):
+        future = self.submit(abhi_predict.preprocess(image))
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            self._count("timeouts")
+            raise
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        counts["queue_depth"] = self._queue.qsize()
+        counts["mean_batch_size"] = (
+            round(counts["batched_images"] / counts["batches"], 3) if counts["batches"] else 0.0
+        )
+        return counts
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counts[key] += n
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # skip requests whose caller already gave up
+            batch = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = abhi_predict.predict_tensors([t for t, _ in batch])
+            except Exception as exc:
+                self._count("errors")
+                for _, f in batch:
+                    f.set_exception(exc)
+                continue
+            self._count("batches")
+            self._count("batched_images", len(batch))
+            for (_, f), result in zip(batch, results):
+                f.set_result(result)
+
+
+# --------------------------------------------------
+# HTTP layer
+# --------------------------------------------------
+class _HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _query_float(params, name):
+    try:
+        return float(params[name][0])
+    except KeyError:
+        raise _HTTPError(400, f"missing query parameter: {name}") from None
+    except ValueError:
+        raise _HTTPError(400, f"query parameter {name} must be a number") from None
+
+
+def _label(value, name, allowed):
+    # crop / stage names the models were trained on, case-insensitive
+    if not isinstance(value, str) or value.lower() not in allowed:
+        raise _HTTPError(400, f"{name} must be one of {', '.join(allowed)}, got {value!r}")
+    return value.lower()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "AgriTriFusion"
+    protocol_version = "HTTP/1.1"
+
+    # ---------------- routing ----------------
+
+    def do_GET(self):
+        routes = {"/health": self._health, "/metrics": self._metrics}
+        self._dispatch(routes)
+
+    def do_POST(self):
+        routes = {
+            "/predict/stage": self._stage,
+            "/predict/harvest": self._harvest,
+            "/predict/fertilizer": self._fertilizer,
+            "/analyze": self._analyze,
+        }
+        self._dispatch(routes)
+
+    def _dispatch(self, routes):
+        url = urlsplit(self.path)
+        handler = routes.get(url.path)
+        self._body_read = False
+        try:
+            if handler is None:
+                raise _HTTPError(404, f"unknown endpoint: {url.path}")
+            handler(parse_qs(url.query))
+        except _HTTPError as exc:
+            self._send_json(exc.status, {"error": str(exc)})
+        except QueueFull as exc:
+            self._send_json(503, {"error": str(exc)})
+        except FutureTimeout:
+            self._send_json(504, {"error": "request timed out"})
+        except (ValueError, OSError) as exc:  # bad image bytes / inputs
+            self._send_json(400, {"error": str(exc)})
+        except Exception as exc:
+            self._send_json(500, {"error": f"{type(exc).__name__}: {exc}"})
+
+    # ---------------- endpoints ----------------
+
+    def _stage(self, params):
+        pixels = decode_image(self._read_body())
+        self._send_json(200, self.service.classify(pixels))
+
+    def _harvest(self, params):
+        crop = params.get("crop", [None])[0]
+        stage = params.get("stage", [None])[0]
+        if crop is not None:
+            crop = _label(crop, "crop", abhi_predict.crops)
+        if stage is not None:
+            stage = _label(stage, "stage", abhi_predict.stages)
+        pixels = decode_image(self._read_body())
+        if crop is None or stage is None:
+            detected = self.service.classify(pixels)
+            crop, stage = crop or detected["crop"], stage or detected["stage"]
+        features = extract_visual_features(pixels)
+        result = self.service.predictor.predict_from_features([features], [crop], [stage])[0]
+        self._send_json(200, result)
+
+    def _fertilizer(self, params):
+        try:
+            body = json.loads(self._read_body())
+            kwargs = {key: body[key] for key in ("crop", "stage")}
+            kwargs.update({key: float(body[key]) for key in ("N_mgkg", "P_mgkg", "K_mgkg")})
+        except (ValueError, KeyError, TypeError) as exc:
+            raise _HTTPError(400, f"expected JSON with crop, stage, N_mgkg, P_mgkg, K_mgkg ({exc})") from None
+        kwargs["crop"] = _label(kwargs["crop"], "crop", abhi_predict.crops)
+        kwargs["stage"] = _label(kwargs["stage"], "stage", abhi_predict.stages)
+        self._send_json(200, recommend_fertilizer(**kwargs))
+
+    def _analyze(self, params):
+        N, P, K = (_query_float(params, name) for name in ("N", "P", "K"))
+        result = analyze_image(
+            self._read_body(), N, P, K,
+            predictor=self.service.predictor, classify=self.service.classify,
+        )
+        self._send_json(200, result)
+
+    def _health(self, params):
+        self._send_json(200, {"status": "ok", "batcher": self.service.batcher.stats()})
+
+    def _metrics(self, params):
+        lines = [logger.metrics.to_prometheus().rstrip("\n")]
+        for key, value in self.service.batcher.stats().items():
+            lines.append(f"agritrifusion_batcher_{key} {value}")
+        self._send_text(200, "\n".join(lines) + "\n", "text/plain; version=0.0.4")
+
+    # ---------------- helpers ----------------
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            raise _HTTPError(400, "invalid Content-Length") from None
+        if length <= 0:
+            raise _HTTPError(400, "empty request body")
+        if length > self.service.max_body_bytes:
+            raise _HTTPError(413, "request body too large")
+        self._body_read = True
+        return self.rfile.read(length)
+
+    def _discard_body(self, limit=64 * 1024 * 1024):
+        # Read (and drop) an unread request body before an error response,
+        # so the client sees the response instead of a connection reset;
+        # very large bodies just get cut off
+        if self._body_read:
+            return
+        self._body_read = True
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            return
+        if length > limit:
+            return
+        while length > 0:
+            chunk = self.rfile.read(min(length, 65536))
+            if not chunk:
+                break
+            length -= len(chunk)
+
+    def _send_json(self, status, payload):
+        self._send_text(status, json.dumps(payload), "application/json")
+
+    def _send_text(self, status, text, content_type):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if status >= 400:
+            self._discard_body()
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.service.verbose:
+            super().log_message(format, *args)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class InferenceService:
+    """
+    with InferenceService(port=0) as service: ... service.url ...
+    port=0 picks a free port. request_timeout bounds both socket reads
+    and the wait for a model batch (504 when exceeded).
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=8000,
+        workers=1,
+        max_batch_size=16,
+        max_wait_ms=5.0,
+        request_timeout=30.0,
+        max_body_mb=20,
+        rf_model_path=None,
+        verbose=False,
+    ):
+        self.request_timeout = request_timeout
+        self.max_body_bytes = int(max_body_mb * 1024 * 1024)
+        self.verbose = verbose
+        self.batcher = MicroBatcher(max_batch_size, max_wait_ms, workers)
+        self.predictor = HarvestPredictor(rf_model_path)
+
+        handler = type("Handler", (_Handler,), {"timeout": request_timeout})
+        self.httpd = _Server((host, port), handler)
+        self.httpd.service = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def classify(self, image):
+        return self.batcher.predict(image, timeout=self.request_timeout)
+
+    def start(self):
+        """
+        Serves from a background thread (tests / embedding).
+        """
+        self.batcher.start()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="agritrifusion-http", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.batcher.start()
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.httpd.server_close()
+        self.batcher.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+# =====================================================
+# CLI
+# =====================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AgriTriFusion local inference server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="model worker threads")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout (s)")
+    parser.add_argument("--max-body-mb", type=float, default=20)
+    parser.add_argument("--rf-model", default=None, help="optional harvest RandomForest model")
+    parser.add_argument("--no-warmup", action="store_true")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    logger.enable(True)
+    if not args.no_warmup:
+        abhi_predict.warmup()
+
+    service = InferenceService(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        max_batch_size=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        request_timeout=args.timeout,
+        max_body_mb=args.max_body_mb,
+        rf_model_path=args.rf_model,
+        verbose=not args.quiet,
+    )
+    print(f"Serving on {service.url}")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
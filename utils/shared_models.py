@@ -0,0 +1,270 @@
+# utils/shared_models.py
+"""
+Multi-process serving with one copy of the model weights.
+
+    python -m utils.shared_models photos/ --workers 4 --out results.jsonl
+
+The parent loads every model artifact once:
+  - MultiOutputModel: parameters / buffers are moved to shared memory
+    (torch share_memory_), workers receive handles to the same pages
+    instead of unpickling their own copy;
+  - fertilizer preprocessor + priority models: compiled to flat arrays
+    (tree_eval.CompiledScorer) and dumped to cache_dir with joblib, workers
+    load them with mmap_mode="r" so the node arrays are page cache shared
+    by every process.
+Workers never touch ripeness_model.pth or the joblib model files.
+
+The harvest RandomForest (optional, usually absent) is still loaded once
+per worker, by the pool initializer: sklearn copies its tree arrays when
+unpickling.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import multiprocessing
+import torch
+import torch.multiprocessing  # noqa: F401 (registers the shared tensor pickler)
+
+from modules.stage_detection import abhi_predict
+from modules.fertilizer_reco import fert_reco
+from modules.fertilizer_reco.tree_eval import CompiledScorer
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor
+
+SCORER_FILE = "fertilizer_scorer.joblib"
+
+
+# --------------------------------------------------
+# Parent side: load once, export
+# --------------------------------------------------
+class SharedModels:
+    """
+    Picklable handle passed to the workers: the shared-memory stage model,
+    the path of the memory-mappable fertilizer scorer and of the optional
+    harvest RandomForest.
+    """
+
+    def __init__(self, model, scorer_path, model_tag=None, rf_model_path=None):
+        self.model = model
+        self.scorer_path = scorer_path
+        self.model_tag = model_tag
+        self.rf_model_path = rf_model_path
+
+
+def export_shared_models(cache_dir, rf_model_path=None):
+    """
+    Loads the models in this process and returns a SharedModels handle.
+    cache_dir receives the fertilizer scorer file (a few MB).
+    """
+    model = abhi_predict.get_model()
+    model.share_memory()
+
+    fert_reco._load_models()
+    scorer = fert_reco._compiled
+    if scorer is None:
+        # USE_COMPILED_MODELS is off in the parent; compile anyway
+        scorer = CompiledScorer.from_fitted(
+            fert_reco._preprocessor,
+            [fert_reco._priority_models[key] for key in fert_reco.PRIORITY_MODEL_KEYS],
+        )
+
+    os.makedirs(cache_dir, exist_ok=True)
+    scorer_path = os.path.join(cache_dir, SCORER_FILE)
+    # Boosters stay behind: they are XGBoost C++ objects, not mappable arrays
+    # (large frames are walked with the array ensemble instead, same output)
+    joblib.dump(CompiledScorer(scorer.preprocessor, scorer.ensemble), scorer_path)
+    return SharedModels(model, scorer_path, abhi_predict.model_tag(), rf_model_path)
+
+
+# --------------------------------------------------
+# Worker side: attach read-only
+# --------------------------------------------------
+# HarvestPredictor of this worker, built once by attach_shared_models
+_predictor = None
+
+
+def attach_shared_models(shared, pid_queue=None):
+    """
+    Process pool initializer: installs the shared models in this process
+    and reports its pid on pid_queue.
+    """
+    global _predictor
+    torch.set_num_threads(1)
+    abhi_predict.use_model(shared.model, tag=shared.model_tag)
+    fert_reco.use_compiled_scorer(joblib.load(shared.scorer_path, mmap_mode="r"))
+    _predictor = HarvestPredictor(shared.rf_model_path)
+    if pid_queue is not None:
+        pid_queue.put(os.getpid())
+
+
+def _analyze(image, N, P, K):
+    from utils.pipeline import analyze_image
+    return analyze_image(image, N, P, K, predictor=_predictor, concurrent=False)
+
+
+# --------------------------------------------------
+# Memory reporting
+# --------------------------------------------------
+def memory_usage(pid=None):
+    """
+    Memory of one process in MB:
+      rss    resident set size
+      pss    proportional set size (shared pages divided among their users)
+      uss    unique set size (private pages, freed if the process exits)
+      shared resident pages also mapped by other processes
+    Read from /proc/<pid>/smaps_rollup (Linux). Elsewhere only the own
+    process' peak rss is available and the other fields are None.
+    """
+    path = f"/proc/{pid or os.getpid()}/smaps_rollup"
+    try:
+        with open(path, encoding="ascii") as f:
+            kb = {}
+            for line in f:
+                key, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    kb[key] = int(value.split()[0])
+    except OSError:
+        if pid not in (None, os.getpid()):
+            raise
+        try:
+            import resource  # Unix only
+        except ImportError:
+            rss = None
+        else:
+            # ru_maxrss is in kB on Linux
+            rss = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        return {"pid": os.getpid(), "rss_mb": rss, "pss_mb": None, "uss_mb": None, "shared_mb": None}
+
+    def mb(*keys):
+        return round(sum(kb.get(k, 0) for k in keys) / 1024, 1)
+
+    return {
+        "pid": pid or os.getpid(),
+        "rss_mb": mb("Rss"),
+        "pss_mb": mb("Pss"),
+        "uss_mb": mb("Private_Clean", "Private_Dirty"),
+        "shared_mb": mb("Shared_Clean", "Shared_Dirty"),
+    }
+
+
+# --------------------------------------------------
+# Worker pool
+# --------------------------------------------------
+class SharedModelPool:
+    """
+    ProcessPoolExecutor whose workers use the parent's models.
+
+    with SharedModelPool(workers=4) as pool:
+        results = list(pool.analyze(paths, N, P, K))
+        print(pool.memory_report())
+
+    mp_context: "spawn" (default, safe with torch's thread pools),
+    "forkserver" or "fork".
+    rf_model_path: optional harvest RandomForest, loaded once per worker.
+    """
+
+    def __init__(self, workers=None, mp_context="spawn", cache_dir=None, rf_model_path=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._tmp = None
+        if cache_dir is None:
+            self._tmp = tempfile.TemporaryDirectory(prefix="agritrifusion-models-")
+            cache_dir = self._tmp.name
+        self.shared = export_shared_models(cache_dir, rf_model_path)
+        context = multiprocessing.get_context(mp_context)
+        # workers report their pid from the initializer
+        self._pid_queue = context.SimpleQueue()
+        self._pids = set()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=attach_shared_models,
+            initargs=(self.shared, self._pid_queue),
+        )
+
+    def submit(self, fn, *args, **kwargs):
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def map(self, fn, *iterables, chunksize=1):
+        return self._executor.map(fn, *iterables, chunksize=chunksize)
+
+    def analyze(self, images, N, P, K, chunksize=1):
+        """
+        utils.pipeline.analyze_image for every image (path or bytes),
+        results in input order.
+        """
+        images = list(images)
+        n = len(images)
+        return self.map(_analyze, images, [N] * n, [P] * n, [K] * n, chunksize=chunksize)
+
+    def worker_pids(self):
+        # workers are started on demand by the executor
+        while not self._pid_queue.empty():
+            self._pids.add(self._pid_queue.get())
+        return sorted(self._pids)
+
+    def memory_report(self):
+        """
+        {"parent": memory_usage(), "workers": [memory_usage(pid), ...],
+         "workers_uss_mb": total unique memory of the workers}
+        """
+        workers = []
+        for pid in self.worker_pids():
+            try:
+                workers.append(memory_usage(pid))
+            except OSError:
+                pass  # exited in the meantime
+        uss = [w["uss_mb"] for w in workers if w["uss_mb"] is not None]
+        return {
+            "parent": memory_usage(),
+            "workers": workers,
+            "workers_uss_mb": round(sum(uss), 1),
+        }
+
+    def close(self):
+        self._executor.shutdown()
+        self._pid_queue.close()
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+# =====================================================
+# CLI
+# =====================================================
+if __name__ == "__main__":
+    from modules.field_analysis.field_analyzer import collect_images
+
+    parser = argparse.ArgumentParser(description="Analyze images with a shared-model worker pool")
+    parser.add_argument("source", help="image directory")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--context", choices=["spawn", "forkserver", "fork"], default="spawn")
+    parser.add_argument("--N", type=float, default=4.0)
+    parser.add_argument("--P", type=float, default=2.0)
+    parser.add_argument("--K", type=float, default=3.0)
+    parser.add_argument("--rf-model", default=None, help="harvest RandomForest (joblib)")
+    parser.add_argument("--out", default="shared_pool_results.jsonl")
+    args = parser.parse_args()
+
+    paths = collect_images(args.source)
+    with SharedModelPool(args.workers, args.context, rf_model_path=args.rf_model) as pool:
+        with open(args.out, "w", encoding="utf-8") as f:
+            for path, result in zip(paths, pool.analyze(paths, args.N, args.P, args.K)):
+                f.write(json.dumps({"source": path, **result}) + "\n")
+        report = pool.memory_report()
+
+    print(f"{len(paths)} results written to {args.out}")
+    print(f"parent: rss {report['parent']['rss_mb']} MB, uss {report['parent']['uss_mb']} MB")
+    for w in report["workers"]:
+        print(f"worker {w['pid']}: rss {w['rss_mb']} MB, uss {w['uss_mb']} MB, shared {w['shared_mb']} MB")
+    print(f"workers unique total: {report['workers_uss_mb']} MB")
@@ -0,0 +1,349 @@
+# utils/tensor_pack.py
+"""
+Memory-mapped archive of preprocessed images.
+
+    python -m utils.tensor_pack pack photos/ archive_dir --workers 8
+    python -m utils.tensor_pack analyze archive_dir --out results.jsonl
+
+pack decodes every image once and stores, per chunk of chunk_size images:
+  chunk_XXXXX_tensors.npy   (n, 3, 224, 224) normalized model input
+  chunk_XXXXX_features.npy  (n, 5) float64 extract_visual_features values
+plus index.json (source path -> chunk / row). While packing, each finished
+chunk appends one line to index.log; the log is folded into index.json
+when pack ends, and replayed on load if it was interrupted. Re-running
+pack on the same archive only adds images that are not in the index yet.
+
+Reading maps the .npy files copy-on-write, so model batches and feature
+matrices are views of the page cache: reprocessing the archive after a
+model update does no JPEG decoding or resizing at all.
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from modules.stage_detection import abhi_predict
+from modules.harvest_prediction.harvest_predictor import HarvestPredictor, extract_visual_features
+from utils.preprocess import decode_image
+
+FORMAT_VERSION = 1
+INDEX_FILE = "index.json"
+LOG_FILE = "index.log"
+FEATURE_NAMES = ("hue", "saturation", "brightness", "laplacian", "a_channel")
+TENSOR_SHAPE = (3, 224, 224)
+
+
+# --------------------------------------------------
+# Pack (offline)
+# --------------------------------------------------
+
+def _pack_one(path):
+    """
+    Decode once -> (model input tensor, feature vector), or the error text.
+    Runs inside a worker process.
+    """
+    try:
+        pixels = decode_image(path)
+        tensor = abhi_predict.preprocess(pixels).numpy()
+        features = extract_visual_features(pixels)
+    except Exception as e:
+        return None, str(e)
+    return tensor, np.array([features[name] for name in FEATURE_NAMES], dtype=np.float64)
+
+
+def _init_pack_worker():
+    torch.set_num_threads(1)
+
+
+def _chunk_paths(out_dir, chunk_id):
+    prefix = os.path.join(out_dir, f"chunk_{chunk_id:05d}")
+    return prefix + "_tensors.npy", prefix + "_features.npy"
+
+
+def _load_index(out_dir):
+    """
+    index.json plus the chunks recorded in index.log since it was written.
+    """
+    path = os.path.join(out_dir, INDEX_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported pack format version {index.get('version')}")
+
+    log_path = os.path.join(out_dir, LOG_FILE)
+    if os.path.isfile(log_path):
+        with open(log_path, "rb") as f:
+            lines = f.readlines()
+        for num, line in enumerate(lines, start=1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if num < len(lines):
+                    raise ValueError(f"{log_path}:{num}: corrupt record") from None
+                break  # torn write at the end, that chunk is packed again
+            index["chunks"].append(record["chunk"])
+            index["entries"].extend(record["entries"])
+            index["failed"].extend(record["failed"])
+        # a retried image replaces its old failure
+        packed = {entry["source"] for entry in index["entries"]}
+        latest = {f["source"]: f for f in index["failed"]}
+        index["failed"] = [f for f in latest.values() if f["source"] not in packed]
+    return index
+
+
+def _write_index(out_dir, index):
+    # folds index.log in: written atomically, then the log is dropped
+    path = os.path.join(out_dir, INDEX_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp, path)
+    log_path = os.path.join(out_dir, LOG_FILE)
+    if os.path.exists(log_path):
+        os.remove(log_path)
+
+
+def pack_archive(images, out_dir, chunk_size=256, dtype="float32", workers=None):
+    """
+    images: iterable of image paths. Writes / extends the archive in
+    out_dir and returns {"packed": n, "skipped": n, "failed": [...]}.
+    dtype: "float32" (exact) or "float16" (half the disk / page cache;
+    inputs are rounded to ~3 significant digits).
+    workers: decode processes (default: all cores, 1 = in-process).
+    Every finished chunk is appended to index.log, so an interrupted pack
+    can simply be re-run; index.json itself is written once at the end.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be >= 1")
+    os.makedirs(out_dir, exist_ok=True)
+
+    index = _load_index(out_dir)
+    if index is None:
+        index = {
+            "version": FORMAT_VERSION,
+            "dtype": np.dtype(dtype).name,
+            "tensor_shape": list(TENSOR_SHAPE),
+            "feature_names": list(FEATURE_NAMES),
+            "chunks": [],
+            "entries": [],
+            "failed": [],
+        }
+    elif np.dtype(dtype).name != index["dtype"]:
+        raise ValueError(f"archive is {index['dtype']}, cannot append {dtype}")
+    # start from a compacted index and an empty log (drops a torn last line)
+    _write_index(out_dir, index)
+
+    known = {entry["source"] for entry in index["entries"]}
+    todo, skipped = [], 0
+    for path in images:
+        source = os.path.abspath(path)
+        if source in known:
+            skipped += 1
+            continue
+        known.add(source)
+        todo.append(source)
+    # images that failed last time are retried
+    retry = set(todo)
+    index["failed"] = [f for f in index["failed"] if f["source"] not in retry]
+
+    workers = workers or os.cpu_count() or 1
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_pack_worker)
+
+    packed, failed = 0, []
+    log = open(os.path.join(out_dir, LOG_FILE), "a", encoding="utf-8")
+    try:
+        for start in range(0, len(todo), chunk_size):
+            sources = todo[start:start + chunk_size]
+            if pool is None:
+                results = map(_pack_one, sources)
+            else:
+                results = pool.map(_pack_one, sources, chunksize=max(1, len(sources) // (4 * workers)))
+
+            chunk_id = len(index["chunks"])
+            tensor_path, feature_path = _chunk_paths(out_dir, chunk_id)
+            tensors = np.lib.format.open_memmap(
+                tensor_path, mode="w+", dtype=index["dtype"], shape=(len(sources),) + TENSOR_SHAPE
+            )
+            features = np.lib.format.open_memmap(
+                feature_path, mode="w+", dtype=np.float64, shape=(len(sources), len(FEATURE_NAMES))
+            )
+
+            row, chunk_entries, chunk_failed = 0, [], []
+            for source, (tensor, values) in zip(sources, results):
+                if tensor is None:
+                    chunk_failed.append({"source": source, "error": values})
+                    continue
+                tensors[row] = tensor
+                features[row] = values
+                chunk_entries.append({"source": source, "chunk": chunk_id, "row": row})
+                row += 1
+
+            tensors.flush()
+            features.flush()
+            del tensors, features
+            # rows past `count` (failed images) are never read
+            chunk = {
+                "tensors": os.path.basename(tensor_path),
+                "features": os.path.basename(feature_path),
+                "count": row,
+            }
+            log.write(json.dumps({"chunk": chunk, "entries": chunk_entries, "failed": chunk_failed}) + "\n")
+            log.flush()
+            index["chunks"].append(chunk)
+            index["entries"].extend(chunk_entries)
+            index["failed"].extend(chunk_failed)
+            packed += row
+            failed.extend(chunk_failed)
+    finally:
+        log.close()
+        if pool is not None:
+            pool.shutdown()
+
+    _write_index(out_dir, index)
+
+    return {"packed": packed, "skipped": skipped, "failed": failed}
+
+
+# --------------------------------------------------
+# Read (zero-copy)
+# --------------------------------------------------
+
+class PackedArchive:
+    """
+    Read side of pack_archive. Chunks are opened lazily with
+    np.load(mmap_mode="c"); tensors are torch.from_numpy views of the map.
+    """
+
+    def __init__(self, path):
+        index = _load_index(path)
+        if index is None:
+            raise FileNotFoundError(f"No packed archive in {path}")
+        self.path = path
+        self.dtype = index["dtype"]
+        self.feature_names = tuple(index["feature_names"])
+        self._chunks = index["chunks"]
+        self._entries = index["entries"]
+        self.failed = index["failed"]
+        self._maps = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def sources(self):
+        return [entry["source"] for entry in self._entries]
+
+    def _chunk_arrays(self, chunk_id):
+        arrays = self._maps.get(chunk_id)
+        if arrays is None:
+            chunk = self._chunks[chunk_id]
+            count = chunk["count"]
+            tensors = np.load(os.path.join(self.path, chunk["tensors"]), mmap_mode="c")[:count]
+            features = np.load(os.path.join(self.path, chunk["features"]), mmap_mode="c")[:count]
+            arrays = self._maps[chunk_id] = (tensors, features)
+        return arrays
+
+    def tensor(self, i):
+        entry = self._entries[i]
+        return torch.from_numpy(self._chunk_arrays(entry["chunk"])[0][entry["row"]])
+
+    def features(self, i):
+        entry = self._entries[i]
+        values = self._chunk_arrays(entry["chunk"])[1][entry["row"]]
+        return dict(zip(self.feature_names, values.tolist()))
+
+    def iter_batches(self, batch_size=64):
+        """
+        Yields (sources, tensors (B, 3, 224, 224), features (B, 5)); both
+        arrays are views of the mapped chunk, batches never span chunks.
+        Entries are stored in chunk / row order, so sources line up.
+        """
+        offset = 0
+        for chunk_id, chunk in enumerate(self._chunks):
+            tensors, features = self._chunk_arrays(chunk_id)
+            for start in range(0, chunk["count"], batch_size):
+                stop = min(start + batch_size, chunk["count"])
+                sources = [e["source"] for e in self._entries[offset + start:offset + stop]]
+                yield sources, torch.from_numpy(tensors[start:stop]), features[start:stop]
+            offset += chunk["count"]
+
+    def close(self):
+        self._maps.clear()
+
+
+# --------------------------------------------------
+# Inference over a packed archive
+# --------------------------------------------------
+
+def predict_packed(archive, batch_size=64):
+    """
+    Yields (source, predict_image-style result) for every packed image.
+    """
+    for sources, tensors, _ in archive.iter_batches(batch_size):
+        yield from zip(sources, abhi_predict.predict_tensors(tensors))
+
+
+def analyze_packed(archive, predictor=None, batch_size=64):
+    """
+    Stage detection + harvest prediction for the whole archive.
+    Yields {"source", "stage_detection", "harvest"} per image.
+    """
+    predictor = predictor or HarvestPredictor()
+    names = archive.feature_names
+
+    for sources, tensors, features in archive.iter_batches(batch_size):
+        stage_results = abhi_predict.predict_tensors(tensors)
+        feature_dicts = [dict(zip(names, row)) for row in features.tolist()]
+        harvest = predictor.predict_from_features(
+            feature_dicts,
+            [r["crop"] for r in stage_results],
+            [r["stage"] for r in stage_results],
+        )
+        for source, stage_result, harvest_result in zip(sources, stage_results, harvest):
+            yield {"source": source, "stage_detection": stage_result, "harvest": harvest_result}
+
+
+# =====================================================
+# CLI
+# =====================================================
+if __name__ == "__main__":
+    from modules.field_analysis.field_analyzer import collect_images
+
+    parser = argparse.ArgumentParser(description="Pack / analyze preprocessed image archives")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("pack", help="decode images into a memory-mapped archive")
+    p.add_argument("source", help="image directory")
+    p.add_argument("archive")
+    p.add_argument("--chunk-size", type=int, default=256)
+    p.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    p.add_argument("--workers", type=int, default=None)
+
+    a = sub.add_parser("analyze", help="stage + harvest prediction from an archive")
+    a.add_argument("archive")
+    a.add_argument("--out", default="packed_results.jsonl")
+    a.add_argument("--batch-size", type=int, default=64)
+    a.add_argument("--rf-model", default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        summary = pack_archive(
+            collect_images(args.source), args.archive,
+            chunk_size=args.chunk_size, dtype=args.dtype, workers=args.workers,
+        )
+        print(f"packed {summary['packed']}, skipped {summary['skipped']}, failed {len(summary['failed'])}")
+    else:
+        archive = PackedArchive(args.archive)
+        with open(args.out, "w", encoding="utf-8") as f:
+            for record in analyze_packed(archive, HarvestPredictor(args.rf_model), args.batch_size):
+                f.write(json.dumps(record) + "\n")
+        print(f"{len(archive)} results written to {args.out}")